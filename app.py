@@ -1,10 +1,25 @@
 from flask import Flask, render_template, request, jsonify, send_file, Response
+from werkzeug.exceptions import RequestedRangeNotSatisfiable
 from datetime import datetime
+import base64
+import hashlib
+import mimetypes
 import os
 from camera_manager import CameraManager
+from camera_ingest import IngestManager
+from camera_supervisor import CameraSupervisor
+from capture_workers import CaptureWorkerPool
 from system_monitor import SystemMonitor
+from live_fmp4 import LiveFmp4Handler
+from motion_detector import MotionService
+from playback import PlaybackStitcher
 from recorder import VideoRecorder
-from logger import logger
+from retention import RetentionService
+from snapshots import SnapshotService
+from startup import StartupOrchestrator
+from thumbnails import ThumbnailService
+from logger import logger, configure_logger
+from metrics import metrics
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.urandom(24)
@@ -13,45 +28,249 @@ from stream_handler import StreamHandler
 
 # Initialize components
 camera_manager = CameraManager()
-system_monitor = SystemMonitor()
-video_recorder = VideoRecorder()
-stream_handler = StreamHandler()
+log_settings = camera_manager.get_log_settings()
+configure_logger(log_settings['format'], burst=log_settings['burst'], window=log_settings['window'])
+capture_settings = camera_manager.get_capture_settings()
+supervisor_settings = camera_manager.get_supervisor_settings()
+ingest_options = {
+    'retry_initial': supervisor_settings['retry_initial'],
+    'retry_max': supervisor_settings['retry_max'],
+    'read_timeout': supervisor_settings['read_timeout']
+}
+worker_pool = None
+if capture_settings['workers']:
+    # "auto" uses one worker process per CPU core
+    worker_pool = CaptureWorkerPool(
+        num_workers=None if capture_settings['workers'] == 'auto' else int(capture_settings['workers']),
+        slots=capture_settings['shared_memory_slots'],
+        ingest_options=ingest_options
+    )
+ingest_manager = IngestManager(worker_pool=worker_pool, ingest_options=ingest_options)
+recording_settings = camera_manager.get_settings()
+playback_settings = camera_manager.get_playback_settings()
+monitor_settings = camera_manager.get_monitor_settings()
+video_recorder = VideoRecorder(
+    ingest_manager=ingest_manager,
+    ffmpeg_path=recording_settings.get('ffmpeg_path', 'ffmpeg'),
+    segment_duration=recording_settings.get('segment_duration', 60),
+    write_queue_frames=recording_settings.get('write_queue_frames', 60),
+    fsync=recording_settings.get('fsync', 'segment'),
+    fsync_interval=recording_settings.get('fsync_interval', 5),
+    preallocate=recording_settings.get('preallocate', False)
+)
+system_monitor = SystemMonitor(
+    video_recorder.storage_dir,
+    interval=monitor_settings['interval'],
+    history_size=monitor_settings['history_size']
+)
+playback_stitcher = PlaybackStitcher(
+    video_recorder,
+    ffmpeg_path=recording_settings.get('ffmpeg_path', 'ffmpeg')
+)
+thumbnail_service = ThumbnailService(video_recorder)
+retention_service = RetentionService(
+    video_recorder,
+    camera_manager,
+    interval=recording_settings.get('retention_interval', 300),
+    min_free_percent=recording_settings.get('min_free_percent', 10),
+    max_deletes_per_second=recording_settings.get('max_deletes_per_second', 5)
+)
+camera_supervisor = CameraSupervisor(
+    ingest_manager,
+    video_recorder,
+    camera_manager,
+    stall_timeout=supervisor_settings['stall_timeout'],
+    retry_initial=supervisor_settings['retry_initial'],
+    retry_max=supervisor_settings['retry_max']
+)
+motion_service = MotionService(ingest_manager, video_recorder, camera_manager, supervisor=camera_supervisor)
+stream_settings = camera_manager.get_stream_settings()
+stream_handler = StreamHandler(
+    ingest_manager=ingest_manager,
+    idle_timeout=stream_settings['idle_timeout'],
+    profiles=stream_settings['profiles']
+)
+live_handler = LiveFmp4Handler(
+    ffmpeg_path=recording_settings.get('ffmpeg_path', 'ffmpeg'),
+    fragment_duration=stream_settings['fragment_duration'],
+    idle_timeout=stream_settings['idle_timeout']
+)
+snapshot_settings = camera_manager.get_snapshot_settings()
+snapshot_service = SnapshotService(
+    ingest_manager,
+    camera_manager,
+    quality=snapshot_settings['quality'],
+    idle_timeout=snapshot_settings['idle_timeout'],
+    wait_timeout=snapshot_settings['wait_timeout']
+)
+
+# Camera settings the capture, recording and motion pipelines are built from
+PIPELINE_FIELDS = ('rtsp_url', 'substream_url', 'enabled', 'recording_mode', 'motion')
+
+def stop_camera_pipelines(camera_id):
+    """Stop everything that reads a camera: motion analysis, recording and live streams"""
+    motion_service.stop_camera(camera_id)
+    if camera_supervisor.wants_recording(camera_id) or video_recorder.active_recordings.get(camera_id):
+        # The camera's "recording" flag stays as it is and decides whether it records again
+        camera_supervisor.stop_recording(camera_id, persist=False)
+    # Viewers reconnect and get a stream built from the new settings
+    stream_handler.stop_stream(camera_id)
+    live_handler.stop_stream(camera_id)
+    live_handler.stop_stream(f"{camera_id}-sub")
+
+def start_camera_pipelines(camera):
+    """Start motion analysis and, if its "recording" flag is set, the recording of a camera"""
+    if not camera.get('enabled', True):
+        return
+    if camera_manager.get_motion_settings(camera)['enabled']:
+        motion_service.start_camera(camera)
+    if camera.get('recording'):
+        camera_supervisor.start_recording(camera['id'])
+
+def apply_camera_changes(added, changed, removed):
+    """Start, stop or restart the pipelines of the cameras that changed and leave the others alone"""
+    for camera in removed:
+        stop_camera_pipelines(camera['id'])
+        logger.info(f"Stopped pipelines of removed camera {camera['id']}")
+    for previous, camera in changed:
+        # A new name does not need a new connection
+        if all(previous.get(field) == camera.get(field) for field in PIPELINE_FIELDS):
+            if previous.get('recording') != camera.get('recording'):
+                if camera.get('recording') and camera.get('enabled', True):
+                    camera_supervisor.start_recording(camera['id'])
+                else:
+                    camera_supervisor.stop_recording(camera['id'])
+            continue
+        stop_camera_pipelines(camera['id'])
+        start_camera_pipelines(camera)
+        logger.info(f"Restarted pipelines of camera {camera['id']}")
+    for camera in added:
+        start_camera_pipelines(camera)
+
+camera_manager.add_listener(apply_camera_changes)
+
+# Connects the enabled cameras and resumes their recordings without waiting for a viewer
+startup_settings = camera_manager.get_startup_settings()
+startup_orchestrator = StartupOrchestrator(
+    camera_manager,
+    ingest_manager,
+    camera_supervisor,
+    motion_service,
+    max_parallel=startup_settings['max_parallel'],
+    connect_timeout=startup_settings['connect_timeout'],
+    warm_ingests=startup_settings['warm_ingests']
+)
+
+_services_started = False
+
+def start_services():
+    """Start the background services and bring the cameras up.
+
+    Called by the process that serves requests (python app.py or the ASGI
+    server), never on import, so importing the app does not open cameras.
+    """
+    global _services_started
+    if _services_started:
+        return
+    _services_started = True
+    if worker_pool is not None:
+        worker_pool.start()
+    system_monitor.start()
+    thumbnail_service.start()
+    retention_service.start()
+    camera_supervisor.start()
+    live_handler.start()
+    snapshot_service.start()
+    camera_manager.watch()
+    startup_orchestrator.start()
 
 @app.route('/')
 @app.route('/dashboard')
 def dashboard():
     """Render dashboard with camera streams"""
     cameras = camera_manager.list_cameras()
-    # Start streams for all cameras
-    for camera in cameras:
-        stream_handler.start_stream(camera['id'], camera['rtsp_url'])
-    return render_template('dashboard.html', cameras=cameras)
+    # Streams are started on demand by the /stream endpoint
+    return render_template(
+        'dashboard.html',
+        cameras=cameras,
+        grid_profile=stream_settings['grid_profile'],
+        focus_profile=stream_settings['default_profile'],
+        live_mode=stream_settings['live_mode']
+    )
+
+def start_live_stream(camera_id, profile=None):
+    """Start a camera's live stream; return (profile, None) or (None, (message, status))"""
+    camera = camera_manager.get_camera(camera_id)
+    if not camera:
+        return None, ("Camera not found", 404)
+
+    # ?profile=preview etc. selects a size/quality profile from stream_settings
+    profile = profile or stream_settings['default_profile']
+    if profile not in stream_settings['profiles']:
+        return None, ("Unknown stream profile", 400)
+
+    stream_handler.start_stream(camera_id, camera['rtsp_url'], profile=profile,
+                                substream_url=camera.get('substream_url'))
+    return profile, None
 
 @app.route('/stream/<int:camera_id>')
 def stream(camera_id):
     """Stream endpoint that converts RTSP to MJPEG"""
-    cameras = camera_manager.list_cameras()
-    camera = next((c for c in cameras if c['id'] == camera_id), None)
-    
-    if not camera:
-        return "Camera not found", 404
-        
+    profile, error = start_live_stream(camera_id, request.args.get('profile'))
+    if error:
+        return error
     return Response(
-        stream_handler.generate_mjpeg(camera_id),
+        stream_handler.generate_mjpeg(camera_id, profile),
         mimetype='multipart/x-mixed-replace; boundary=frame'
     )
 
+def start_live_fmp4(camera_id, source=None):
+    """Start a camera's live fMP4 stream; return (stream, None) or (None, (message, status))"""
+    camera = camera_manager.get_camera(camera_id)
+    if not camera:
+        return None, ("Camera not found", 404)
+    if not live_handler.available():
+        return None, ("ffmpeg is not available", 503)
+
+    # ?source=sub uses the camera's substream when it has one
+    if source == 'sub' and camera.get('substream_url'):
+        key, url = f"{camera_id}-sub", camera['substream_url']
+    else:
+        key, url = camera_id, camera['rtsp_url']
+
+    stream = live_handler.start_stream(key, url)
+    if stream is None:
+        return None, ("Live stream not available", 503)
+    return stream, None
+
+@app.route('/live/<int:camera_id>.mp4')
+def live_fmp4(camera_id):
+    """Live view as fragmented MP4 repackaged from the camera's own H.264/H.265 stream"""
+    stream, error = start_live_fmp4(camera_id, request.args.get('source'))
+    if error:
+        return error
+    response = Response(stream.generate(), mimetype='video/mp4')
+    # MSE players need the codec before they can create a SourceBuffer
+    response.headers['X-Codec'] = stream.codec or ''
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
 @app.route('/playback')
 def playback():
     """Render playback page"""
     cameras = camera_manager.list_cameras()
     date_str = request.args.get('date', datetime.now().strftime('%Y-%m-%d'))
+    camera_str = request.args.get('camera', '')
     try:
         selected_date = datetime.strptime(date_str, '%Y-%m-%d').date()
-        recordings = video_recorder.get_recordings(date=selected_date)
+        recordings = video_recorder.get_recordings(
+            camera_id=int(camera_str) if camera_str else None,
+            date=selected_date
+        )
     except ValueError:
         recordings = []
-    return render_template('playback.html', cameras=cameras, recordings=recordings, selected_date=date_str)
+    return render_template('playback.html', cameras=cameras, recordings=recordings,
+                           selected_date=date_str, selected_camera=camera_str)
 
 @app.route('/settings')
 def settings():
@@ -89,17 +308,107 @@ def add_camera():
         logger.error(f"Error adding camera: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/cameras/<int:camera_id>', methods=['PUT'])
+def update_camera(camera_id):
+    """API endpoint to change a camera; only its own pipelines are restarted"""
+    try:
+        data = request.get_json()
+        if not isinstance(data, dict) or not data:
+            return jsonify({"error": "Missing camera fields"}), 400
+        if 'rtsp_url' in data and not data['rtsp_url']:
+            return jsonify({"error": "rtsp_url cannot be empty"}), 400
+
+        camera = camera_manager.update_camera(camera_id, data)
+        if camera is None:
+            return jsonify({"error": "Camera not found"}), 404
+        return jsonify({"message": "Camera updated successfully", "camera": camera}), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error updating camera: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
 @app.route('/api/cameras/<int:camera_id>', methods=['DELETE'])
 def delete_camera(camera_id):
     """API endpoint to delete a camera"""
     try:
-        video_recorder.stop_recording(camera_id)  # Stop recording if active
-        camera_manager.delete_camera(camera_id)
+        # Its recording, motion analysis and live streams are stopped by apply_camera_changes()
+        if not camera_manager.delete_camera(camera_id):
+            return jsonify({"error": "Camera not found"}), 404
         return jsonify({"message": "Camera deleted successfully"}), 200
     except Exception as e:
         logger.error(f"Error deleting camera: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+def _snapshot_etag(camera_id, seq, timestamp):
+    # The sequence restarts with the camera's connection, the timestamp does not
+    return f"{camera_id}-{seq}-{int(timestamp * 1000)}-{request.args.get('width', '')}-{request.args.get('quality', '')}"
+
+@app.route('/api/cameras/<int:camera_id>/snapshot')
+def camera_snapshot(camera_id):
+    """Latest frame of a camera as a JPEG, with ?width= and ?quality= and conditional GET support"""
+    try:
+        camera = camera_manager.get_camera(camera_id)
+        if not camera:
+            return jsonify({"error": "Camera not found"}), 404
+
+        snapshot = snapshot_service.get(camera, request.args.get('width', type=int),
+                                        request.args.get('quality', type=int))
+        if snapshot is None:
+            return jsonify({"error": "No frame available"}), 503
+        jpeg, seq, timestamp = snapshot
+        response = Response(jpeg, mimetype='image/jpeg')
+        response.set_etag(_snapshot_etag(camera_id, seq, timestamp))
+        response.last_modified = datetime.fromtimestamp(timestamp)
+        response.headers['X-Frame-Timestamp'] = f"{timestamp:.3f}"
+        response.headers['X-Frame-Sequence'] = str(seq)
+        response.cache_control.no_cache = True
+        return response.make_conditional(request)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error serving snapshot: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/snapshots')
+def batch_snapshots():
+    """Latest frames of several cameras (?ids=1,2,3, default all enabled) as base64 JPEGs in one JSON response"""
+    try:
+        ids = request.args.get('ids')
+        if ids:
+            cameras = [camera_manager.get_camera(int(camera_id)) for camera_id in ids.split(',') if camera_id.strip()]
+            if None in cameras:
+                return jsonify({"error": "Camera not found"}), 404
+        else:
+            cameras = [camera for camera in camera_manager.list_cameras() if camera.get('enabled', True)]
+
+        results = snapshot_service.get_many(cameras, request.args.get('width', type=int),
+                                            request.args.get('quality', type=int))
+        snapshots = {}
+        etags = []
+        for camera_id, snapshot in results.items():
+            if snapshot is None:
+                snapshots[camera_id] = {'error': 'No frame available'}
+                continue
+            jpeg, seq, timestamp = snapshot
+            etags.append(_snapshot_etag(camera_id, seq, timestamp))
+            snapshots[camera_id] = {
+                'timestamp': timestamp,
+                'sequence': seq,
+                'content_type': 'image/jpeg',
+                'image': base64.b64encode(jpeg).decode()
+            }
+
+        response = jsonify({"snapshots": snapshots})
+        response.set_etag(hashlib.sha1(' '.join(etags).encode()).hexdigest())
+        response.cache_control.no_cache = True
+        return response.make_conditional(request)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error serving snapshots: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
 @app.route('/api/settings', methods=['POST'])
 def update_settings():
     """API endpoint to update recording settings"""
@@ -109,6 +418,7 @@ def update_settings():
         retention_days = int(data.get('retention_days', 7))
         
         camera_manager.update_settings(storage_dir, retention_days)
+        retention_service.trigger()
         return jsonify({"message": "Settings updated successfully"}), 200
     except Exception as e:
         logger.error(f"Error updating settings: {str(e)}")
@@ -118,12 +428,11 @@ def update_settings():
 def start_recording(camera_id):
     """API endpoint to start recording a camera"""
     try:
-        cameras = camera_manager.list_cameras()
-        camera = next((c for c in cameras if c['id'] == camera_id), None)
-        if not camera:
+        if not camera_manager.get_camera(camera_id):
             return jsonify({"error": "Camera not found"}), 404
-        
-        if video_recorder.start_recording(camera_id, camera['rtsp_url']):
+
+        # The supervisor keeps the recording going through camera outages until it is stopped
+        if camera_supervisor.start_recording(camera_id):
             return jsonify({"message": "Recording started"}), 200
         return jsonify({"error": "Failed to start recording"}), 500
     except Exception as e:
@@ -134,7 +443,7 @@ def start_recording(camera_id):
 def stop_recording(camera_id):
     """API endpoint to stop recording a camera"""
     try:
-        if video_recorder.stop_recording(camera_id):
+        if camera_supervisor.stop_recording(camera_id):
             return jsonify({"message": "Recording stopped"}), 200
         return jsonify({"error": "Failed to stop recording"}), 500
     except Exception as e:
@@ -147,37 +456,254 @@ def list_recordings():
     try:
         camera_id = request.args.get('camera_id')
         date_str = request.args.get('date')
-        
+        start_str = request.args.get('start')
+        end_str = request.args.get('end')
+        limit = request.args.get('limit')
+        offset = int(request.args.get('offset', 0))
+
         date = None
         if date_str:
             date = datetime.strptime(date_str, '%Y-%m-%d').date()
-        
+
+        # start/end accept ISO 8601 timestamps, e.g. 2024-01-31T14:02:00
+        start_time = datetime.fromisoformat(start_str).timestamp() if start_str else None
+        end_time = datetime.fromisoformat(end_str).timestamp() if end_str else None
+        camera_id = int(camera_id) if camera_id else None
+
         recordings = video_recorder.get_recordings(
-            camera_id=int(camera_id) if camera_id else None,
-            date=date
+            camera_id=camera_id,
+            date=date,
+            start_time=start_time,
+            end_time=end_time,
+            limit=int(limit) if limit else None,
+            offset=offset
+        )
+        total = video_recorder.count_recordings(
+            camera_id=camera_id,
+            date=date,
+            start_time=start_time,
+            end_time=end_time
         )
-        return jsonify({"recordings": recordings})
+        return jsonify({"recordings": recordings, "total": total, "offset": offset})
+    except ValueError as e:
+        # A malformed date, start/end, camera_id, limit or offset
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         logger.error(f"Error listing recordings: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/recordings/<path:filename>')
 def serve_recording(filename):
-    """Serve a recorded video file"""
+    """Serve a recorded video file with byte-range and conditional GET support"""
     try:
-        return send_file(
-            os.path.join(video_recorder.storage_dir, filename),
-            mimetype='video/mp4'
+        # Only files known to the catalog are served; this also rejects path traversal
+        filename = os.path.basename(filename)
+        if video_recorder.catalog.get(filename) is None:
+            return jsonify({"error": "Recording not found"}), 404
+
+        accel_prefix = playback_settings.get('x_accel_redirect')
+        if accel_prefix:
+            # Let a fronting nginx serve the bytes with sendfile and its own range handling
+            response = Response(mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+            response.headers['X-Accel-Redirect'] = accel_prefix.rstrip('/') + '/' + filename
+            return response
+
+        # Segments are immutable once closed, so the ETag and Last-Modified never change
+        response = send_file(
+            os.path.join(os.path.abspath(video_recorder.storage_dir), filename),
+            mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream',
+            conditional=True,
+            etag=True,
+            max_age=playback_settings['cache_max_age']
         )
+        response.headers['Accept-Ranges'] = 'bytes'
+        return response
+    except RequestedRangeNotSatisfiable:
+        # Answered by werkzeug with 416 and the file size in Content-Range
+        raise
     except Exception as e:
         logger.error(f"Error serving recording: {str(e)}")
         return jsonify({"error": "Recording not found"}), 404
 
+@app.route('/api/motion/events')
+def list_motion_events():
+    """API endpoint to search motion events"""
+    try:
+        start_str = request.args.get('start')
+        end_str = request.args.get('end')
+        limit = request.args.get('limit', 100, type=int)
+        offset = request.args.get('offset', 0, type=int)
+
+        # start/end accept ISO 8601 timestamps, e.g. 2024-01-31T14:02:00
+        events = video_recorder.catalog.query_motion_events(
+            camera_id=request.args.get('camera_id', type=int),
+            start_time=datetime.fromisoformat(start_str).timestamp() if start_str else None,
+            end_time=datetime.fromisoformat(end_str).timestamp() if end_str else None,
+            min_score=request.args.get('min_score', type=float),
+            limit=limit,
+            offset=offset
+        )
+        return jsonify({"events": events, "offset": offset})
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error listing motion events: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/motion/status')
+def motion_status():
+    """API endpoint with the current motion state of each analysed camera"""
+    return jsonify(motion_service.get_status())
+
+def _thumbnail_segments():
+    """Segments selected by the camera_id and date query parameters, oldest first"""
+    camera_id = request.args.get('camera_id', type=int)
+    date = datetime.strptime(request.args.get('date', datetime.now().strftime('%Y-%m-%d')), '%Y-%m-%d').date()
+    day_start = datetime.combine(date, datetime.min.time()).timestamp()
+    return video_recorder.catalog.query(camera_id, day_start, day_start + 86400)
+
+@app.route('/api/thumbnails')
+def list_thumbnails():
+    """API endpoint describing the thumbnail strips and timeline sprite for a camera and day"""
+    try:
+        segments = _thumbnail_segments()
+        thumbnails = video_recorder.catalog.get_thumbnails(s['filename'] for s in segments)
+        # Tiles are listed in sprite order, leaving out strips the sprite could not include
+        _, _, filenames = thumbnail_service.timeline(segments)
+        start_times = {segment['filename']: segment['start_time'] for segment in segments}
+        tiles = [{
+            'filename': filename,
+            'start_time': start_times[filename],
+            'strip_url': f"/api/thumbnails/{filename}",
+            **thumbnails[filename]
+        } for filename in filenames]
+        return jsonify({
+            'timeline_url': '/api/thumbnails/timeline?' + request.query_string.decode(),
+            'columns': thumbnail_service.timeline_columns,
+            'tiles': tiles
+        })
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error listing thumbnails: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/thumbnails/timeline')
+def thumbnail_timeline():
+    """Sprite sheet with one preview per segment for a camera and day"""
+    try:
+        etag, data, _ = thumbnail_service.timeline(_thumbnail_segments())
+        if data is None:
+            return jsonify({"error": "No thumbnails available"}), 404
+        response = Response(data, mimetype='image/jpeg')
+        response.set_etag(etag)
+        response.cache_control.no_cache = True
+        return response.make_conditional(request)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error building thumbnail timeline: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/thumbnails/<filename>')
+def serve_thumbnails(filename):
+    """Serve the keyframe thumbnail strip of a recording"""
+    filename = os.path.basename(filename)
+    path = thumbnail_service.strip_path(filename)
+    if video_recorder.catalog.get(filename) is None or not os.path.exists(path):
+        return jsonify({"error": "Thumbnails not found"}), 404
+    return send_file(os.path.abspath(path), mimetype='image/jpeg', conditional=True, etag=True,
+                     max_age=playback_settings['cache_max_age'])
+
+@app.route('/api/playback/<int:camera_id>')
+def playback_range(camera_id):
+    """Stream a camera's recordings between start and end as one continuous MP4"""
+    try:
+        start_str = request.args.get('start')
+        end_str = request.args.get('end')
+        if not start_str or not end_str:
+            return jsonify({"error": "Missing start or end"}), 400
+
+        # start/end accept ISO 8601 timestamps, e.g. 2024-01-31T14:02:00
+        start_time = datetime.fromisoformat(start_str).timestamp()
+        end_time = datetime.fromisoformat(end_str).timestamp()
+        if end_time <= start_time:
+            return jsonify({"error": "end must be after start"}), 400
+
+        segments = playback_stitcher.find_segments(camera_id, start_time, end_time)
+        if not segments:
+            return jsonify({"error": "No recordings in the requested range"}), 404
+
+        if request.args.get('format') == 'json':
+            return jsonify({"segments": [{
+                'filename': segment['filename'],
+                'start_time': segment['start_time'],
+                'end_time': segment['end_time'],
+                'inpoint': segment['inpoint'],
+                'outpoint': segment['outpoint']
+            } for segment in segments]})
+
+        if not playback_stitcher.available():
+            return jsonify({"error": "ffmpeg is required for range playback"}), 503
+
+        return Response(playback_stitcher.stream(segments), mimetype='video/mp4')
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error streaming playback range: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/health/workers')
+def get_worker_status():
+    """API endpoint with the state of the capture worker processes"""
+    return jsonify({"workers": worker_pool.get_status() if worker_pool else []})
+
+@app.route('/api/health/cameras')
+def get_camera_status():
+    """API endpoint with the connection and recording state of every camera"""
+    return jsonify({"cameras": camera_supervisor.get_status()})
+
+@app.route('/api/health/ready')
+def readiness():
+    """Readiness probe: 200 once every enabled camera has been brought up after a start"""
+    status = startup_orchestrator.get_status()
+    return jsonify(status), 200 if status['ready'] else 503
+
+@app.route('/api/health/live')
+def liveness():
+    """Liveness probe: 503 if one of the background threads has died"""
+    threads = {
+        'camera_supervisor': camera_supervisor.thread,
+        'retention': retention_service.thread,
+        'thumbnails': thumbnail_service.thread,
+        'system_monitor': system_monitor.thread,
+        'live_fmp4': live_handler.thread,
+        'snapshots': snapshot_service.thread,
+        'config_watcher': camera_manager.watch_thread
+    }
+    if worker_pool is not None:
+        threads['capture_workers'] = worker_pool.supervisor
+    dead = sorted(name for name, thread in threads.items() if thread is None or not thread.is_alive())
+    return jsonify({"alive": not dead, "dead_threads": dead}), 503 if dead else 200
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Pipeline metrics in the Prometheus text format"""
+    return Response(metrics.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/metrics')
+def get_pipeline_metrics():
+    """API endpoint with the pipeline metrics as JSON"""
+    return jsonify(metrics.to_json())
+
 @app.route('/api/health/metrics')
 def get_health_metrics():
-    """API endpoint to get system health metrics"""
+    """API endpoint to get system health metrics, with ?history=<seconds> of samples for charts"""
     try:
         metrics = system_monitor.get_all_metrics()
+        history = request.args.get('history', type=int)
+        if history:
+            metrics['history'] = system_monitor.get_history(history)
         return jsonify(metrics)
     except Exception as e:
         logger.error(f"Error getting health metrics: {str(e)}")
@@ -188,5 +714,6 @@ if __name__ == '__main__':
     os.makedirs('logs', exist_ok=True)
     os.makedirs('recordings', exist_ok=True)
     
-    # Start the application
-    app.run(host='0.0.0.0', port=8000, debug=True)
\ No newline at end of file
+    # Start the application; the reloader would run a second NVR on the same cameras and storage
+    start_services()
+    app.run(host='0.0.0.0', port=8000, debug=True, use_reloader=False)
\ No newline at end of file
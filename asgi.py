@@ -0,0 +1,200 @@
+"""ASGI entry point for serving many long-lived connections from one process.
+
+Run with any ASGI server, e.g.:
+
+    uvicorn asgi:application --host 0.0.0.0 --port 8000
+
+Live MJPEG and fMP4 streams are served natively on the event loop, so an
+open viewer costs a coroutine instead of a thread, and a viewer that goes
+away is noticed right away instead of at its next chunk. Every other request is dispatched to
+the same Flask routes in a worker thread, and the response body (recording
+files, stitched playback) is pulled from them a block at a time, so no thread
+stays pinned while a slow client downloads. Capture, recording and encoding
+keep running on their own threads or worker processes.
+"""
+import asyncio
+import re
+from urllib.parse import parse_qs
+from werkzeug.test import EnvironBuilder
+from app import app as flask_app, start_live_fmp4, start_live_stream, start_services, stream_handler
+from logger import logger
+
+STREAM_PATH = re.compile(r'^/stream/(\d+)$')
+LIVE_PATH = re.compile(r'^/live/(\d+)\.mp4$')
+
+class AsyncStreamingApp:
+    """ASGI application wrapping the Flask app"""
+
+    def __init__(self, flask_app, stream_handler, block_size=256 * 1024):
+        self.flask_app = flask_app
+        self.stream_handler = stream_handler
+        self.block_size = block_size
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+
+        if scope['method'] == 'GET':
+            match = STREAM_PATH.match(scope['path'])
+            if match:
+                await self._stream(scope, receive, send, int(match.group(1)))
+                return
+            match = LIVE_PATH.match(scope['path'])
+            if match:
+                await self._live_fmp4(scope, receive, send, int(match.group(1)))
+                return
+        await self._dispatch(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await asyncio.to_thread(start_services)
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    @staticmethod
+    async def _send_text(send, status, text):
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': [(b'content-type', b'text/plain; charset=utf-8')]})
+        await send({'type': 'http.response.body', 'body': text.encode()})
+
+    @staticmethod
+    async def _wait_disconnect(receive):
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+
+    async def _stream(self, scope, receive, send, camera_id):
+        """Serve /stream/<id> from the broadcaster without holding a thread"""
+        query = parse_qs(scope['query_string'].decode('latin1'))
+        profile, error = await asyncio.to_thread(start_live_stream, camera_id, query.get('profile', [None])[0])
+        if error:
+            await self._send_text(send, error[1], error[0])
+            return
+
+        await send({'type': 'http.response.start', 'status': 200,
+                    'headers': [(b'content-type', b'multipart/x-mixed-replace; boundary=frame'),
+                                (b'cache-control', b'no-cache')]})
+        await self._send_chunks(receive, send, self.stream_handler.generate_mjpeg_async(camera_id, profile))
+
+    async def _live_fmp4(self, scope, receive, send, camera_id):
+        """Serve /live/<id>.mp4 from the stream's broadcaster without holding a thread"""
+        query = parse_qs(scope['query_string'].decode('latin1'))
+        stream, error = await asyncio.to_thread(start_live_fmp4, camera_id, query.get('source', [None])[0])
+        if error:
+            await self._send_text(send, error[1], error[0])
+            return
+
+        # MSE players need the codec before they can create a SourceBuffer
+        await send({'type': 'http.response.start', 'status': 200,
+                    'headers': [(b'content-type', b'video/mp4'),
+                                (b'x-codec', (stream.codec or '').encode('latin1')),
+                                (b'cache-control', b'no-cache')]})
+        await self._send_chunks(receive, send, stream.generate_async())
+
+    async def _send_chunks(self, receive, send, chunks):
+        """Send an async generator's chunks until it ends or the client disconnects.
+
+        Every chunk is raced against http.disconnect, so a closed tab ends
+        the generator (and drops its viewer) even while no chunk is coming.
+        """
+        disconnected = asyncio.ensure_future(self._wait_disconnect(receive))
+        try:
+            while True:
+                next_chunk = asyncio.ensure_future(chunks.__anext__())
+                await asyncio.wait((next_chunk, disconnected), return_when=asyncio.FIRST_COMPLETED)
+                if disconnected.done():
+                    next_chunk.cancel()
+                    await asyncio.gather(next_chunk, return_exceptions=True)
+                    return
+                try:
+                    chunk = next_chunk.result()
+                except StopAsyncIteration:
+                    break
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            await chunks.aclose()
+            disconnected.cancel()
+
+    def _build_environ(self, scope, body):
+        headers = [(name.decode('latin1'), value.decode('latin1')) for name, value in scope['headers']]
+        host = next((value for name, value in headers if name.lower() == 'host'), 'localhost')
+        builder = EnvironBuilder(
+            path=scope['path'],
+            base_url=f"{scope.get('scheme', 'http')}://{host}{scope.get('root_path', '')}",
+            query_string=scope['query_string'].decode('latin1'),
+            method=scope['method'],
+            headers=headers,
+            data=body
+        )
+        try:
+            environ = builder.get_environ()
+        finally:
+            builder.close()
+        if scope.get('client'):
+            environ['REMOTE_ADDR'] = scope['client'][0]
+        environ['SERVER_PROTOCOL'] = f"HTTP/{scope.get('http_version', '1.1')}"
+        return environ
+
+    def _call_flask(self, environ):
+        """Run a Flask route and return (status, headers, body iterator) without reading the body"""
+        with self.flask_app.request_context(environ):
+            response = self.flask_app.full_dispatch_request()
+            app_iter, status, headers = response.get_wsgi_response(environ)
+        return int(status.split(' ', 1)[0]), headers, app_iter, response.direct_passthrough
+
+    def _next_block(self, iterator, block_size):
+        """Collect body chunks up to block_size; return b'' at the end"""
+        parts, size = [], 0
+        for chunk in iterator:
+            if chunk:
+                parts.append(chunk)
+                size += len(chunk)
+            if size >= block_size:
+                break
+        return b''.join(parts)
+
+    async def _dispatch(self, scope, receive, send):
+        """Serve any other request through the Flask routes"""
+        body = b''
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+            body += message.get('body', b'')
+            if not message.get('more_body'):
+                break
+
+        environ = self._build_environ(scope, body)
+        status, headers, app_iter, is_file = await asyncio.to_thread(self._call_flask, environ)
+        iterator = iter(app_iter)
+        # Files are read in large blocks; generated bodies (stitched playback) go out chunk by chunk
+        block_size = self.block_size if is_file else 1
+        disconnected = asyncio.ensure_future(self._wait_disconnect(receive))
+        try:
+            await send({'type': 'http.response.start', 'status': status,
+                        'headers': [(name.lower().encode('latin1'), value.encode('latin1'))
+                                    for name, value in headers]})
+            # A client that went away stops the body at the next block
+            while not disconnected.done():
+                # Reading (files, ffmpeg pipes) may block, so it happens on a worker thread
+                block = await asyncio.to_thread(self._next_block, iterator, block_size)
+                if not block:
+                    await send({'type': 'http.response.body', 'body': b''})
+                    break
+                await send({'type': 'http.response.body', 'body': block, 'more_body': True})
+        except Exception as e:
+            logger.error(f"Error sending response for {scope['path']}: {str(e)}")
+        finally:
+            disconnected.cancel()
+            if hasattr(app_iter, 'close'):
+                await asyncio.to_thread(app_iter.close)
+
+
+application = AsyncStreamingApp(flask_app, stream_handler)
@@ -0,0 +1,409 @@
+"""Load benchmark for the NVR with synthetic cameras.
+
+Runs the full application in-process against N synthetic cameras with M
+MJPEG viewers each (and optionally recording every camera), then times
+recording queries against a large synthetic catalog. Results are printed
+as JSON so runs can be compared over time:
+
+    python3 benchmark.py --cameras 8 --viewers 2 --duration 30 --output bench.json
+
+By default every camera plays a generated test pattern that carries its
+frame number as a row of black and white blocks. Viewers read the number
+back from the JPEGs they receive, which gives the latency from a frame
+leaving the camera ingest to it reaching a viewer over HTTP. --source uses
+an existing file or RTSP URL instead, without latency measurement.
+"""
+import argparse
+import http.client
+import json
+import logging
+import os
+import platform
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+from datetime import datetime
+import cv2
+import numpy as np
+import psutil
+
+CODE_BITS = 16
+
+def code_block_size(width):
+    return max(width // (CODE_BITS + 4), 4)
+
+
+def generate_pattern(path, width, height, fps, seconds):
+    """Write a moving test pattern whose frames carry their number as a block code"""
+    rng = np.random.default_rng(0)
+    # A wide noise texture scrolled across the frame is about as hard to encode as a real scene
+    texture = cv2.GaussianBlur(rng.integers(0, 256, (height, width * 2, 3), dtype=np.uint8), (9, 9), 0)
+    block = code_block_size(width)
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
+    for index in range(int(fps * seconds)):
+        offset = (index * 4) % width
+        frame = np.ascontiguousarray(texture[:, offset:offset + width])
+        for bit in range(CODE_BITS):
+            value = 255 if (index >> bit) & 1 else 0
+            frame[0:block, bit * block:(bit + 1) * block] = value
+        writer.write(frame)
+    writer.release()
+
+
+def read_code(gray, source_width):
+    """Read the frame number from a grayscale frame of any size"""
+    scale = gray.shape[1] / source_width
+    block = code_block_size(source_width) * scale
+    y = int(block / 2)
+    code = 0
+    for bit in range(CODE_BITS):
+        if gray[y, int((bit + 0.5) * block)] > 127:
+            code |= 1 << bit
+    return code
+
+
+def percentiles(values):
+    if not values:
+        return None
+    values = sorted(values)
+    pick = lambda q: values[min(int(q * len(values)), len(values) - 1)]
+    return {'p50': round(pick(0.5), 3), 'p95': round(pick(0.95), 3), 'p99': round(pick(0.99), 3),
+            'max': round(values[-1], 3), 'samples': len(values)}
+
+
+class LoadBenchmark:
+    """N cameras x M viewers against an in-process server"""
+
+    def __init__(self, args, workdir):
+        self.args = args
+        self.workdir = workdir
+        self.synthetic = args.source is None
+        self.running = True
+        self.measuring = False
+        self.frame_times = {}
+        self.viewers = []
+        self.probes = []
+        self.server = None
+
+    def _write_config(self, source):
+        config = {
+            'cameras': [{'id': i, 'name': f'bench{i}', 'rtsp_url': source, 'enabled': True,
+                         'recording_mode': self.args.recording_mode}
+                        for i in range(1, self.args.cameras + 1)],
+            'recording_settings': {'storage_directory': './recordings', 'retention_days': 7,
+                                   'segment_duration': self.args.segment_duration, 'ffmpeg_path': 'ffmpeg'},
+            'stream_settings': {'idle_timeout': 30, 'live_mode': 'mjpeg'},
+            'capture_settings': {'workers': self.args.workers, 'shared_memory_slots': 60}
+        }
+        with open(os.path.join(self.workdir, 'config.json'), 'w') as f:
+            json.dump(config, f, indent=2)
+
+    def _request(self, method, path):
+        conn = http.client.HTTPConnection('127.0.0.1', self.server.server_port, timeout=30)
+        try:
+            conn.request(method, path)
+            response = conn.getresponse()
+            response.read()
+            return response.status
+        finally:
+            conn.close()
+
+    def _probe(self, camera_id, ingest):
+        """Note when each numbered frame left the camera ingest"""
+        times = self.frame_times.setdefault(camera_id, {})
+        last_seq = 0
+        while self.running:
+            entry = ingest.buffer.wait_next(last_seq, timeout=1)
+            if entry is None:
+                continue
+            last_seq, timestamp, frame = entry
+            times[read_code(frame[:, :, 1], frame.shape[1])] = timestamp
+
+    def _view(self, camera_id, stats):
+        """Read an MJPEG stream like a browser would and record what arrives when"""
+        conn = http.client.HTTPConnection('127.0.0.1', self.server.server_port, timeout=30)
+        try:
+            conn.request('GET', f'/stream/{camera_id}?profile={self.args.profile}')
+            response = conn.getresponse()
+            while self.running:
+                headers = {}
+                while True:
+                    line = response.readline()
+                    if not line:
+                        return
+                    line = line.strip()
+                    if not line and headers:
+                        break
+                    if b':' in line:
+                        name, value = line.split(b':', 1)
+                        headers[name.strip().lower()] = value.strip()
+                jpeg = response.read(int(headers[b'content-length']))
+                received = time.time()
+                if not self.measuring:
+                    continue
+                stats['frames'] += 1
+                stats['bytes'] += len(jpeg)
+                if self.synthetic:
+                    gray = cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_4)
+                    # Profiles may scale the frame; the code scales with it
+                    sent = self.frame_times.get(camera_id, {}).get(read_code(gray, self.args.width))
+                    if sent is not None:
+                        stats['latencies'].append((received - sent) * 1000)
+        except (OSError, http.client.HTTPException, KeyError, ValueError):
+            pass
+        finally:
+            conn.close()
+
+    def _cpu_times(self, process):
+        times = process.cpu_times()
+        total = times.user + times.system
+        for child in process.children(recursive=True):
+            try:
+                child_times = child.cpu_times()
+                total += child_times.user + child_times.system
+            except psutil.Error:
+                pass
+        return total
+
+    def _harness_cpu(self):
+        """CPU time used by the benchmark's own viewer and probe threads"""
+        total = 0.0
+        for thread in self.viewers + self.probes:
+            try:
+                total += time.clock_gettime(time.pthread_getcpuclockid(thread.ident))
+            except (OSError, TypeError):
+                pass
+        return total
+
+    def _rss(self, process):
+        total = process.memory_info().rss
+        for child in process.children(recursive=True):
+            try:
+                total += child.memory_info().rss
+            except psutil.Error:
+                pass
+        return total
+
+    @staticmethod
+    def _metric_values(snapshot, name):
+        values = {}
+        for sample in snapshot.get(name, {}).get('samples', []):
+            key = sample['labels'].get('camera')
+            value = sample['value']
+            if isinstance(value, dict):
+                previous = values.get(key, {'count': 0, 'sum': 0.0})
+                value = {'count': previous['count'] + value['count'], 'sum': previous['sum'] + value['sum']}
+            else:
+                value += values.get(key, 0)
+            values[key] = value
+        return values
+
+    def run(self):
+        args = self.args
+        source = args.source
+        if self.synthetic:
+            source = os.path.join(self.workdir, 'pattern.mp4')
+            generate_pattern(source, args.width, args.height, args.fps, args.warmup + args.duration + 30)
+        self._write_config(source)
+
+        # The app reads config.json from the working directory
+        from werkzeug.serving import make_server
+        import app
+        from metrics import metrics
+        app.start_services()
+        self.server = make_server('127.0.0.1', 0, app.app, threaded=True)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+        camera_ids = range(1, args.cameras + 1)
+        if args.record:
+            for camera_id in camera_ids:
+                self._request('POST', f'/api/recordings/start/{camera_id}')
+
+        viewer_stats = []
+        for camera_id in camera_ids:
+            for _ in range(args.viewers):
+                stats = {'camera': camera_id, 'frames': 0, 'bytes': 0, 'latencies': []}
+                viewer_stats.append(stats)
+                thread = threading.Thread(target=self._view, args=(camera_id, stats), daemon=True)
+                self.viewers.append(thread)
+                thread.start()
+
+        if self.synthetic:
+            deadline = time.time() + 30
+            for camera_id in camera_ids:
+                ingest = None
+                while ingest is None and time.time() < deadline:
+                    ingest = app.ingest_manager.get(camera_id)
+                    time.sleep(0.1)
+                if ingest is not None:
+                    thread = threading.Thread(target=self._probe, args=(camera_id, ingest), daemon=True)
+                    self.probes.append(thread)
+                    thread.start()
+
+        time.sleep(args.warmup)
+
+        process = psutil.Process()
+        before = metrics.to_json()
+        cpu_before = self._cpu_times(process) - self._harness_cpu()
+        peak_rss = 0
+        started = time.time()
+        self.measuring = True
+        while time.time() - started < args.duration:
+            peak_rss = max(peak_rss, self._rss(process))
+            time.sleep(0.5)
+        self.measuring = False
+        elapsed = time.time() - started
+        cpu_used = self._cpu_times(process) - self._harness_cpu() - cpu_before
+        after = metrics.to_json()
+
+        self.running = False
+        if args.record:
+            for camera_id in camera_ids:
+                self._request('POST', f'/api/recordings/stop/{camera_id}')
+        self.server.shutdown()
+        # Write the recording flags now, while the scratch directory still exists
+        app.camera_manager.stop_watching()
+        app.camera_manager.flush()
+
+        captured = {k: v - self._metric_values(before, 'nvr_frames_captured_total').get(k, 0)
+                    for k, v in self._metric_values(after, 'nvr_frames_captured_total').items()}
+        dropped = sum(self._metric_values(after, 'nvr_frames_dropped_total').values()) - \
+            sum(self._metric_values(before, 'nvr_frames_dropped_total').values())
+
+        def mean_ms(name):
+            count = total = 0
+            for key, value in self._metric_values(after, name).items():
+                previous = self._metric_values(before, name).get(key, {'count': 0, 'sum': 0.0})
+                count += value['count'] - previous['count']
+                total += value['sum'] - previous['sum']
+            return round(total / count * 1000, 3) if count else None
+
+        capture_fps = [captured.get(str(camera_id), 0) / elapsed for camera_id in camera_ids]
+        viewer_fps = [stats['frames'] / elapsed for stats in viewer_stats]
+        latencies = [latency for stats in viewer_stats for latency in stats['latencies']]
+        cpu_percent = cpu_used / elapsed * 100
+        return {
+            'duration': round(elapsed, 2),
+            'capture_fps': {'mean': round(statistics.mean(capture_fps), 2), 'min': round(min(capture_fps), 2),
+                            'target': args.fps if self.synthetic else None},
+            'viewer_fps': {'mean': round(statistics.mean(viewer_fps), 2) if viewer_fps else None,
+                           'min': round(min(viewer_fps), 2) if viewer_fps else None},
+            'viewer_mbps': round(sum(s['bytes'] for s in viewer_stats) * 8 / elapsed / 1e6, 2),
+            'latency_ms': percentiles(latencies),
+            'decode_ms_mean': mean_ms('nvr_decode_seconds'),
+            'encode_ms_mean': mean_ms('nvr_encode_seconds'),
+            'record_write_ms_mean': mean_ms('nvr_record_write_seconds') if args.record else None,
+            'dropped_frames': dropped,
+            'cpu_percent': round(cpu_percent, 1),
+            'cpu_percent_per_camera': round(cpu_percent / args.cameras, 1),
+            'memory_rss_peak': peak_rss,
+            'memory_rss_per_camera': round(peak_rss / args.cameras)
+        }
+
+
+def benchmark_queries(storage_dir, segments, cameras, repeat=20):
+    """Time recording listings against a catalog holding `segments` synthetic segments"""
+    from camera_ingest import IngestManager
+    from recorder import VideoRecorder
+
+    recorder = VideoRecorder(storage_dir=storage_dir, ingest_manager=IngestManager())
+    catalog = recorder.catalog
+    segment_duration = 60
+    end = time.time()
+    start = end - segments // cameras * segment_duration
+    rows = []
+    for index in range(segments):
+        camera_id = index % cameras + 1
+        segment_start = start + index // cameras * segment_duration
+        filename = f"camera_{camera_id}_{datetime.fromtimestamp(segment_start).strftime('%Y%m%d_%H%M%S')}.mp4"
+        rows.append((camera_id, filename, segment_start, segment_start + segment_duration, 4 * 1024 * 1024, '[]'))
+    started = time.perf_counter()
+    # One transaction instead of RecordingsCatalog.add() per row; only the queries are under test
+    with catalog.lock, catalog.conn:
+        catalog.conn.executemany(
+            "INSERT OR REPLACE INTO recordings (camera_id, filename, start_time, end_time, size, keyframes) "
+            "VALUES (?, ?, ?, ?, ?, ?)", rows)
+    populate_seconds = time.perf_counter() - started
+
+    middle = datetime.fromtimestamp((start + end) / 2).date()
+    queries = {
+        'day_one_camera': lambda: recorder.get_recordings(camera_id=1, date=middle),
+        'first_page_all_cameras': lambda: recorder.get_recordings(limit=50),
+        'deep_page_all_cameras': lambda: recorder.get_recordings(limit=50, offset=segments // 2),
+        'count_day_one_camera': lambda: recorder.count_recordings(camera_id=1, date=middle),
+        'count_all': lambda: recorder.count_recordings()
+    }
+    results = {'segments': segments, 'populate_seconds': round(populate_seconds, 3)}
+    for name, query in queries.items():
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            query()
+            timings.append((time.perf_counter() - started) * 1000)
+        results[name + '_ms'] = percentiles(timings)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load benchmark with synthetic cameras; prints JSON results")
+    parser.add_argument('--cameras', type=int, default=4, help="number of cameras (0 skips the load test)")
+    parser.add_argument('--viewers', type=int, default=1, help="MJPEG viewers per camera")
+    parser.add_argument('--duration', type=float, default=20, help="measured seconds")
+    parser.add_argument('--warmup', type=float, default=5, help="seconds before measuring")
+    parser.add_argument('--profile', default='full', help="stream profile the viewers request")
+    parser.add_argument('--no-record', dest='record', action='store_false', help="do not record the cameras")
+    parser.add_argument('--recording-mode', default='transcode', choices=('transcode', 'passthrough'))
+    parser.add_argument('--segment-duration', type=int, default=60)
+    parser.add_argument('--workers', default=0, help="capture worker processes (0, a number or auto)")
+    parser.add_argument('--source', help="video file or RTSP URL for every camera instead of the test pattern")
+    parser.add_argument('--width', type=int, default=1280)
+    parser.add_argument('--height', type=int, default=720)
+    parser.add_argument('--fps', type=int, default=15)
+    parser.add_argument('--segments', type=int, default=100000, help="catalog size for the query benchmark (0 skips it)")
+    parser.add_argument('--output', help="also write the results to this file")
+    parser.add_argument('--keep', action='store_true', help="keep the working directory")
+    parser.add_argument('--verbose', action='store_true', help="show the application log")
+    args = parser.parse_args()
+    if args.workers != 'auto':
+        args.workers = int(args.workers)
+    if args.output:
+        args.output = os.path.abspath(args.output)
+
+    # Everything the application writes (logs, recordings, catalogs) stays in a scratch directory
+    workdir = tempfile.mkdtemp(prefix='nvr-bench-')
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    from logger import logger
+    if not args.verbose:
+        logger.setLevel(logging.WARNING)
+
+    results = {
+        'benchmark': 'nvr-load',
+        'version': 1,
+        'started_at': datetime.now().isoformat(timespec='seconds'),
+        'host': {'platform': platform.platform(), 'python': platform.python_version(),
+                 'cpu_count': os.cpu_count(), 'memory_total': psutil.virtual_memory().total,
+                 'opencv': cv2.__version__},
+        'parameters': vars(args)
+    }
+    try:
+        if args.segments:
+            results['queries'] = benchmark_queries(os.path.join(workdir, 'catalog'), args.segments, max(args.cameras, 1))
+        if args.cameras:
+            results['load'] = LoadBenchmark(args, workdir).run()
+    finally:
+        os.chdir(cwd)
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    output = json.dumps(results, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+import asyncio
+import threading
+
+class FrameBroadcaster:
+    """Publish the latest encoded chunk once and hand it to any number of subscribers.
+
+    Each subscriber remembers the sequence number of the chunk it last sent and
+    blocks on a condition until a newer one is published. A subscriber that is
+    slower than the publisher simply picks up the newest chunk on its next wait,
+    so intermediate chunks are dropped for that client instead of queueing up.
+
+    The publisher can call wait_for_demand() to produce chunks only while at
+    least one subscriber is actually blocked waiting for the next one.
+
+    Subscribers running on an asyncio event loop use wait_async() instead of
+    wait(); they hold no thread while waiting and are woken with a single
+    call_soon_threadsafe() per event loop, however many of them there are.
+    """
+
+    def __init__(self):
+        self.sequence = 0
+        self.chunk = None
+        self.closed = False
+        self.subscribers = 0
+        self.waiting = 0
+        self.condition = threading.Condition()
+        self.async_waiters = {}
+
+    def _wake_async_waiters(self):
+        """Resolve every pending async waiter; must be called with the condition held"""
+        for loop, futures in self.async_waiters.items():
+            try:
+                loop.call_soon_threadsafe(self._resolve, futures)
+            except RuntimeError:
+                # The event loop has been closed
+                pass
+        self.async_waiters = {}
+
+    @staticmethod
+    def _resolve(futures):
+        for future in futures:
+            if not future.done():
+                future.set_result(None)
+
+    def publish(self, chunk):
+        """Replace the current chunk and wake up all subscribers"""
+        with self.condition:
+            self.sequence += 1
+            self.chunk = chunk
+            self.condition.notify_all()
+            self._wake_async_waiters()
+
+    def close(self):
+        """Wake up all subscribers and make them stop"""
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+            self._wake_async_waiters()
+
+    def subscribe(self):
+        """Register a subscriber"""
+        with self.condition:
+            self.subscribers += 1
+
+    def unsubscribe(self):
+        """Unregister a subscriber"""
+        with self.condition:
+            self.subscribers = max(self.subscribers - 1, 0)
+
+    def wait_for_demand(self, timeout=None):
+        """Block until a subscriber is waiting for a new chunk; return False on timeout/close"""
+        with self.condition:
+            self.condition.wait_for(lambda: self.waiting > 0 or self.closed, timeout)
+            return self.waiting > 0 and not self.closed
+
+    def wait(self, after_seq=0, timeout=None):
+        """Return (sequence, chunk) for the newest chunk after after_seq, or None on timeout/close"""
+        with self.condition:
+            self.waiting += 1
+            self.condition.notify_all()
+            try:
+                self.condition.wait_for(lambda: self.sequence > after_seq or self.closed, timeout)
+            finally:
+                self.waiting -= 1
+            if self.closed or self.sequence <= after_seq:
+                return None
+            return self.sequence, self.chunk
+
+    async def wait_async(self, after_seq=0, timeout=None):
+        """Coroutine version of wait() for subscribers running on an event loop"""
+        loop = asyncio.get_running_loop()
+        with self.condition:
+            if self.sequence <= after_seq and not self.closed:
+                future = loop.create_future()
+                self.async_waiters.setdefault(loop, []).append(future)
+                self.waiting += 1
+                self.condition.notify_all()
+            else:
+                future = None
+
+        if future is not None:
+            try:
+                await asyncio.wait_for(future, timeout)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                with self.condition:
+                    self.waiting -= 1
+                    waiters = self.async_waiters.get(loop)
+                    if waiters and future in waiters:
+                        waiters.remove(future)
+
+        with self.condition:
+            if self.closed or self.sequence <= after_seq:
+                return None
+            return self.sequence, self.chunk
@@ -0,0 +1,364 @@
+import cv2
+import os
+import numpy as np
+import threading
+import time
+from collections import deque
+from camera_supervisor import backoff_delay
+from frame_ring import FrameRing
+from logger import logger
+from metrics import metrics
+
+FRAMES_CAPTURED = metrics.counter('nvr_frames_captured_total', "Frames decoded from the camera", ['camera'])
+DECODE_SECONDS = metrics.histogram('nvr_decode_seconds', "Time to read and decode one frame, including waiting for the camera", ['camera'])
+RECONNECTS = metrics.counter('nvr_reconnects_total', "Times a camera connection was lost", ['camera'])
+
+class FrameBuffer:
+    """Bounded ring buffer of decoded frames tagged with sequence numbers.
+
+    Frames are stored in a preallocated FrameRing and consumers get
+    (sequence, timestamp, frame) entries whose frame is a view into the ring,
+    not a copy. A view is overwritten once the writer gets around to its slot
+    again: the newest frame has size - 2 further frames of time, but the
+    oldest one a lagging consumer gets from wait_next() may be the next slot
+    to be written. Consumers that copy a frame must call intact() afterwards
+    and drop the copy if it returns False.
+    """
+
+    def __init__(self, size=60):
+        self.size = size
+        self.ring = None
+        self.external = False
+        self.frames = deque(maxlen=size - 1)
+        # (ring, sequence in that ring) of each frame added with put_view
+        self.sources = deque(maxlen=size - 1)
+        self.sequence = 0
+        self.closed = False
+        self.condition = threading.Condition()
+
+    def reserve(self, shape):
+        """Return the slot the next frame should be decoded or copied into"""
+        if self.ring is None or self.ring.shape != tuple(shape) or self.ring.slots != self.size:
+            # Views into a replaced ring stay valid; numpy keeps its memory alive
+            self.ring = FrameRing(shape, self.size)
+        return self.ring.begin(self.sequence + 1)
+
+    def commit(self):
+        """Publish the frame written into the reserved slot and wake up all waiting consumers"""
+        with self.condition:
+            self.sequence += 1
+            timestamp = self.ring.commit(self.sequence)
+            self.frames.append((self.sequence, timestamp, self.ring.slot(self.sequence)))
+            self.condition.notify_all()
+            return self.sequence
+
+    def put(self, frame):
+        """Copy a frame into the next slot and wake up all waiting consumers"""
+        np.copyto(self.reserve(frame.shape), frame)
+        return self.commit()
+
+    def put_view(self, frame, timestamp, ring=None, ring_seq=None):
+        """Append a frame that already lives in an external ring, e.g. a worker's shared memory.
+
+        The external ring's writer may be ahead of this buffer, so pass the
+        ring and the frame's sequence in it; intact() checks the ring to
+        tell whether the slot has been reused since.
+        """
+        with self.condition:
+            self.external = True
+            self.sequence += 1
+            self.frames.append((self.sequence, timestamp, frame))
+            self.sources.append((ring, ring_seq))
+            self.condition.notify_all()
+            return self.sequence
+
+    def resize(self, size):
+        """Grow the buffer so it holds at least size frames"""
+        with self.condition:
+            # An external ring cannot grow from here; its writer decides its size
+            if size > self.size and not self.external:
+                self.size = size
+                self.frames = deque(self.frames, maxlen=size - 1)
+                self.sources = deque(self.sources, maxlen=size - 1)
+
+    def seq_before(self, timestamp):
+        """Return the sequence number just before the oldest buffered frame at or after timestamp.
+
+        Passing the result to wait_next() replays buffered frames from that
+        point on, which is how recordings get their pre-roll.
+        """
+        with self.condition:
+            for seq, frame_time, _ in self.frames:
+                if frame_time >= timestamp:
+                    return seq - 1
+            return self.sequence
+
+    def intact(self, seq):
+        """Return True if frame seq has not been overwritten since it was handed out.
+
+        Call it after copying a frame: if it returns False the writer may
+        have been filling the slot during the copy and the copy is torn.
+        """
+        with self.condition:
+            if not self.external:
+                # The slot of seq is reserved again for frame seq + size
+                return seq > self.sequence - self.size + 1
+            if not self.frames or seq < self.frames[0][0]:
+                return False
+            ring, ring_seq = self.sources[seq - self.frames[0][0]]
+            return ring is None or (ring.table is not None and ring.entry(ring_seq) is not None)
+
+    def close(self):
+        """Mark the buffer as closed so blocked consumers return"""
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+    def latest(self):
+        """Return the newest (sequence, timestamp, frame) entry or None"""
+        with self.condition:
+            return self.frames[-1] if self.frames else None
+
+    def wait_latest(self, after_seq=0, timeout=None):
+        """Wait for a frame newer than after_seq and return the newest one.
+
+        Consumers that only care about the current picture (live view,
+        snapshots) use this and silently skip frames they were too slow for.
+        """
+        with self.condition:
+            self.condition.wait_for(lambda: self.sequence > after_seq or self.closed, timeout)
+            if self.sequence <= after_seq or not self.frames:
+                return None
+            return self.frames[-1]
+
+    def wait_next(self, after_seq=0, timeout=None):
+        """Wait for and return the oldest buffered frame newer than after_seq.
+
+        Consumers that need every frame (recording) use this. If the consumer
+        fell behind by more than the buffer size, the oldest frame still held
+        is returned and the gap shows up as a jump in sequence numbers.
+        """
+        with self.condition:
+            self.condition.wait_for(lambda: self.sequence > after_seq or self.closed, timeout)
+            if self.sequence <= after_seq or not self.frames:
+                return None
+            first_seq = self.frames[0][0]
+            index = max(after_seq + 1 - first_seq, 0)
+            return self.frames[index]
+
+
+class CameraIngest:
+    """Single RTSP connection per camera, decoded once and shared by all consumers.
+
+    A lost or failed connection is retried forever with backoff_delay()
+    between attempts, so the ingest - and everything consuming it - outlives
+    camera reboots and network outages. Reads that hang for read_timeout
+    seconds count as a lost connection.
+    """
+
+    def __init__(self, camera_id, rtsp_url, buffer_size=60, buffer=None,
+                 retry_initial=1, retry_max=60, read_timeout=10):
+        self.camera_id = camera_id
+        self.rtsp_url = rtsp_url
+        # Capture workers pass a writer that publishes frames to shared memory instead
+        self.buffer = buffer if buffer is not None else FrameBuffer(buffer_size)
+        self.retry_initial = retry_initial
+        self.retry_max = retry_max
+        self.read_timeout = read_timeout
+        self.running = False
+        self.connected = False
+        self.state = 'stopped'
+        self.attempts = 0
+        self.reconnects = 0
+        self.last_error = None
+        self.retry_at = None
+        self.width = 0
+        self.height = 0
+        self.fps = 0
+        self.wake_event = threading.Event()
+        self.thread = None
+        self.frames_metric = FRAMES_CAPTURED.labels(camera_id)
+        self.decode_metric = DECODE_SECONDS.labels(camera_id)
+
+    def start(self):
+        """Start the capture thread"""
+        if self.running:
+            return
+        self.running = True
+        self.state = 'connecting'
+        self.thread = threading.Thread(target=self._capture, daemon=True)
+        self.thread.start()
+        logger.info(f"Started ingest for camera {self.camera_id}")
+
+    def stop(self):
+        """Stop the capture thread and wake up consumers"""
+        self.running = False
+        self.wake_event.set()
+        self.buffer.close()
+        if self.thread and self.thread is not threading.current_thread():
+            self.thread.join(timeout=5)
+        logger.info(f"Stopped ingest for camera {self.camera_id}")
+
+    def reconnect(self):
+        """Drop the current connection, or skip the remaining backoff, and connect again"""
+        self.wake_event.set()
+
+    def _open(self):
+        """Open the camera with connect and read timeouts so a dead camera cannot hang a read"""
+        timeout = int(self.read_timeout * 1000)
+        cap = cv2.VideoCapture(self.rtsp_url, cv2.CAP_FFMPEG, [
+            cv2.CAP_PROP_OPEN_TIMEOUT_MSEC, timeout,
+            cv2.CAP_PROP_READ_TIMEOUT_MSEC, timeout
+        ])
+        if not cap.isOpened():
+            cap.release()
+            raise Exception("Failed to open RTSP stream")
+        return cap
+
+    def _capture(self):
+        """Continuously read and decode frames from the camera"""
+        # Local files stand in for cameras in testing; pace them at their native rate
+        is_file = os.path.isfile(self.rtsp_url)
+
+        while self.running:
+            cap = None
+            try:
+                self.wake_event.clear()
+                cap = self._open()
+
+                self.width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+                self.height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+                self.fps = int(cap.get(cv2.CAP_PROP_FPS)) or 15
+                self.connected = True
+                self.state = 'connected'
+                self.attempts = 0
+                self.retry_at = None
+                logger.info(f"Successfully connected to camera {self.camera_id}")
+
+                frame_interval = 1.0 / self.fps
+                next_frame_time = time.time()
+                while self.running:
+                    if self.wake_event.is_set():
+                        raise Exception("Reconnect requested")
+                    read_started = time.perf_counter()
+                    if self.width and self.height:
+                        # Decode straight into the buffer's next slot instead of a fresh array
+                        slot = self.buffer.reserve((self.height, self.width, 3))
+                        ret, frame = cap.read(slot)
+                    else:
+                        slot = None
+                        ret, frame = cap.read()
+                    if not ret:
+                        raise Exception("Failed to read frame")
+                    self.decode_metric.observe(time.perf_counter() - read_started)
+                    self.frames_metric.inc()
+                    if slot is not None and frame.shape == slot.shape and frame.ctypes.data == slot.ctypes.data:
+                        self.buffer.commit()
+                    else:
+                        # The reported size was wrong; use the real one from now on
+                        self.height, self.width = frame.shape[:2]
+                        self.buffer.put(frame)
+
+                    if is_file:
+                        next_frame_time += frame_interval
+                        delay = next_frame_time - time.time()
+                        if delay > 0:
+                            time.sleep(delay)
+
+            except Exception as e:
+                if self.connected:
+                    self.reconnects += 1
+                    RECONNECTS.labels(self.camera_id).inc()
+                self.connected = False
+                if not self.running:
+                    break
+                self.last_error = str(e)
+                if self.wake_event.is_set():
+                    # reconnect() was called; connect again right away
+                    delay = 0
+                else:
+                    self.attempts += 1
+                    delay = backoff_delay(self.attempts, self.retry_initial, self.retry_max)
+                self.retry_at = time.time() + delay
+                self.state = 'reconnecting'
+                logger.error(f"Error capturing stream for camera {self.camera_id}: {str(e)}")
+                if delay:
+                    logger.info(f"Retrying connection to camera {self.camera_id} in {delay:.1f} seconds... (Attempt {self.attempts})")
+                    # reconnect() and stop() cut the wait short
+                    self.wake_event.wait(delay)
+
+            finally:
+                if cap is not None:
+                    cap.release()
+
+        self.connected = False
+        self.running = False
+        self.state = 'stopped'
+        self.retry_at = None
+        self.buffer.close()
+        logger.info(f"Ingest capture stopped for camera {self.camera_id}")
+
+
+class IngestManager:
+    """Reference-counted registry of per-camera ingests.
+
+    With a worker_pool (see capture_workers.py) cameras are captured in
+    worker processes instead of threads of this process; the pool passes its
+    own ingest_options to the workers.
+    """
+
+    def __init__(self, buffer_size=60, worker_pool=None, ingest_options=None):
+        self.buffer_size = buffer_size
+        self.worker_pool = worker_pool
+        # Keyword arguments for new CameraIngests: retry_initial, retry_max, read_timeout
+        self.ingest_options = ingest_options or {}
+        self.ingests = {}
+        self.consumers = {}
+        self.lock = threading.Lock()
+
+    def acquire(self, camera_id, rtsp_url, consumer):
+        """Register a consumer for a camera, starting its ingest if needed.
+
+        An ingest still reading an old URL (the camera was edited) is
+        replaced; its consumers see the buffer close and acquire again.
+        """
+        replaced = None
+        with self.lock:
+            ingest = self.ingests.get(camera_id)
+            if ingest is not None and ingest.running and ingest.rtsp_url != rtsp_url:
+                replaced, ingest = ingest, None
+            if ingest is None or not ingest.running:
+                if self.worker_pool is not None:
+                    ingest = self.worker_pool.create_ingest(camera_id, rtsp_url, self.buffer_size)
+                else:
+                    ingest = CameraIngest(camera_id, rtsp_url, self.buffer_size, **self.ingest_options)
+                self.ingests[camera_id] = ingest
+                self.consumers[camera_id] = set()
+                ingest.start()
+            self.consumers[camera_id].add(consumer)
+        if replaced is not None:
+            replaced.stop()
+        return ingest
+
+    def release(self, camera_id, consumer, ingest=None):
+        """Unregister a consumer and stop the ingest once nobody uses it.
+
+        Passing the ingest the consumer acquired makes a late release of a
+        replaced ingest a no-op instead of unregistering the new one.
+        """
+        with self.lock:
+            if ingest is not None and self.ingests.get(camera_id) is not ingest:
+                return
+            consumers = self.consumers.get(camera_id)
+            if consumers is None:
+                return
+            consumers.discard(consumer)
+            if consumers:
+                return
+            ingest = self.ingests.pop(camera_id)
+            del self.consumers[camera_id]
+        ingest.stop()
+
+    def get(self, camera_id):
+        """Return the running ingest for a camera or None"""
+        return self.ingests.get(camera_id)
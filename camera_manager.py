@@ -1,11 +1,43 @@
+import atexit
 import json
 import os
+import tempfile
+import threading
+import time
 from logger import logger
 
+# Camera fields that can be changed through update_camera()
+CAMERA_FIELDS = ('name', 'rtsp_url', 'substream_url', 'enabled', 'recording', 'recording_mode', 'motion',
+                 'retention_days', 'connect_timeout')
+
 class CameraManager:
-    def __init__(self, config_file='config.json'):
-        self.config_file = config_file
+    """Cameras and settings stored in config.json.
+
+    Cameras are indexed by id. Changes apply in memory at once and are
+    written out in batches: the first change schedules a save `save_delay`
+    seconds later and everything changed until then goes out with it. The
+    file is written next to config.json and renamed over it, so a crash
+    never leaves a truncated config. Listeners added with add_listener() are
+    told which cameras were added, changed or removed, whether through the
+    API or by editing the file while watch() is running.
+    """
+
+    def __init__(self, config_file='config.json', save_delay=1.0):
+        # Resolved now: saves run later from a timer or at exit, after the working directory may have changed
+        self.config_file = os.path.abspath(config_file)
+        self.save_delay = save_delay
+        self.lock = threading.RLock()
+        self.notify_lock = threading.Lock()
+        self.listeners = []
+        self.save_timer = None
+        self.dirty = False
+        self.watching = False
+        self.watch_thread = None
+        self.file_stamp = self._file_stamp()
         self.config = self._load_config()
+        self._index()
+        # Changes still waiting for the save timer are written on exit
+        atexit.register(self.flush)
 
     def _load_config(self):
         """Load configuration from JSON file"""
@@ -19,42 +51,225 @@ class CameraManager:
             logger.error(f"Invalid JSON in configuration file {self.config_file}")
             return {"cameras": [], "recording_settings": {"storage_directory": "./recordings", "retention_days": 7}}
 
-    def _save_config(self):
-        """Save configuration to JSON file"""
+    def _index(self):
+        """Rebuild the id index and the id allocator from self.config"""
+        cameras = self.config.setdefault('cameras', [])
+        self.cameras = {camera['id']: camera for camera in cameras}
+        # Ids are never reused, not even those of deleted cameras: recordings
+        # and motion events in the catalog still refer to them
+        self.config['next_camera_id'] = max([self.config.get('next_camera_id', 1)] +
+                                            [camera_id + 1 for camera_id in self.cameras])
+
+    def _update_list(self):
+        # A new list instead of an in-place change, so callers iterating
+        # list_cameras() in other threads are not affected
+        self.config['cameras'] = list(self.cameras.values())
+
+    def _file_stamp(self):
         try:
-            with open(self.config_file, 'w') as f:
-                json.dump(self.config, f, indent=2)
-        except Exception as e:
-            logger.error(f"Failed to save configuration: {str(e)}")
+            stat = os.stat(self.config_file)
+            return stat.st_mtime_ns, stat.st_size
+        except OSError:
+            return None
+
+    def _write_config(self, data):
+        """Write the file next to config.json and rename it over the old one"""
+        directory = os.path.dirname(os.path.abspath(self.config_file))
+        fd, temp_path = tempfile.mkstemp(prefix='.config-', suffix='.tmp', dir=directory)
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            if os.path.exists(self.config_file):
+                os.chmod(temp_path, os.stat(self.config_file).st_mode & 0o777)
+            os.replace(temp_path, self.config_file)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
             raise
 
+    def _save_config(self):
+        """Schedule a save; changes made within save_delay seconds are written together"""
+        with self.lock:
+            self.dirty = True
+            if self.save_delay <= 0:
+                self.flush()
+            elif self.save_timer is None:
+                self.save_timer = threading.Timer(self.save_delay, self._scheduled_flush)
+                self.save_timer.daemon = True
+                self.save_timer.start()
+
+    def _scheduled_flush(self):
+        try:
+            self.flush()
+        except Exception:
+            # Still dirty: the next change or the flush on exit tries again
+            pass
+
+    def flush(self):
+        """Write pending changes to config.json now"""
+        with self.lock:
+            if self.save_timer is not None:
+                self.save_timer.cancel()
+                self.save_timer = None
+            if not self.dirty:
+                return
+            try:
+                self._write_config(json.dumps(self.config, indent=2))
+            except Exception as e:
+                logger.error(f"Failed to save configuration: {str(e)}")
+                raise
+            self.dirty = False
+            self.file_stamp = self._file_stamp()
+
+    def add_listener(self, listener):
+        """Call listener(added, changed, removed) after cameras change; changed holds (old, new) pairs"""
+        self.listeners.append(listener)
+
+    def _notify(self, added=(), changed=(), removed=()):
+        # One change at a time, in the order they were made
+        with self.notify_lock:
+            for listener in self.listeners:
+                try:
+                    listener(list(added), list(changed), list(removed))
+                except Exception as e:
+                    logger.error(f"Error applying camera changes: {str(e)}")
+
+    def watch(self, interval=2):
+        """Start a thread that reloads config.json when it is edited"""
+        if self.watching:
+            return
+        self.watching = True
+        self.watch_thread = threading.Thread(target=self._watch, args=(interval,), daemon=True)
+        self.watch_thread.start()
+
+    def stop_watching(self):
+        """Stop the config file watcher"""
+        self.watching = False
+        if self.watch_thread:
+            self.watch_thread.join(timeout=5)
+
+    def _watch(self, interval):
+        while self.watching:
+            time.sleep(interval)
+            try:
+                if self._file_stamp() != self.file_stamp:
+                    self.reload()
+            except Exception as e:
+                logger.error(f"Error reloading configuration: {str(e)}")
+
+    def reload(self):
+        """Re-read config.json and apply the cameras added, changed or removed in it.
+
+        Returns False if the file could not be read or has not changed since
+        it was last read or saved.
+        """
+        with self.lock:
+            stamp = self._file_stamp()
+            # Checked again under the lock: the watcher may have seen the file
+            # just before our own save replaced it
+            if stamp == self.file_stamp:
+                return False
+            try:
+                with open(self.config_file, 'r') as f:
+                    config = json.load(f)
+                cameras = {camera['id']: camera for camera in config.get('cameras', [])}
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                # Keep the running configuration; the next save of the file is tried again
+                self.file_stamp = stamp
+                logger.error(f"Not reloading {self.config_file}: {str(e)}")
+                return False
+
+            self.file_stamp = stamp
+            if self.dirty:
+                logger.warning(f"{self.config_file} was edited while camera changes were waiting to be saved; "
+                               f"the edited file wins")
+                self.dirty = False
+                if self.save_timer is not None:
+                    self.save_timer.cancel()
+                    self.save_timer = None
+
+            previous = self.cameras
+            added = [camera for camera_id, camera in cameras.items() if camera_id not in previous]
+            removed = [camera for camera_id, camera in previous.items() if camera_id not in cameras]
+            changed = [(previous[camera_id], camera) for camera_id, camera in cameras.items()
+                       if camera_id in previous and previous[camera_id] != camera]
+            self.config = config
+            self._index()
+
+        logger.info(f"Reloaded {self.config_file}: {len(added)} cameras added, "
+                    f"{len(changed)} changed, {len(removed)} removed")
+        if added or changed or removed:
+            self._notify(added, changed, removed)
+        return True
+
     def list_cameras(self):
         """Return list of all configured cameras"""
         return self.config.get('cameras', [])
 
+    def get_camera(self, camera_id):
+        """Return the camera with this id, or None"""
+        return self.cameras.get(camera_id)
+
     def add_camera(self, name, rtsp_url):
         """Add a new camera to the configuration"""
         try:
-            camera = {
-                'id': len(self.config['cameras']) + 1,
-                'name': name,
-                'rtsp_url': rtsp_url,
-                'enabled': True
-            }
-            self.config['cameras'].append(camera)
-            self._save_config()
+            with self.lock:
+                camera = {
+                    'id': self.config['next_camera_id'],
+                    'name': name,
+                    'rtsp_url': rtsp_url,
+                    'enabled': True
+                }
+                self.config['next_camera_id'] += 1
+                self.cameras[camera['id']] = camera
+                self._update_list()
+                self._save_config()
             logger.info(f"Added new camera: {name}")
+            self._notify(added=[camera])
             return camera
         except Exception as e:
             logger.error(f"Failed to add camera: {str(e)}")
             raise
 
+    def update_camera(self, camera_id, changes, notify=True):
+        """Change fields of a camera; return the updated camera, or None if there is no such camera.
+
+        notify=False only stores the change, for state the caller has already applied.
+        """
+        unknown = set(changes) - set(CAMERA_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown camera fields: {', '.join(sorted(unknown))}")
+        try:
+            with self.lock:
+                previous = self.cameras.get(camera_id)
+                if previous is None:
+                    return None
+                # Replaced rather than modified, so running pipelines keep a consistent copy
+                camera = {**previous, **changes}
+                self.cameras[camera_id] = camera
+                self._update_list()
+                self._save_config()
+            logger.info(f"Updated camera with ID: {camera_id}")
+            if notify and camera != previous:
+                self._notify(changed=[(previous, camera)])
+            return camera
+        except Exception as e:
+            logger.error(f"Failed to update camera: {str(e)}")
+            raise
+
     def delete_camera(self, camera_id):
-        """Delete a camera from the configuration"""
+        """Delete a camera from the configuration; return False if there is no such camera"""
         try:
-            self.config['cameras'] = [cam for cam in self.config['cameras'] if cam['id'] != camera_id]
-            self._save_config()
+            with self.lock:
+                camera = self.cameras.pop(camera_id, None)
+                if camera is None:
+                    return False
+                self._update_list()
+                self._save_config()
             logger.info(f"Deleted camera with ID: {camera_id}")
+            self._notify(removed=[camera])
             return True
         except Exception as e:
             logger.error(f"Failed to delete camera: {str(e)}")
@@ -63,15 +278,90 @@ class CameraManager:
     def update_settings(self, storage_directory, retention_days):
         """Update recording settings"""
         try:
-            self.config['recording_settings']['storage_directory'] = storage_directory
-            self.config['recording_settings']['retention_days'] = retention_days
-            self._save_config()
+            with self.lock:
+                self.config['recording_settings']['storage_directory'] = storage_directory
+                self.config['recording_settings']['retention_days'] = retention_days
+                self._save_config()
             logger.info("Updated recording settings")
             return True
         except Exception as e:
             logger.error(f"Failed to update settings: {str(e)}")
             raise
 
+    def get_stream_settings(self):
+        """Get live stream settings"""
+        settings = {
+            'idle_timeout': 30,
+            'live_mode': 'fmp4',
+            'fragment_duration': 0.5,
+            'default_profile': 'full',
+            'grid_profile': 'preview',
+            'profiles': {
+                'full': {'width': None, 'quality': 80, 'fps': None, 'substream': False},
+                'preview': {'width': 640, 'quality': 60, 'fps': 10, 'substream': True}
+            }
+        }
+        settings.update(self.config.get('stream_settings', {}))
+        return settings
+
+    def get_playback_settings(self):
+        """Get recording playback settings"""
+        settings = {'cache_max_age': 86400, 'x_accel_redirect': None}
+        settings.update(self.config.get('playback_settings', {}))
+        return settings
+
+    def get_snapshot_settings(self):
+        """Get the default snapshot JPEG quality and how long (seconds) a polled camera stays connected"""
+        settings = {'quality': 80, 'idle_timeout': 30, 'wait_timeout': 5}
+        settings.update(self.config.get('snapshot_settings', {}))
+        return settings
+
+    def get_capture_settings(self):
+        """Get capture settings; workers is 0 for in-process capture or the number of worker processes"""
+        settings = {'workers': 0, 'shared_memory_slots': 60}
+        settings.update(self.config.get('capture_settings', {}))
+        return settings
+
+    def get_log_settings(self):
+        """Get the log format ("text" or "json") and how many repeats of a message per window (seconds) are written"""
+        settings = {'format': 'text', 'burst': 5, 'window': 60}
+        settings.update(self.config.get('log_settings', {}))
+        return settings
+
+    def get_monitor_settings(self):
+        """Get the host metrics sampling interval (seconds) and history length (samples)"""
+        settings = {'interval': 2, 'history_size': 1800}
+        settings.update(self.config.get('monitor_settings', {}))
+        return settings
+
+    def get_startup_settings(self):
+        """Get how many cameras connect at once after a start and how long each may take, in seconds"""
+        settings = {'max_parallel': 8, 'connect_timeout': 10, 'warm_ingests': False}
+        settings.update(self.config.get('startup_settings', {}))
+        return settings
+
+    def get_supervisor_settings(self):
+        """Get reconnect backoff and stall watchdog settings, in seconds"""
+        settings = {'retry_initial': 1, 'retry_max': 60, 'read_timeout': 10, 'stall_timeout': 10}
+        settings.update(self.config.get('supervisor_settings', {}))
+        return settings
+
+    def get_motion_settings(self, camera=None):
+        """Get motion detection settings, with a camera's own "motion" block applied on top"""
+        settings = {
+            'enabled': False,
+            'sensitivity': 50,
+            'mask': [],
+            'pre_roll': 3,
+            'post_roll': 10,
+            'analysis_fps': 5,
+            'analysis_width': 160
+        }
+        settings.update(self.config.get('motion_settings', {}))
+        if camera is not None:
+            settings.update(camera.get('motion', {}))
+        return settings
+
     def get_settings(self):
         """Get current recording settings"""
         return self.config.get('recording_settings', {
@@ -0,0 +1,238 @@
+import random
+import threading
+import time
+from logger import logger
+from metrics import metrics
+
+CAPTURE_FPS = metrics.gauge('nvr_capture_fps', "Frames per second delivered by each camera ingest", ['camera'])
+
+def backoff_delay(attempt, initial=1, maximum=60):
+    """Seconds to wait before retry number attempt: exponential, capped, with jitter.
+
+    Half of the delay is fixed and half is random, so cameras that dropped
+    together (a switch reboot) do not all reconnect in the same instant.
+    """
+    delay = min(maximum, initial * 2 ** max(attempt - 1, 0))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+class CameraSupervisor:
+    """Keeps every camera's capture and recording pipeline running.
+
+    Ingests reconnect on their own with backoff_delay(); the supervisor adds
+    a stall watchdog on top - an ingest that claims to be connected but has
+    not delivered a frame for stall_timeout seconds is told to reconnect -
+    and measures each camera's frame rate. Recordings started through the
+    supervisor are wanted until stop_recording() is called: if one ends on
+    its own (ffmpeg exited, camera removed from the network) it is started
+    again with the same backoff.
+    """
+
+    def __init__(self, ingest_manager, video_recorder, camera_manager, stall_timeout=10,
+                 retry_initial=1, retry_max=60, check_interval=1):
+        self.ingest_manager = ingest_manager
+        self.video_recorder = video_recorder
+        self.camera_manager = camera_manager
+        self.stall_timeout = stall_timeout
+        self.retry_initial = retry_initial
+        self.retry_max = retry_max
+        self.check_interval = check_interval
+        self.recordings = {}
+        # Cameras whose recording is being started outside the lock
+        self.starting = set()
+        self.watches = {}
+        self.lock = threading.Lock()
+        self.running = False
+        self.thread = None
+        CAPTURE_FPS.add_function(lambda: {(key,): watch['fps'] for key, watch in list(self.watches.items())})
+
+    def start(self):
+        """Start the supervisor thread"""
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        logger.info("Started camera supervisor")
+
+    def stop(self):
+        """Stop the supervisor thread"""
+        self.running = False
+        if self.thread:
+            self.thread.join(timeout=5)
+
+    def _start_camera_recording(self, camera):
+        return self.video_recorder.start_recording(
+            camera['id'], camera['rtsp_url'], mode=camera.get('recording_mode', 'transcode')
+        )
+
+    def start_recording(self, camera_id):
+        """Start recording a camera and keep it recording until stop_recording().
+
+        The camera's "recording" flag is set in the config, so the recording
+        is resumed after a restart.
+        """
+        camera = self.camera_manager.get_camera(camera_id)
+        if camera is None:
+            return False
+        with self.lock:
+            if camera_id in self.starting:
+                logger.warning(f"Recording of camera {camera_id} is already being started")
+                return False
+            self.starting.add(camera_id)
+        # Started without the lock: the recorder may wait for the previous recording's writer
+        started = False
+        try:
+            # A recording already running (e.g. started by motion) is taken over as is
+            started = bool(self.video_recorder.active_recordings.get(camera_id)) or self._start_camera_recording(camera)
+        finally:
+            with self.lock:
+                self.starting.discard(camera_id)
+                if started:
+                    self.recordings[camera_id] = {'attempts': 0, 'retry_at': None, 'restarts': 0,
+                                                  'started_at': time.time()}
+        if not started:
+            return False
+        if not camera.get('recording'):
+            self.camera_manager.update_camera(camera_id, {'recording': True}, notify=False)
+        return True
+
+    def stop_recording(self, camera_id, persist=True):
+        """Stop recording a camera and stop restarting it; persist=False keeps its "recording" flag"""
+        with self.lock:
+            self.recordings.pop(camera_id, None)
+        camera = self.camera_manager.get_camera(camera_id)
+        if persist and camera is not None and camera.get('recording'):
+            self.camera_manager.update_camera(camera_id, {'recording': False}, notify=False)
+        return self.video_recorder.stop_recording(camera_id)
+
+    def wants_recording(self, camera_id):
+        """Return True if the camera should be recording regardless of motion"""
+        return camera_id in self.recordings
+
+    def _run(self):
+        while self.running:
+            try:
+                now = time.time()
+                self._check_ingests(now)
+                self._check_recordings(now)
+            except Exception as e:
+                logger.error(f"Error in camera supervisor: {str(e)}")
+            time.sleep(self.check_interval)
+
+    def _check_ingests(self, now):
+        """Measure the frame rate of every ingest and reconnect the ones that stalled"""
+        ingests = dict(self.ingest_manager.ingests)
+        for key in list(self.watches):
+            if key not in ingests:
+                del self.watches[key]
+
+        for key, ingest in ingests.items():
+            watch = self.watches.get(key)
+            if watch is None or watch['ingest'] is not ingest:
+                watch = {'ingest': ingest, 'seq': 0, 'frame_at': now, 'sample_seq': 0, 'sampled_at': now,
+                         'fps': 0.0, 'connected': False, 'stalled': False, 'reconnect_at': 0}
+                self.watches[key] = watch
+
+            seq = ingest.buffer.sequence
+            if seq != watch['seq'] or (ingest.connected and not watch['connected']):
+                # A fresh connection gets stall_timeout seconds to deliver its first frame
+                watch['frame_at'] = now
+            watch['seq'] = seq
+            watch['connected'] = ingest.connected
+            # Frame rate over windows of at least a second, whatever the check interval
+            elapsed = now - watch['sampled_at']
+            if elapsed >= 1:
+                watch['fps'] = round((seq - watch['sample_seq']) / elapsed, 1)
+                watch['sample_seq'] = seq
+                watch['sampled_at'] = now
+
+            watch['stalled'] = ingest.connected and now - watch['frame_at'] > self.stall_timeout
+            if watch['stalled'] and now - watch['reconnect_at'] > self.stall_timeout:
+                logger.warning(f"No frames from camera {key} for {now - watch['frame_at']:.0f} seconds, reconnecting")
+                watch['reconnect_at'] = now
+                ingest.reconnect()
+
+    def _check_recordings(self, now):
+        """Restart wanted recordings that ended on their own"""
+        due = []
+        with self.lock:
+            for camera_id, wanted in list(self.recordings.items()):
+                if camera_id in self.starting:
+                    continue
+                if self.video_recorder.active_recordings.get(camera_id):
+                    # A recording that stays up for a while starts the backoff over
+                    if wanted['attempts'] and now - wanted['started_at'] >= self.retry_max:
+                        wanted['attempts'] = 0
+                    continue
+
+                if wanted['retry_at'] is None:
+                    wanted['attempts'] += 1
+                    delay = backoff_delay(wanted['attempts'], self.retry_initial, self.retry_max)
+                    wanted['retry_at'] = now + delay
+                    logger.warning(f"Recording of camera {camera_id} stopped unexpectedly, "
+                                   f"restarting in {delay:.1f} seconds (attempt {wanted['attempts']})")
+                    continue
+                if now < wanted['retry_at']:
+                    continue
+
+                camera = self.camera_manager.get_camera(camera_id)
+                if camera is None:
+                    del self.recordings[camera_id]
+                    continue
+                wanted['retry_at'] = None
+                wanted['started_at'] = now
+                self.starting.add(camera_id)
+                due.append((camera, wanted))
+
+        for camera, wanted in due:
+            camera_id = camera['id']
+            try:
+                started = self._start_camera_recording(camera)
+            except Exception as e:
+                logger.error(f"Error resuming recording of camera {camera_id}: {str(e)}")
+                started = False
+            with self.lock:
+                self.starting.discard(camera_id)
+                still_wanted = self.recordings.get(camera_id) is wanted
+                if started and still_wanted:
+                    wanted['restarts'] += 1
+            if started and still_wanted:
+                logger.info(f"Resumed recording of camera {camera_id}")
+            elif started:
+                # stop_recording() was called while it was being started
+                self.video_recorder.stop_recording(camera_id)
+
+    def _ingest_status(self, key, now):
+        ingest = self.ingest_manager.get(key)
+        if ingest is None:
+            return {'state': 'idle', 'connected': False, 'fps': 0.0, 'last_frame_age': None,
+                    'attempts': 0, 'reconnects': 0, 'last_error': None, 'retry_in': None}
+        watch = self.watches.get(key) or {}
+        latest = ingest.buffer.latest()
+        return {
+            'state': 'stalled' if watch.get('stalled') else ingest.state,
+            'connected': ingest.connected,
+            'fps': watch.get('fps', 0.0),
+            'last_frame_age': round(now - latest[1], 1) if latest else None,
+            'attempts': ingest.attempts,
+            'reconnects': ingest.reconnects,
+            'last_error': ingest.last_error,
+            'retry_in': round(max(ingest.retry_at - now, 0), 1) if ingest.retry_at else None
+        }
+
+    def get_status(self):
+        """Return the connection and recording state of every configured camera"""
+        now = time.time()
+        cameras = {}
+        for camera in self.camera_manager.list_cameras():
+            camera_id = camera['id']
+            status = self._ingest_status(camera_id, now)
+            if self.ingest_manager.get(f"{camera_id}-sub") is not None:
+                status['substream'] = self._ingest_status(f"{camera_id}-sub", now)
+            wanted = self.recordings.get(camera_id)
+            status['recording'] = bool(self.video_recorder.active_recordings.get(camera_id))
+            status['recording_wanted'] = wanted is not None
+            status['recording_restarts'] = wanted['restarts'] if wanted else 0
+            cameras[camera_id] = status
+        return cameras
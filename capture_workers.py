@@ -0,0 +1,402 @@
+import argparse
+import json
+import os
+import queue
+import subprocess
+import sys
+import threading
+import time
+import numpy as np
+from camera_ingest import FRAMES_CAPTURED, RECONNECTS, CameraIngest, FrameBuffer
+from frame_ring import FrameRing
+from logger import logger
+from metrics import metrics
+
+FRAMES_DROPPED = metrics.counter('nvr_frames_dropped_total', "Frames lost before a consumer got them", ['camera', 'stage'])
+
+class SharedFrameWriter:
+    """Stand-in for FrameBuffer inside a worker that publishes frames to a shared-memory FrameRing"""
+
+    def __init__(self, camera_id, slots, emit):
+        self.camera_id = camera_id
+        self.slots = slots
+        self.emit = emit
+        self.ingest = None
+        self.ring = None
+        self.sequence = 0
+
+    def reserve(self, shape):
+        if self.ring is None or self.ring.shape != tuple(shape):
+            # (Re)allocate on the first frame and whenever the camera changes resolution
+            if self.ring is not None:
+                self.ring.close(unlink=True)
+            self.ring = FrameRing(shape, self.slots, shared=True)
+            self.sequence = 0
+            self.emit({'event': 'format', 'camera_id': self.camera_id, 'name': self.ring.name,
+                       'shape': list(shape), 'slots': self.slots, 'fps': self.ingest.fps if self.ingest else 0})
+        return self.ring.begin(self.sequence + 1)
+
+    def commit(self):
+        self.sequence += 1
+        self.ring.commit(self.sequence)
+        return self.sequence
+
+    def put(self, frame):
+        np.copyto(self.reserve(frame.shape), frame)
+        return self.commit()
+
+    def close(self):
+        pass
+
+    def release(self):
+        if self.ring is not None:
+            self.ring.close(unlink=True)
+            self.ring = None
+
+
+def run_worker(slots, heartbeat_interval=1.0):
+    """Entry point of a capture worker process.
+
+    Commands arrive as JSON lines on stdin ({"command": "start"|"stop", ...});
+    format changes and a per-second heartbeat with the state of every camera
+    are written as JSON lines to stdout. The worker exits when stdin closes,
+    i.e. when the web process goes away.
+    """
+    emit_lock = threading.Lock()
+    commands = queue.Queue()
+    cameras = {}
+
+    def emit(message):
+        with emit_lock:
+            sys.stdout.write(json.dumps(message) + '\n')
+            sys.stdout.flush()
+
+    def read_commands():
+        for line in sys.stdin:
+            commands.put(json.loads(line))
+        commands.put(None)
+
+    threading.Thread(target=read_commands, daemon=True).start()
+
+    while True:
+        try:
+            command = commands.get(timeout=heartbeat_interval)
+        except queue.Empty:
+            command = {}
+        if command is None:
+            break
+
+        camera_id = command.get('camera_id')
+        if command.get('command') == 'start' and camera_id in cameras and not cameras[camera_id][0].running:
+            # Restart a camera whose ingest gave up earlier
+            cameras.pop(camera_id)[1].release()
+        if command.get('command') == 'start' and camera_id not in cameras:
+            writer = SharedFrameWriter(camera_id, slots, emit)
+            ingest = CameraIngest(camera_id, command['rtsp_url'], buffer=writer, **command.get('options', {}))
+            writer.ingest = ingest
+            cameras[camera_id] = (ingest, writer)
+            ingest.start()
+        elif command.get('command') == 'stop' and camera_id in cameras:
+            ingest, writer = cameras.pop(camera_id)
+            ingest.stop()
+            writer.release()
+        elif command.get('command') == 'reconnect' and camera_id in cameras:
+            cameras[camera_id][0].reconnect()
+
+        emit({'event': 'heartbeat', 'cameras': {
+            str(cid): {'running': ingest.running, 'connected': ingest.connected, 'fps': ingest.fps,
+                       'width': ingest.width, 'height': ingest.height, 'state': ingest.state,
+                       'attempts': ingest.attempts, 'reconnects': ingest.reconnects,
+                       'last_error': ingest.last_error, 'retry_at': ingest.retry_at}
+            for cid, (ingest, _) in cameras.items()
+        }})
+
+    for ingest, writer in cameras.values():
+        ingest.stop()
+        writer.release()
+
+
+class WorkerIngest:
+    """Web-process view of a camera captured by a worker process.
+
+    Has the same attributes as CameraIngest, so recording, streaming and motion
+    detection work unchanged. A reader thread watches the worker's shared
+    memory and appends each new frame to a local FrameBuffer as a view into
+    that memory, so frames are decoded once in the worker and never copied.
+    """
+
+    def __init__(self, pool, camera_id, rtsp_url, buffer_size=60, poll_interval=0.005):
+        self.pool = pool
+        self.camera_id = camera_id
+        self.rtsp_url = rtsp_url
+        self.buffer = FrameBuffer(buffer_size)
+        self.poll_interval = poll_interval
+        self.running = False
+        self.connected = False
+        self.state = 'stopped'
+        self.attempts = 0
+        self.reconnects = 0
+        self.last_error = None
+        self.retry_at = None
+        self.width = 0
+        self.height = 0
+        self.fps = 0
+        self.ring = None
+        # Format events from the pool's reader thread, applied by _read
+        self.formats = queue.Queue()
+        self.thread = None
+        self.frames_metric = FRAMES_CAPTURED.labels(camera_id)
+        self.dropped_metric = FRAMES_DROPPED.labels(camera_id, 'transport')
+
+    def start(self):
+        """Ask the camera's worker to start capturing and start the reader thread"""
+        if self.running:
+            return
+        self.running = True
+        self.state = 'connecting'
+        self.pool.attach(self)
+        self.thread = threading.Thread(target=self._read, daemon=True)
+        self.thread.start()
+        logger.info(f"Started worker ingest for camera {self.camera_id}")
+
+    def stop(self):
+        """Stop capturing and wake up consumers"""
+        self.running = False
+        self.state = 'stopped'
+        self.pool.detach(self)
+        self.buffer.close()
+        if self.thread and self.thread is not threading.current_thread():
+            self.thread.join(timeout=5)
+        logger.info(f"Stopped worker ingest for camera {self.camera_id}")
+
+    def reconnect(self):
+        """Ask the worker to reconnect to the camera"""
+        self.pool.reconnect(self)
+
+    def on_format(self, name, shape, slots, fps):
+        """Called by the pool when the worker (re)allocated the camera's shared memory"""
+        # Set before the first frame shows up, consumers size their writers from these
+        self.height, self.width = shape[:2]
+        self.fps = fps
+        self.connected = True
+        self.formats.put((name, shape, slots))
+
+    def on_status(self, status):
+        """Called by the pool with the camera's state from the worker heartbeat"""
+        self.connected = status['connected']
+        self.fps = status['fps']
+        self.width = status['width']
+        self.height = status['height']
+        if status['reconnects'] > self.reconnects:
+            RECONNECTS.labels(self.camera_id).inc(status['reconnects'] - self.reconnects)
+        for name in ('state', 'attempts', 'reconnects', 'last_error', 'retry_at'):
+            setattr(self, name, status[name])
+        if not status['running'] and self.running:
+            # The worker's ingest gave up on the camera, same as a local ingest would
+            logger.error(f"Worker ingest for camera {self.camera_id} stopped")
+            self.running = False
+            self.buffer.close()
+
+    def _newest_format(self):
+        # Earlier events describe rings the worker has already replaced
+        newest = None
+        while True:
+            try:
+                newest = self.formats.get_nowait()
+            except queue.Empty:
+                return newest
+
+    def _read(self):
+        last_seq = 0
+        try:
+            while self.running:
+                pending = self._newest_format()
+                if pending is not None:
+                    name, shape, slots = pending
+                    if self.ring is not None:
+                        self.ring.close()
+                    self.ring = FrameRing(shape, slots, name=name)
+                    last_seq = 0
+
+                latest = self.ring.latest_seq() if self.ring is not None else 0
+                if latest <= last_seq:
+                    time.sleep(self.poll_interval)
+                    continue
+                # Hand every frame still held in shared memory to the local buffer, in order
+                first_seq = max(last_seq + 1, latest - self.ring.slots + 2)
+                if last_seq and first_seq > last_seq + 1:
+                    self.dropped_metric.inc(first_seq - last_seq - 1)
+                for seq in range(first_seq, latest + 1):
+                    entry = self.ring.entry(seq)
+                    if entry is not None:
+                        # The worker may be several frames ahead of this poller; consumers
+                        # re-check the slot against seq after copying (FrameBuffer.intact)
+                        self.buffer.put_view(entry[1], entry[0], self.ring, seq)
+                        self.frames_metric.inc()
+                    else:
+                        self.dropped_metric.inc()
+                last_seq = latest
+
+        except Exception as e:
+            logger.error(f"Error reading frames for camera {self.camera_id}: {str(e)}")
+
+        finally:
+            if self.ring is not None:
+                self.ring.close()
+                self.ring = None
+
+
+class CaptureWorkerPool:
+    """Pool of capture worker processes, with cameras sharded across them.
+
+    Each worker is a separate Python process, so decoding and frame handling
+    for many cameras no longer contend on the web process's GIL. Camera i is
+    always assigned to worker i % num_workers. A supervisor thread restarts
+    workers that exit or stop sending heartbeats and restarts their cameras.
+    """
+
+    def __init__(self, num_workers=None, slots=60, heartbeat_timeout=10, ingest_options=None):
+        self.num_workers = num_workers or os.cpu_count() or 1
+        self.slots = slots
+        self.heartbeat_timeout = heartbeat_timeout
+        # Keyword arguments for the workers' CameraIngests: retry_initial, retry_max, read_timeout
+        self.ingest_options = ingest_options or {}
+        self.processes = [None] * self.num_workers
+        self.heartbeats = [0] * self.num_workers
+        self.restarts = [0] * self.num_workers
+        self.ingests = {}
+        self.lock = threading.Lock()
+        self.running = False
+        self.supervisor = None
+
+    def start(self):
+        """Start all workers and the supervisor thread"""
+        if self.running:
+            return
+        self.running = True
+        for index in range(self.num_workers):
+            self._start_worker(index)
+        self.supervisor = threading.Thread(target=self._supervise, daemon=True)
+        self.supervisor.start()
+        logger.info(f"Started {self.num_workers} capture workers")
+
+    def stop(self):
+        """Stop all workers"""
+        self.running = False
+        for process in self.processes:
+            if process is not None and process.poll() is None:
+                process.stdin.close()
+                try:
+                    process.wait(timeout=5)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+
+    def _worker_index(self, camera_id):
+        # Substream ingests ("<id>-sub") live on the same worker as their camera
+        return int(str(camera_id).split('-')[0]) % self.num_workers
+
+    def _start_worker(self, index):
+        process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), '--slots', str(self.slots)],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            text=True,
+            bufsize=1,
+            # Workers log to the inherited stderr; several processes must not rotate logs/nvr.log
+            env=dict(os.environ, NVR_LOG_FILE='')
+        )
+        self.processes[index] = process
+        self.heartbeats[index] = time.time()
+        threading.Thread(target=self._read_events, args=(index, process), daemon=True).start()
+        # Resume the cameras this worker was capturing before it was restarted
+        with self.lock:
+            ingests = [i for i in self.ingests.values() if self._worker_index(i.camera_id) == index]
+        for ingest in ingests:
+            self._send(ingest.camera_id, {'command': 'start', 'camera_id': ingest.camera_id,
+                                          'rtsp_url': ingest.rtsp_url, 'options': self.ingest_options})
+
+    def _send(self, camera_id, command):
+        process = self.processes[self._worker_index(camera_id)]
+        try:
+            process.stdin.write(json.dumps(command) + '\n')
+            process.stdin.flush()
+        except (OSError, ValueError) as e:
+            # The supervisor will restart the worker and resend its cameras
+            logger.error(f"Could not send command to capture worker for camera {camera_id}: {str(e)}")
+
+    def _read_events(self, index, process):
+        for line in process.stdout:
+            try:
+                message = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            self.heartbeats[index] = time.time()
+            if message['event'] == 'format':
+                ingest = self.ingests.get(message['camera_id'])
+                if ingest is not None:
+                    ingest.on_format(message['name'], message['shape'], message['slots'], message['fps'])
+            elif message['event'] == 'heartbeat':
+                for ingest in list(self.ingests.values()):
+                    status = message['cameras'].get(str(ingest.camera_id))
+                    if status is not None:
+                        ingest.on_status(status)
+
+    def _supervise(self):
+        while self.running:
+            time.sleep(1)
+            for index, process in enumerate(self.processes):
+                if not self.running:
+                    break
+                if process.poll() is None and time.time() - self.heartbeats[index] < self.heartbeat_timeout:
+                    continue
+                if process.poll() is None:
+                    logger.error(f"Capture worker {index} stopped responding, killing it")
+                    process.kill()
+                    process.wait()
+                self.restarts[index] += 1
+                logger.error(f"Capture worker {index} exited with code {process.returncode}, restarting "
+                             f"(restart {self.restarts[index]})")
+                self._start_worker(index)
+
+    def create_ingest(self, camera_id, rtsp_url, buffer_size=60):
+        """Return a new (not yet started) ingest for a camera captured by this pool.
+
+        The local buffer must match the shared ring, so buffer_size is ignored
+        in favour of the pool's slot count.
+        """
+        return WorkerIngest(self, camera_id, rtsp_url, self.slots)
+
+    def attach(self, ingest):
+        """Start capturing a camera in its worker on behalf of a WorkerIngest"""
+        with self.lock:
+            self.ingests[ingest.camera_id] = ingest
+        self._send(ingest.camera_id, {'command': 'start', 'camera_id': ingest.camera_id,
+                                      'rtsp_url': ingest.rtsp_url, 'options': self.ingest_options})
+
+    def reconnect(self, ingest):
+        """Make a camera's worker drop and reopen its connection"""
+        self._send(ingest.camera_id, {'command': 'reconnect', 'camera_id': ingest.camera_id})
+
+    def detach(self, ingest):
+        """Stop capturing a camera in its worker"""
+        with self.lock:
+            if self.ingests.get(ingest.camera_id) is ingest:
+                del self.ingests[ingest.camera_id]
+        self._send(ingest.camera_id, {'command': 'stop', 'camera_id': ingest.camera_id})
+
+    def get_status(self):
+        """Return pid, liveness, restart count and cameras of every worker"""
+        return [{
+            'worker': index,
+            'pid': process.pid if process else None,
+            'alive': process is not None and process.poll() is None,
+            'restarts': self.restarts[index],
+            'cameras': sorted(cid for cid in self.ingests if self._worker_index(cid) == index)
+        } for index, process in enumerate(self.processes)]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Capture worker process (started by CaptureWorkerPool)")
+    parser.add_argument('--slots', type=int, default=60)
+    args = parser.parse_args()
+    run_worker(args.slots)
@@ -0,0 +1,88 @@
+import time
+import numpy as np
+from multiprocessing import resource_tracker, shared_memory
+
+class FrameRing:
+    """Fixed number of preallocated raw frame slots with a (sequence, timestamp) table.
+
+    Frame seq lives in slot seq % slots. The memory is allocated once, either
+    privately or as a named multiprocessing.shared_memory segment that other
+    processes can attach to, and frames are decoded or copied straight into
+    it, so steady-state capture allocates nothing per frame.
+
+    Layout: a float64 table of (sequence, timestamp) rows - row 0 describes
+    the newest frame and row i + 1 describes slot i - followed by the slots.
+    A slot's row is zeroed while the slot is being written, so a reader can
+    tell whether a frame was overwritten under it.
+    """
+
+    def __init__(self, shape, slots, shared=False, name=None):
+        self.shape = tuple(shape)
+        self.slots = slots
+        table_size = (slots + 1) * 2 * 8
+        size = table_size + int(np.prod(self.shape)) * slots
+        self.shm = None
+        if shared or name is not None:
+            self.shm = shared_memory.SharedMemory(name=name, create=name is None, size=size if name is None else 0)
+            if name is not None:
+                # The writer owns the segment; keep this process's tracker from unlinking it on exit
+                resource_tracker.unregister(self.shm._name, 'shared_memory')
+            buf = self.shm.buf
+        else:
+            # np.empty leaves pages untouched until a frame is written into them
+            buf = np.empty(size, dtype=np.uint8)
+        self.name = self.shm.name if self.shm is not None else None
+        self.table = np.ndarray((slots + 1, 2), dtype=np.float64, buffer=buf)
+        self.frames = np.ndarray((slots,) + self.shape, dtype=np.uint8, buffer=buf, offset=table_size)
+        if name is None:
+            self.table[:] = 0
+
+    def latest_seq(self):
+        return int(self.table[0, 0])
+
+    def slot(self, seq):
+        """Return the (writable) view of the slot that frame seq is stored in"""
+        return self.frames[seq % self.slots]
+
+    def begin(self, seq):
+        """Mark frame seq's slot as being written and return its view"""
+        self.table[seq % self.slots + 1] = 0
+        return self.slot(seq)
+
+    def commit(self, seq, timestamp=None):
+        """Publish frame seq once its slot has been written"""
+        timestamp = timestamp or time.time()
+        self.table[seq % self.slots + 1] = (seq, timestamp)
+        self.table[0] = (seq, timestamp)
+        return timestamp
+
+    def write(self, frame):
+        """Copy a frame into the next slot and return its sequence number"""
+        seq = self.latest_seq() + 1
+        np.copyto(self.begin(seq), frame)
+        self.commit(seq)
+        return seq
+
+    def entry(self, seq):
+        """Return (timestamp, view) for seq, or None if the slot no longer holds it.
+
+        The view is not a copy: it stays valid until the writer gets around
+        to the same slot again, slots - 1 frames later.
+        """
+        row = self.table[seq % self.slots + 1]
+        if row[0] != seq:
+            return None
+        return float(row[1]), self.slot(seq)
+
+    def close(self, unlink=False):
+        """Release the mapping; views handed out earlier must no longer be used"""
+        self.table = None
+        self.frames = None
+        if self.shm is not None:
+            try:
+                self.shm.close()
+            except BufferError:
+                # Consumers still hold frames from this ring; the mapping goes away with them
+                pass
+            if unlink:
+                self.shm.unlink()
@@ -0,0 +1,240 @@
+import os
+import shutil
+import subprocess
+import threading
+import time
+from collections import deque
+from broadcast import FrameBroadcaster
+from logger import logger
+from metrics import metrics
+from mp4_utils import fragment_starts_with_keyframe, read_box, video_codec_string
+
+LIVE_VIEWERS = metrics.gauge('nvr_live_viewers', "Connected live viewers", ['camera', 'stream'])
+
+class LiveFmp4Stream:
+    """One ffmpeg process repackaging a camera's stream into fragmented MP4, shared by all viewers.
+
+    The camera's H.264/H.265 packets are copied, never decoded. ffmpeg cuts a
+    fragment at every keyframe and at least every `fragment_duration`
+    seconds; each fragment (moof + mdat) is published once through a
+    FrameBroadcaster. Viewers get the init segment first and then start at
+    the next fragment that begins with a keyframe.
+    """
+
+    def __init__(self, camera_id, rtsp_url, ffmpeg_path="ffmpeg", fragment_duration=0.5):
+        self.camera_id = camera_id
+        self.rtsp_url = rtsp_url
+        self.ffmpeg_path = ffmpeg_path
+        self.fragment_duration = fragment_duration
+        self.broadcaster = FrameBroadcaster()
+        self.init_segment = None
+        self.codec = None
+        self.ready = threading.Event()
+        self.idle_since = time.time()
+        self.running = False
+        self.process = None
+        self.thread = None
+
+    def _build_command(self):
+        command = [self.ffmpeg_path, '-hide_banner', '-loglevel', 'error']
+        if self.rtsp_url.startswith('rtsp://'):
+            command += ['-rtsp_transport', 'tcp']
+        elif os.path.isfile(self.rtsp_url):
+            # Local test files stand in for cameras; read them at their native rate
+            command += ['-re']
+        command += [
+            '-fflags', 'nobuffer',
+            '-i', self.rtsp_url,
+            '-map', '0:v:0',
+            '-c', 'copy',
+            '-f', 'mp4',
+            '-movflags', 'frag_keyframe+empty_moov+default_base_moof',
+            '-frag_duration', str(int(self.fragment_duration * 1000000)),
+            'pipe:1'
+        ]
+        return command
+
+    def start(self):
+        """Start ffmpeg and the reader thread"""
+        if self.running:
+            return
+        self.running = True
+        self.process = subprocess.Popen(
+            self._build_command(),
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE
+        )
+        self.thread = threading.Thread(target=self._read, daemon=True)
+        self.thread.start()
+        logger.info(f"Started live fMP4 stream for camera {self.camera_id} (pid {self.process.pid})")
+
+    def stop(self):
+        """Stop ffmpeg and wake up all viewers"""
+        self.running = False
+        if self.process is not None and self.process.poll() is None:
+            self.process.kill()
+        self.broadcaster.close()
+        self.ready.set()
+        if self.thread and self.thread is not threading.current_thread():
+            self.thread.join(timeout=5)
+
+    def _read(self):
+        """Split ffmpeg's output into the init segment and moof + mdat fragments"""
+        errors = deque(maxlen=20)
+        threading.Thread(target=lambda: errors.extend(self.process.stderr), daemon=True).start()
+        header = []
+        moof = None
+        try:
+            while self.running:
+                box = read_box(self.process.stdout)
+                if box is None:
+                    break
+                box_type, data = box
+                if self.init_segment is None:
+                    header.append(data)
+                    if box_type == b'moov':
+                        self.init_segment = b''.join(header)
+                        self.codec = video_codec_string(data)
+                        self.ready.set()
+                elif box_type == b'moof':
+                    moof = data
+                elif box_type == b'mdat' and moof is not None:
+                    self.broadcaster.publish((b''.join((moof, data)), fragment_starts_with_keyframe(moof)))
+                    moof = None
+
+        except Exception as e:
+            logger.error(f"Error reading live fMP4 stream for camera {self.camera_id}: {str(e)}")
+
+        finally:
+            if self.running and errors:
+                logger.error(f"ffmpeg live stream for camera {self.camera_id} failed: "
+                             f"{b''.join(errors).decode(errors='replace').strip()}")
+            self.running = False
+            self.broadcaster.close()
+            self.ready.set()
+            if self.process.poll() is None:
+                self.process.kill()
+            self.process.wait()
+            logger.info(f"Live fMP4 stream stopped for camera {self.camera_id}")
+
+    def generate(self):
+        """Yield the init segment followed by fragments, starting at a keyframe"""
+        self.broadcaster.subscribe()
+        try:
+            yield self.init_segment
+            last_seq = 0
+            need_keyframe = True
+            while True:
+                result = self.broadcaster.wait(last_seq, timeout=10)
+                if result is None:
+                    if self.broadcaster.closed:
+                        return
+                    continue
+
+                seq, (fragment, keyframe) = result
+                # A viewer that missed a fragment has to wait for the next keyframe
+                if seq != last_seq + 1:
+                    need_keyframe = True
+                last_seq = seq
+                if need_keyframe and not keyframe:
+                    continue
+                need_keyframe = False
+                yield fragment
+        finally:
+            self.broadcaster.unsubscribe()
+
+    async def generate_async(self):
+        """Async generator version of generate() for the ASGI server"""
+        self.broadcaster.subscribe()
+        try:
+            yield self.init_segment
+            last_seq = 0
+            need_keyframe = True
+            while True:
+                result = await self.broadcaster.wait_async(last_seq, timeout=10)
+                if result is None:
+                    if self.broadcaster.closed:
+                        return
+                    continue
+
+                seq, (fragment, keyframe) = result
+                if seq != last_seq + 1:
+                    need_keyframe = True
+                last_seq = seq
+                if need_keyframe and not keyframe:
+                    continue
+                need_keyframe = False
+                yield fragment
+        finally:
+            self.broadcaster.unsubscribe()
+
+
+class LiveFmp4Handler:
+    """Per-camera live fMP4 streams, started on demand and stopped when idle"""
+
+    def __init__(self, ffmpeg_path="ffmpeg", fragment_duration=0.5, idle_timeout=30):
+        self.ffmpeg_path = ffmpeg_path
+        self.fragment_duration = fragment_duration
+        self.idle_timeout = idle_timeout
+        self.streams = {}
+        self.lock = threading.Lock()
+        self.running = False
+        self.thread = None
+        LIVE_VIEWERS.add_function(self._viewer_counts)
+
+    def _viewer_counts(self):
+        # Substream keys look like "1-sub"
+        counts = {}
+        for key, stream in list(self.streams.items()):
+            camera, _, source = str(key).partition('-')
+            counts[(camera, 'fmp4-' + source if source else 'fmp4')] = stream.broadcaster.subscribers
+        return counts
+
+    def start(self):
+        """Start the thread that stops streams nobody watches"""
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._reap_idle_streams, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Stop all streams"""
+        self.running = False
+        for key in list(self.streams):
+            self.stop_stream(key)
+
+    def available(self):
+        """Return True if ffmpeg can be found"""
+        return shutil.which(self.ffmpeg_path) is not None
+
+    def start_stream(self, key, rtsp_url, timeout=10):
+        """Return a running stream whose init segment is ready, or None"""
+        with self.lock:
+            stream = self.streams.get(key)
+            if stream is None or not stream.running:
+                stream = LiveFmp4Stream(key, rtsp_url, self.ffmpeg_path, self.fragment_duration)
+                self.streams[key] = stream
+                stream.start()
+        if not stream.ready.wait(timeout) or stream.init_segment is None:
+            return None
+        return stream
+
+    def stop_stream(self, key):
+        """Stop a camera's live fMP4 stream"""
+        with self.lock:
+            stream = self.streams.pop(key, None)
+        if stream is not None:
+            stream.stop()
+
+    def _reap_idle_streams(self):
+        while self.running:
+            time.sleep(5)
+            now = time.time()
+            for key, stream in list(self.streams.items()):
+                if stream.broadcaster.subscribers > 0:
+                    stream.idle_since = now
+                elif not stream.running or now - stream.idle_since > self.idle_timeout:
+                    logger.info(f"No viewers for live fMP4 stream {key}, stopping it")
+                    self.stop_stream(key)
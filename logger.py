@@ -1,31 +1,234 @@
+import atexit
+import json
 import logging
-from logging.handlers import RotatingFileHandler
+from logging.handlers import QueueHandler, RotatingFileHandler
 import os
+import queue
+import re
+import threading
+import time
+from datetime import datetime
+from metrics import metrics
 
-def setup_logger():
-    """Configure and return a logger instance"""
-    # Create logs directory if it doesn't exist
-    if not os.path.exists('logs'):
-        os.makedirs('logs')
+# Any thread that logs can hit a full queue
+LOG_SUPPRESSED = metrics.counter('nvr_log_messages_suppressed_total', "Log messages dropped by the rate limiter or a full log queue", ['reason'], shared=True)
 
+# Most messages name their camera as "camera 3" or "camera 3-sub"
+CAMERA_PATTERN = re.compile(r'\bcamera (\d+(?:-sub)?)\b')
+
+class _BatchFlush:
+    """Handler mixin: emit() only writes, the listener flushes once per batch"""
+
+    def flush(self):
+        pass
+
+    def flush_batch(self):
+        super().flush()
+
+
+class BatchStreamHandler(_BatchFlush, logging.StreamHandler):
+    pass
+
+
+class BatchRotatingFileHandler(_BatchFlush, RotatingFileHandler):
+    pass
+
+
+class RateLimitFilter(logging.Filter):
+    """Lets at most `burst` copies of the same message per `window` seconds through.
+
+    A camera that keeps failing logs the same error from the same line on
+    every retry; after the first few, the rest of the window is counted
+    instead of written, and the next copy that gets through says how many
+    were suppressed. Messages that differ (another camera, another
+    segment) are counted separately. Critical messages are never suppressed.
+    """
+
+    def __init__(self, burst=5, window=60):
+        super().__init__()
+        self.burst = burst
+        self.window = window
+        self.counts = {}
+        self.lock = threading.Lock()
+        self.suppressed_metric = LOG_SUPPRESSED.labels('rate_limit')
+
+    def filter(self, record):
+        match = CAMERA_PATTERN.search(str(record.msg))
+        record.camera = match.group(1) if match else None
+        if record.levelno >= logging.CRITICAL or not self.burst:
+            return True
+
+        key = (record.pathname, record.lineno, record.camera, str(record.msg))
+        now = time.time()
+        with self.lock:
+            state = self.counts.get(key)
+            if state is None or now - state[0] >= self.window:
+                suppressed = state[2] if state else 0
+                state = [now, 0, 0]
+                self.counts[key] = state
+                if len(self.counts) > 10000:
+                    self._prune(now)
+            else:
+                suppressed = 0
+            if state[1] >= self.burst:
+                state[2] += 1
+                self.suppressed_metric.inc()
+                return False
+            state[1] += 1
+            if state[2]:
+                suppressed, state[2] = state[2], 0
+        if suppressed:
+            record.msg = f"{record.msg} ({suppressed} similar messages suppressed)"
+            record.suppressed = suppressed
+        return True
+
+    def _prune(self, now):
+        for key in [k for k, state in self.counts.items() if now - state[0] >= self.window]:
+            del self.counts[key]
+
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler that drops and counts records when the queue is full instead of blocking"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped_metric = LOG_SUPPRESSED.labels('queue_full')
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped_metric.inc()
+
+
+class BatchQueueListener:
+    """Writes queued records to the handlers in batches from a single background thread.
+
+    Everything waiting in the queue (up to batch_size records) is written
+    before the handlers are flushed, so a burst of messages costs one flush
+    instead of one per message.
+    """
+
+    def __init__(self, log_queue, handlers, batch_size=500):
+        self.queue = log_queue
+        self.handlers = handlers
+        self.batch_size = batch_size
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        """Start the writer thread"""
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name='log-writer', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Write what is still queued and stop the writer thread"""
+        if not self.running:
+            return
+        self.running = False
+        self.queue.put(None)
+        self.thread.join(timeout=5)
+
+    def _run(self):
+        while True:
+            record = self.queue.get()
+            batch = [record]
+            while record is not None and len(batch) < self.batch_size:
+                try:
+                    record = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                batch.append(record)
+            self._write([r for r in batch if r is not None])
+            if batch[-1] is None:
+                return
+
+    def _write(self, batch):
+        for handler in self.handlers:
+            for record in batch:
+                if record.levelno >= handler.level:
+                    handler.handle(record)
+            try:
+                handler.flush_batch()
+            except Exception:
+                pass
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, for log shippers"""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage()
+        }
+        if getattr(record, 'camera', None) is not None:
+            entry['camera'] = record.camera
+        if getattr(record, 'suppressed', None):
+            entry['suppressed'] = record.suppressed
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry)
+
+
+TEXT_FORMAT = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+_handlers = []
+_rate_limit = RateLimitFilter()
+
+def setup_logger(log_file='logs/nvr.log'):
+    """Configure and return a logger instance.
+
+    Log calls only put the record on a bounded queue; a single writer thread
+    formats and writes them to the console and log_file, so disk
+    writes and log rotation never happen in a capture thread. Without a
+    log_file only the console (stderr) is written.
+    """
     # Create logger
     logger = logging.getLogger('nvr')
     logger.setLevel(logging.INFO)
 
     # Create handlers
-    console_handler = logging.StreamHandler()
-    file_handler = RotatingFileHandler('logs/nvr.log', maxBytes=1024*1024, backupCount=5)
-    
-    # Create formatters and add it to handlers
-    log_format = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-    console_handler.setFormatter(log_format)
-    file_handler.setFormatter(log_format)
-    
-    # Add handlers to the logger
-    logger.addHandler(console_handler)
-    logger.addHandler(file_handler)
-    
+    console_handler = BatchStreamHandler()
+    console_handler.setFormatter(TEXT_FORMAT)
+    _handlers.append(console_handler)
+    if log_file:
+        # Create logs directory if it doesn't exist
+        log_dir = os.path.dirname(log_file)
+        if log_dir and not os.path.exists(log_dir):
+            os.makedirs(log_dir)
+        file_handler = BatchRotatingFileHandler(log_file, maxBytes=1024*1024, backupCount=5)
+        file_handler.setFormatter(TEXT_FORMAT)
+        _handlers.append(file_handler)
+
+    # Callers only enqueue; the listener thread does the I/O
+    log_queue = queue.Queue(maxsize=10000)
+    queue_handler = DroppingQueueHandler(log_queue)
+    queue_handler.addFilter(_rate_limit)
+    logger.addHandler(queue_handler)
+
+    listener = BatchQueueListener(log_queue, _handlers)
+    listener.start()
+    # Registered first, so it runs last and writes the messages of other exit handlers
+    atexit.register(listener.stop)
+
     return logger
 
-# Create a global logger instance
-logger = setup_logger()
\ No newline at end of file
+def configure_logger(log_format='text', burst=5, window=60):
+    """Apply the log settings from config.json: "text" or "json" output and the repeat limit"""
+    formatter = JsonFormatter() if log_format == 'json' else TEXT_FORMAT
+    for handler in _handlers:
+        handler.setFormatter(formatter)
+    _rate_limit.burst = burst
+    _rate_limit.window = window
+
+# Create a global logger instance; capture workers set NVR_LOG_FILE to ""
+# so that only the web process writes and rotates the log file
+logger = setup_logger(os.environ.get('NVR_LOG_FILE', 'logs/nvr.log'))
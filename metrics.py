@@ -0,0 +1,218 @@
+import bisect
+import math
+import threading
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+
+class _CounterChild:
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+
+class _SharedCounterChild(_CounterChild):
+    def __init__(self):
+        super().__init__()
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+
+class _GaugeChild:
+    def __init__(self):
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+
+class _HistogramChild:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metric:
+    """A named metric with one child per combination of label values.
+
+    Children are plain Python objects. Most are written by a single thread
+    (a camera's capture, encoder or recording thread), so they are updated
+    without a lock and an increment costs about as much as an attribute
+    update. Counters that several threads increment (recorded bytes,
+    segment closes, log drops) are created with shared=True and take a lock
+    on every update. Keep the child returned by labels() instead of looking
+    it up on every frame.
+    """
+
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.children = {}
+        self.functions = []
+        self.lock = threading.Lock()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        """Return the child for these label values, creating it on first use"""
+        key = tuple(str(value) for value in values)
+        child = self.children.get(key)
+        if child is None:
+            with self.lock:
+                child = self.children.setdefault(key, self._new_child())
+        return child
+
+    def remove(self, *values):
+        """Forget the child for these label values, e.g. for a deleted camera"""
+        with self.lock:
+            self.children.pop(tuple(str(value) for value in values), None)
+
+    def add_function(self, function):
+        """Add a callable returning {label values tuple: value}, evaluated at collection time.
+
+        Values that are already known elsewhere (viewer counts, measured
+        frame rates) are read when the metrics are collected instead of
+        being updated on the hot path.
+        """
+        self.functions.append(function)
+
+    def collect(self):
+        """Return a list of (label values, child or value) pairs"""
+        samples = list(self.children.items())
+        for function in self.functions:
+            samples.extend((tuple(str(v) for v in key), value) for key, value in function().items())
+        return samples
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def __init__(self, name, documentation, labelnames=(), shared=False):
+        super().__init__(name, documentation, labelnames)
+        self.shared = shared
+
+    def _new_child(self):
+        return _SharedCounterChild() if self.shared else _CounterChild()
+
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def _new_child(self):
+        return _GaugeChild()
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    escaped = (v.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+class MetricsRegistry:
+    """All metrics of the process, rendered as Prometheus text or as JSON"""
+
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, documentation, labelnames, **kwargs):
+        # Modules define the metrics they update at import time; a name defined
+        # in two modules refers to the same metric
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = cls(name, documentation, labelnames, **kwargs)
+                self.metrics[name] = metric
+            return metric
+
+    def counter(self, name, documentation, labelnames=(), shared=False):
+        """Return a counter; shared=True for one that several threads increment"""
+        return self._get_or_create(Counter, name, documentation, labelnames, shared=shared)
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._get_or_create(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._get_or_create(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def render_prometheus(self):
+        """Return all metrics in the Prometheus text exposition format"""
+        lines = []
+        for name, metric in sorted(self.metrics.items()):
+            lines.append(f"# HELP {name} {metric.documentation}")
+            lines.append(f"# TYPE {name} {metric.type}")
+            for values, sample in sorted(metric.collect(), key=lambda item: item[0]):
+                if isinstance(metric, Histogram):
+                    cumulative = 0
+                    for bound, count in zip(metric.buckets + (math.inf,), sample.counts):
+                        cumulative += count
+                        labels = _format_labels(metric.labelnames, values, ('le', _format_value(bound)))
+                        lines.append(f"{name}_bucket{labels} {cumulative}")
+                    labels = _format_labels(metric.labelnames, values)
+                    lines.append(f"{name}_sum{labels} {_format_value(sample.sum)}")
+                    lines.append(f"{name}_count{labels} {sample.count}")
+                else:
+                    value = sample if isinstance(sample, (int, float)) else sample.value
+                    lines.append(f"{name}{_format_labels(metric.labelnames, values)} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+    def to_json(self):
+        """Return all metrics as a dict for the health page"""
+        result = {}
+        for name, metric in sorted(self.metrics.items()):
+            samples = []
+            for values, sample in metric.collect():
+                if isinstance(metric, Histogram):
+                    value = {'count': sample.count, 'sum': sample.sum,
+                             'buckets': dict(zip([str(b) for b in metric.buckets] + ['+Inf'], sample.counts))}
+                else:
+                    value = sample if isinstance(sample, (int, float)) else sample.value
+                samples.append({'labels': dict(zip(metric.labelnames, values)), 'value': value})
+            result[name] = {'type': metric.type, 'help': metric.documentation, 'samples': samples}
+        return result
+
+
+# Create a global metrics registry
+metrics = MetricsRegistry()
@@ -0,0 +1,206 @@
+import numpy as np
+import threading
+import time
+from logger import logger
+
+# ITU-R BT.601 luma weights in OpenCV's BGR channel order
+LUMA_WEIGHTS = np.array([0.114, 0.587, 0.299], dtype=np.float32)
+
+class MotionAnalyzer:
+    """Frame differencing against a running-average background on small grayscale frames.
+
+    Frames are downscaled by plain strided slicing (a view, no copy of the
+    full frame) and then 2x2 averaged, so the per-frame cost is independent
+    of the camera resolution and stays well below a millisecond at the
+    default analysis width of 160 pixels.
+    """
+
+    def __init__(self, sensitivity=50, mask=None, analysis_width=160, learning_rate=0.05):
+        sensitivity = min(max(sensitivity, 1), 100)
+        # Higher sensitivity means smaller per-pixel changes and smaller areas count as motion
+        self.pixel_threshold = 10 + (100 - sensitivity) * 0.4
+        self.min_area = 0.001 + (100 - sensitivity) * 0.0002
+        self.mask = mask or []
+        self.analysis_width = analysis_width
+        self.learning_rate = learning_rate
+        self.background = None
+        self.active = None
+        self.active_count = 0
+
+    def _prepare(self, frame):
+        """Return the frame as a small float32 grayscale image"""
+        step = max(frame.shape[1] // (self.analysis_width * 2), 1)
+        small = frame[::step, ::step]
+        height, width = small.shape[0] // 2 * 2, small.shape[1] // 2 * 2
+        gray = small[:height, :width] @ LUMA_WEIGHTS
+        return gray.reshape(height // 2, 2, width // 2, 2).mean(axis=(1, 3))
+
+    def _build_mask(self, shape):
+        """Boolean array of analysed pixels; mask rectangles are [x, y, w, h] fractions to ignore"""
+        height, width = shape
+        active = np.ones(shape, dtype=bool)
+        for x, y, w, h in self.mask:
+            active[int(y * height):int(round((y + h) * height)), int(x * width):int(round((x + w) * width))] = False
+        return active
+
+    def analyze(self, frame):
+        """Return the fraction of unmasked pixels that changed (0.0 - 1.0)"""
+        gray = self._prepare(frame)
+        if self.background is None or self.background.shape != gray.shape:
+            self.background = gray
+            self.active = self._build_mask(gray.shape)
+            self.active_count = int(self.active.sum())
+            return 0.0
+        if not self.active_count:
+            return 0.0
+
+        changed = np.abs(gray - self.background) > self.pixel_threshold
+        changed &= self.active
+        # Slowly absorb lighting changes and objects that stopped moving
+        self.background += self.learning_rate * (gray - self.background)
+        return float(np.count_nonzero(changed)) / self.active_count
+
+    def is_motion(self, score):
+        return score >= self.min_area
+
+
+class MotionService:
+    """Motion analysis on the shared camera feeds with motion-triggered recording.
+
+    Each enabled camera gets a thread that samples the newest frame from its
+    ingest at `analysis_fps`. When motion starts a motion event is opened in
+    the recordings catalog and recording is started with `pre_roll` seconds
+    of buffered frames; after `post_roll` seconds without motion the event is
+    closed and the recording stopped. Recordings started by hand, or taken
+    over by the supervisor while motion was recording, are never stopped by
+    the motion service.
+    """
+
+    def __init__(self, ingest_manager, video_recorder, camera_manager, supervisor=None):
+        self.ingest_manager = ingest_manager
+        self.video_recorder = video_recorder
+        self.camera_manager = camera_manager
+        self.supervisor = supervisor
+        self.catalog = video_recorder.catalog
+        self.threads = {}
+        self.active = {}
+        self.status = {}
+        self.lock = threading.Lock()
+
+    def start(self):
+        """Start analysis for every camera with motion detection enabled"""
+        for camera in self.camera_manager.list_cameras():
+            if camera.get('enabled', True) and self.camera_manager.get_motion_settings(camera)['enabled']:
+                self.start_camera(camera)
+
+    def stop(self):
+        """Stop analysis for all cameras"""
+        for camera_id in list(self.threads):
+            self.stop_camera(camera_id)
+
+    def start_camera(self, camera):
+        """Start motion analysis for a camera"""
+        camera_id = camera['id']
+        with self.lock:
+            if self.active.get(camera_id):
+                return False
+            self.active[camera_id] = True
+            self.status[camera_id] = {'motion': False, 'score': 0.0, 'event_id': None, 'recording': False}
+            thread = threading.Thread(target=self._analyze_camera, args=(camera,), daemon=True)
+            self.threads[camera_id] = thread
+            thread.start()
+        logger.info(f"Started motion detection for camera {camera_id}")
+        return True
+
+    def stop_camera(self, camera_id):
+        """Stop motion analysis for a camera"""
+        with self.lock:
+            if not self.active.get(camera_id):
+                return False
+            self.active[camera_id] = False
+            thread = self.threads.pop(camera_id, None)
+        if thread:
+            thread.join(timeout=5)
+        logger.info(f"Stopped motion detection for camera {camera_id}")
+        return True
+
+    def get_status(self):
+        """Return the current motion state of every analysed camera"""
+        return {camera_id: dict(status) for camera_id, status in self.status.items()}
+
+    def _end_event(self, camera_id, status, end_time, peak_score):
+        """Close the open motion event and stop the recording it started"""
+        self.catalog.end_motion_event(status['event_id'], end_time, round(peak_score, 4))
+        if status['recording'] and not (self.supervisor and self.supervisor.wants_recording(camera_id)):
+            self.video_recorder.stop_recording(camera_id)
+        status.update(motion=False, event_id=None, recording=False)
+        logger.info(f"Motion ended on camera {camera_id}")
+
+    def _analyze_camera(self, camera):
+        """Motion analysis loop to run in separate thread"""
+        camera_id = camera['id']
+        settings = self.camera_manager.get_motion_settings(camera)
+        analyzer = MotionAnalyzer(
+            sensitivity=settings['sensitivity'],
+            mask=settings['mask'],
+            analysis_width=settings['analysis_width']
+        )
+        interval = 1.0 / settings['analysis_fps']
+        status = self.status[camera_id]
+        ingest = self.ingest_manager.acquire(camera_id, camera['rtsp_url'], 'motion')
+        last_seq = 0
+        last_motion = 0
+        peak_score = 0.0
+
+        try:
+            while self.active.get(camera_id):
+                if ingest.buffer.closed:
+                    # The ingest was stopped under us (e.g. its worker gave up); try again with a fresh one
+                    self.ingest_manager.release(camera_id, 'motion', ingest)
+                    time.sleep(5)
+                    camera = self.camera_manager.get_camera(camera_id) or camera
+                    ingest = self.ingest_manager.acquire(camera_id, camera['rtsp_url'], 'motion')
+                    last_seq = 0
+                    continue
+
+                entry = ingest.buffer.wait_latest(last_seq, timeout=5)
+                if entry is None:
+                    continue
+                last_seq, frame_time, frame = entry
+                if ingest.fps:
+                    # Keep enough decoded frames around for the pre-roll
+                    ingest.buffer.resize(int((settings['pre_roll'] + 1) * ingest.fps))
+
+                started = time.time()
+                score = analyzer.analyze(frame)
+                status['score'] = round(score, 4)
+
+                if analyzer.is_motion(score):
+                    last_motion = frame_time
+                    if status['event_id'] is None:
+                        peak_score = 0.0
+                        status['event_id'] = self.catalog.start_motion_event(camera_id, frame_time)
+                        status['motion'] = True
+                        # start_recording returns False if the camera is already recording by hand
+                        status['recording'] = self.video_recorder.start_recording(
+                            camera_id, camera['rtsp_url'],
+                            mode=camera.get('recording_mode', 'transcode'),
+                            pre_roll=settings['pre_roll']
+                        )
+                        logger.info(f"Motion detected on camera {camera_id} (score {score:.3f})")
+                    peak_score = max(peak_score, score)
+                elif status['event_id'] is not None and frame_time - last_motion >= settings['post_roll']:
+                    self._end_event(camera_id, status, frame_time, peak_score)
+
+                delay = interval - (time.time() - started)
+                if delay > 0:
+                    time.sleep(delay)
+
+        except Exception as e:
+            logger.error(f"Error in motion detection for camera {camera_id}: {str(e)}")
+
+        finally:
+            if status['event_id'] is not None:
+                self._end_event(camera_id, status, time.time(), peak_score)
+            self.ingest_manager.release(camera_id, 'motion', ingest)
+            self.active[camera_id] = False
@@ -0,0 +1,335 @@
+import os
+import struct
+
+def iter_boxes(data, start=0, end=None):
+    """Yield (type, offset, size, header_size) for each box in data[start:end]"""
+    end = len(data) if end is None else end
+    offset = start
+    while offset + 8 <= end:
+        size, box_type = struct.unpack_from('>I4s', data, offset)
+        header_size = 8
+        if size == 1:
+            if offset + 16 > end:
+                return
+            size = struct.unpack_from('>Q', data, offset + 8)[0]
+            header_size = 16
+        elif size == 0:
+            size = end - offset
+        if size < header_size or offset + size > end:
+            return
+        yield box_type, offset, size, header_size
+        offset += size
+
+def find_box(data, path, start=0, end=None):
+    """Return (offset, size, header_size) of the first box matching a path like [b'moov', b'mvhd']"""
+    for box_type, offset, size, header_size in iter_boxes(data, start, end):
+        if box_type != path[0]:
+            continue
+        if len(path) == 1:
+            return offset, size, header_size
+        return find_box(data, path[1:], offset + header_size, offset + size)
+    return None
+
+def read_top_level_boxes(path):
+    """Return [(type, offset, size)] for the top-level boxes of a file without reading payloads"""
+    boxes = []
+    with open(path, 'rb') as f:
+        f.seek(0, 2)
+        file_size = f.tell()
+        offset = 0
+        while offset + 8 <= file_size:
+            f.seek(offset)
+            header = f.read(16)
+            size, box_type = struct.unpack_from('>I4s', header)
+            if size == 1:
+                size = struct.unpack_from('>Q', header, 8)[0]
+            elif size == 0:
+                size = file_size - offset
+            if size < 8:
+                break
+            boxes.append((box_type, offset, size))
+            offset += size
+    return boxes
+
+def read_moov(path):
+    """Return the raw bytes of the moov box, or None if the file has none"""
+    for box_type, offset, size in read_top_level_boxes(path):
+        if box_type == b'moov':
+            with open(path, 'rb') as f:
+                f.seek(offset)
+                return f.read(size)
+    return None
+
+def read_duration(path):
+    """Return the movie duration in seconds from mvhd, or None"""
+    moov = read_moov(path)
+    if moov is None:
+        return None
+    mvhd = find_box(moov, [b'mvhd'], 8)
+    if mvhd is None:
+        return None
+    payload = mvhd[0] + mvhd[2]
+    if moov[payload] == 1:
+        timescale, duration = struct.unpack_from('>IQ', moov, payload + 20)
+    else:
+        timescale, duration = struct.unpack_from('>II', moov, payload + 12)
+    return duration / timescale if timescale else None
+
+def _full_box_entries(data, box):
+    """Return (entry_count, payload_offset) of a full box with a 32-bit entry count"""
+    offset, _, header_size = box
+    return struct.unpack_from('>I', data, offset + header_size + 4)[0], offset + header_size + 8
+
+def _video_sample_table(moov):
+    """Return (timescale, stbl box) for the first video track in a moov box"""
+    for box_type, offset, size, header_size in iter_boxes(moov, 8):
+        if box_type != b'trak':
+            continue
+        hdlr = find_box(moov, [b'mdia', b'hdlr'], offset + header_size, offset + size)
+        if hdlr is None or moov[hdlr[0] + hdlr[2] + 8:hdlr[0] + hdlr[2] + 12] != b'vide':
+            continue
+        mdhd = find_box(moov, [b'mdia', b'mdhd'], offset + header_size, offset + size)
+        stbl = find_box(moov, [b'mdia', b'minf', b'stbl'], offset + header_size, offset + size)
+        if mdhd is None or stbl is None:
+            continue
+        version = moov[mdhd[0] + mdhd[2]]
+        timescale_offset = mdhd[0] + mdhd[2] + (20 if version == 1 else 12)
+        return struct.unpack_from('>I', moov, timescale_offset)[0], stbl
+    return None, None
+
+def read_keyframes(path):
+    """Return [(time_seconds, byte_offset)] for the sync samples of the first video track"""
+    moov = read_moov(path)
+    if moov is None:
+        return []
+    timescale, stbl = _video_sample_table(moov)
+    if not timescale:
+        return []
+    start, end = stbl[0] + stbl[2], stbl[0] + stbl[1]
+
+    # Decode times from stts
+    stts = find_box(moov, [b'stts'], start, end)
+    sample_times = []
+    if stts:
+        count, pos = _full_box_entries(moov, stts)
+        time = 0
+        for i in range(count):
+            sample_count, delta = struct.unpack_from('>II', moov, pos + i * 8)
+            for _ in range(sample_count):
+                sample_times.append(time)
+                time += delta
+
+    # Sample sizes from stsz
+    stsz = find_box(moov, [b'stsz'], start, end)
+    sample_sizes = []
+    if stsz:
+        payload = stsz[0] + stsz[2] + 4
+        uniform_size, sample_count = struct.unpack_from('>II', moov, payload)
+        if uniform_size:
+            sample_sizes = [uniform_size] * sample_count
+        else:
+            sample_sizes = list(struct.unpack_from(f'>{sample_count}I', moov, payload + 8))
+
+    # Chunk offsets from stco/co64
+    chunk_offsets = []
+    stco = find_box(moov, [b'stco'], start, end)
+    co64 = find_box(moov, [b'co64'], start, end)
+    if stco:
+        count, pos = _full_box_entries(moov, stco)
+        chunk_offsets = list(struct.unpack_from(f'>{count}I', moov, pos))
+    elif co64:
+        count, pos = _full_box_entries(moov, co64)
+        chunk_offsets = list(struct.unpack_from(f'>{count}Q', moov, pos))
+
+    # Sample to chunk mapping from stsc
+    stsc = find_box(moov, [b'stsc'], start, end)
+    sample_offsets = []
+    if stsc and chunk_offsets:
+        count, pos = _full_box_entries(moov, stsc)
+        runs = [struct.unpack_from('>III', moov, pos + i * 12) for i in range(count)]
+        sample = 0
+        for i, (first_chunk, samples_per_chunk, _) in enumerate(runs):
+            last_chunk = runs[i + 1][0] - 1 if i + 1 < len(runs) else len(chunk_offsets)
+            for chunk in range(first_chunk - 1, last_chunk):
+                offset = chunk_offsets[chunk]
+                for _ in range(samples_per_chunk):
+                    if sample >= len(sample_sizes):
+                        break
+                    sample_offsets.append(offset)
+                    offset += sample_sizes[sample]
+                    sample += 1
+
+    # Sync samples from stss; without it every sample is a keyframe
+    stss = find_box(moov, [b'stss'], start, end)
+    if stss:
+        count, pos = _full_box_entries(moov, stss)
+        sync_samples = [n - 1 for n in struct.unpack_from(f'>{count}I', moov, pos)]
+    else:
+        sync_samples = range(len(sample_times))
+
+    keyframes = []
+    for sample in sync_samples:
+        if sample < len(sample_times) and sample < len(sample_offsets):
+            keyframes.append((round(sample_times[sample] / timescale, 3), sample_offsets[sample]))
+    return keyframes
+
+CONTAINER_BOXES = (b'moov', b'trak', b'mdia', b'minf', b'stbl')
+
+def _chunk_offset_boxes(data, start, end):
+    """Yield (type, offset, header_size) for every stco/co64 box below a container range"""
+    for box_type, offset, size, header_size in iter_boxes(data, start, end):
+        if box_type in (b'stco', b'co64'):
+            yield box_type, offset, header_size
+        elif box_type in CONTAINER_BOXES:
+            yield from _chunk_offset_boxes(data, offset + header_size, offset + size)
+
+def faststart(path, temp_path=None, preallocate=False):
+    """Move the moov box in front of mdat so playback can start before the whole file loads.
+
+    Chunk offsets in stco/co64 are shifted by the size of the moov box. The
+    file is rewritten to temp_path and renamed over path. Returns True if the
+    file was rewritten and False if it was already fast-start or unsupported.
+    With preallocate, the rewritten file's final size is reserved up front
+    so the filesystem can place it in one extent.
+    """
+    boxes = read_top_level_boxes(path)
+    moov = next((b for b in boxes if b[0] == b'moov'), None)
+    mdat = next((b for b in boxes if b[0] == b'mdat'), None)
+    if moov is None or mdat is None or moov[1] < mdat[1]:
+        return False
+
+    with open(path, 'rb') as f:
+        f.seek(moov[1])
+        moov_data = bytearray(f.read(moov[2]))
+
+    shift = len(moov_data)
+    for box_type, offset, header_size in _chunk_offset_boxes(moov_data, 8, len(moov_data)):
+        count, pos = _full_box_entries(moov_data, (offset, 0, header_size))
+        if box_type == b'stco':
+            offsets = struct.unpack_from(f'>{count}I', moov_data, pos)
+            if offsets and max(offsets) + shift > 0xFFFFFFFF:
+                # Would need an stco -> co64 conversion; leave the file as it is
+                return False
+            struct.pack_into(f'>{count}I', moov_data, pos, *[o + shift for o in offsets])
+        else:
+            offsets = struct.unpack_from(f'>{count}Q', moov_data, pos)
+            struct.pack_into(f'>{count}Q', moov_data, pos, *[o + shift for o in offsets])
+
+    temp_path = temp_path or path + '.faststart'
+    with open(path, 'rb') as src, open(temp_path, 'wb') as dst:
+        if preallocate and hasattr(os, 'posix_fallocate'):
+            try:
+                os.posix_fallocate(dst.fileno(), 0, sum(size for _, _, size in boxes))
+            except OSError:
+                pass
+        for box_type, offset, size in boxes:
+            if box_type == b'mdat' and offset == mdat[1]:
+                dst.write(moov_data)
+            if box_type == b'moov':
+                continue
+            src.seek(offset)
+            remaining = size
+            while remaining:
+                chunk = src.read(min(remaining, 1024 * 1024))
+                if not chunk:
+                    break
+                dst.write(chunk)
+                remaining -= len(chunk)
+    os.replace(temp_path, path)
+    return True
+
+def _read_exact(stream, size):
+    data = b''
+    while len(data) < size:
+        chunk = stream.read(size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return data
+
+def read_box(stream):
+    """Read one complete box from a stream; return (type, bytes) or None at end of stream"""
+    header = _read_exact(stream, 8)
+    if header is None:
+        return None
+    size, box_type = struct.unpack('>I4s', header)
+    if size == 1:
+        extended = _read_exact(stream, 8)
+        if extended is None:
+            return None
+        size = struct.unpack('>Q', extended)[0]
+        header += extended
+    if size < len(header):
+        raise ValueError(f"Invalid size {size} for box {box_type!r}")
+    payload = _read_exact(stream, size - len(header))
+    if payload is None:
+        return None
+    return box_type, header + payload
+
+def video_codec_string(moov):
+    """Return the RFC 6381 codec string (e.g. avc1.64001f) of the first video track, for MSE"""
+    _, stbl = _video_sample_table(moov)
+    if stbl is None:
+        return None
+    stsd = find_box(moov, [b'stsd'], stbl[0] + stbl[2], stbl[0] + stbl[1])
+    if stsd is None:
+        return None
+    entry = stsd[0] + stsd[2] + 8
+    entry_size, sample_format = struct.unpack_from('>I4s', moov, entry)
+    # The codec configuration box follows the 78-byte VisualSampleEntry fields
+    config_start, config_end = entry + 8 + 78, entry + entry_size
+    if sample_format in (b'avc1', b'avc3'):
+        avcc = find_box(moov, [b'avcC'], config_start, config_end)
+        if avcc is None:
+            return sample_format.decode()
+        p = avcc[0] + avcc[2]
+        return f"{sample_format.decode()}.{moov[p + 1]:02x}{moov[p + 2]:02x}{moov[p + 3]:02x}"
+    if sample_format in (b'hvc1', b'hev1'):
+        hvcc = find_box(moov, [b'hvcC'], config_start, config_end)
+        if hvcc is None:
+            return sample_format.decode()
+        p = hvcc[0] + hvcc[2]
+        profile_space, tier, profile_idc = moov[p + 1] >> 6, (moov[p + 1] >> 5) & 1, moov[p + 1] & 0x1f
+        compatibility = int('{:032b}'.format(struct.unpack_from('>I', moov, p + 2)[0])[::-1], 2)
+        constraints = bytes(moov[p + 6:p + 12]).rstrip(b'\x00')
+        codec = (f"{sample_format.decode()}.{['', 'A', 'B', 'C'][profile_space]}{profile_idc}"
+                 f".{compatibility:x}.{'H' if tier else 'L'}{moov[p + 12]}")
+        return codec + ''.join(f".{b:x}" for b in constraints)
+    return sample_format.decode()
+
+def fragment_starts_with_keyframe(moof):
+    """Return True if the first sample of a movie fragment (moof box bytes) is a sync sample"""
+    traf = find_box(moof, [b'traf'], 8)
+    if traf is None:
+        return False
+    tfhd = find_box(moof, [b'tfhd'], traf[0] + traf[2], traf[0] + traf[1])
+    trun = find_box(moof, [b'trun'], traf[0] + traf[2], traf[0] + traf[1])
+    if tfhd is None or trun is None:
+        return False
+
+    p = tfhd[0] + tfhd[2]
+    flags = int.from_bytes(moof[p + 1:p + 4], 'big')
+    p += 8
+    default_flags = None
+    # base-data-offset, sample-description-index, default-duration, default-size
+    for flag, size in ((0x1, 8), (0x2, 4), (0x8, 4), (0x10, 4)):
+        if flags & flag:
+            p += size
+    if flags & 0x20:
+        default_flags = struct.unpack_from('>I', moof, p)[0]
+
+    p = trun[0] + trun[2]
+    flags = int.from_bytes(moof[p + 1:p + 4], 'big')
+    p += 8
+    if flags & 0x1:
+        p += 4
+    if flags & 0x4:
+        sample_flags = struct.unpack_from('>I', moof, p)[0]
+    elif flags & 0x400:
+        # Per-sample flags follow the first sample's optional duration and size
+        p += (4 if flags & 0x100 else 0) + (4 if flags & 0x200 else 0)
+        sample_flags = struct.unpack_from('>I', moof, p)[0]
+    else:
+        sample_flags = default_flags
+    # sample_is_non_sync_sample bit
+    return sample_flags is None or not sample_flags & 0x10000
@@ -1,75 +1,449 @@
 import cv2
+import numpy as np
 import os
-from datetime import datetime
+import queue
+import shutil
+import subprocess
+from collections import deque
+from datetime import datetime, timedelta
 import threading
+from camera_ingest import IngestManager
 from logger import logger
+from metrics import metrics
+from mp4_utils import faststart, read_keyframes
+from recordings_catalog import RecordingsCatalog
 import time
 
+RECORD_WRITE_SECONDS = metrics.histogram('nvr_record_write_seconds', "Time to encode and write one recorded frame", ['camera'])
+RECORD_QUEUE_DEPTH = metrics.gauge('nvr_queue_depth', "Items waiting to be processed", ['queue', 'camera'])
+FRAMES_DROPPED = metrics.counter('nvr_frames_dropped_total', "Frames lost before a consumer got them", ['camera', 'stage'])
+# Segments of one camera can be closed by several background threads at once
+RECORDED_BYTES = metrics.counter('nvr_recorded_bytes_total', "Bytes of closed recording segments", ['camera'], shared=True)
+SEGMENTS_CLOSED = metrics.counter('nvr_segments_closed_total', "Recording segments closed", ['camera'], shared=True)
+
+class SegmentWriter:
+    """Writer stage of a recording: a bounded queue of frames and the thread that encodes them.
+
+    The recording thread copies each frame out of the ingest ring into the
+    queue, because a queued frame may wait longer than the ring keeps it.
+    When the disk stalls, up to max_frames frames wait here and the
+    recording thread blocks after that. Frames beyond that are dropped from
+    the ingest ring and counted, and the capture threads never wait for
+    the disk. Copy buffers are reused, and only the handful needed in
+    steady state are kept, so memory grows only while a backlog exists.
+    """
+
+    GAP = 'gap'
+
+    def __init__(self, recorder, camera_id, max_frames=60):
+        self.recorder = recorder
+        self.camera_id = camera_id
+        self.frames = queue.Queue(maxsize=max_frames)
+        self.spare = []
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.depth_metric = RECORD_QUEUE_DEPTH.labels('record_write', camera_id)
+        self.overwritten_metric = FRAMES_DROPPED.labels(camera_id, 'overwritten')
+
+    def start(self):
+        """Start the writer thread"""
+        self.thread.start()
+
+    def _put(self, item):
+        # Wait while the queue is full, but not for a writer that died or a recording that was stopped
+        while self.thread.is_alive():
+            try:
+                self.frames.put(item, timeout=1)
+                return True
+            except queue.Full:
+                if item is not None and not self.recorder.active_recordings.get(self.camera_id):
+                    return False
+        return False
+
+    def write(self, timestamp, frame, fps, source=None, seq=None):
+        """Queue a copy of a frame; returns False if the writer is gone.
+
+        With the FrameBuffer and sequence the frame came from, a copy the
+        capture thread overwrote while it was being made is dropped.
+        """
+        buffer = self.spare.pop() if self.spare else None
+        if buffer is None or buffer.shape != frame.shape:
+            buffer = np.empty_like(frame)
+        np.copyto(buffer, frame)
+        if source is not None and not source.intact(seq):
+            self.spare.append(buffer)
+            self.overwritten_metric.inc()
+            return True
+        if not self._put((timestamp, buffer, fps)):
+            return False
+        # Measured here: while the disk stalls the writer thread cannot report anything
+        self.depth_metric.set(self.frames.qsize())
+        return True
+
+    def gap(self):
+        """Close the open segment; frames after a gap start a new one"""
+        self._put(self.GAP)
+
+    def close(self):
+        """Let the writer finish the queued frames and close the last segment"""
+        self._put(None)
+
+    def _run(self):
+        camera_id = self.camera_id
+        recorder = self.recorder
+        writer = None
+        segment = None
+        frame_size = None
+        fps = None
+        synced_at = time.time()
+        write_metric = RECORD_WRITE_SECONDS.labels(camera_id)
+        try:
+            while True:
+                item = self.frames.get()
+                if item is None:
+                    break
+                if item == self.GAP:
+                    if writer is not None:
+                        threading.Thread(target=recorder._close_segment, args=(writer, segment), daemon=True).start()
+                        writer = None
+                    continue
+
+                timestamp, frame, frame_fps = item
+                # Roll over to a new segment on the frame boundary, after a gap
+                # or when the camera came back with another resolution; the
+                # previous one is closed in the background so no frames wait
+                if (writer is None or timestamp - segment['start_time'] >= recorder.segment_duration
+                        or frame.shape[:2] != frame_size):
+                    previous = (writer, segment)
+                    frame_size = frame.shape[:2]
+                    fps = frame_fps
+                    writer, segment = recorder._open_segment(camera_id, timestamp, fps, (frame_size[1], frame_size[0]))
+                    if previous[0] is not None:
+                        threading.Thread(target=recorder._close_segment, args=previous, daemon=True).start()
+
+                write_started = time.perf_counter()
+                writer.write(frame)
+                write_metric.observe(time.perf_counter() - write_started)
+                segment['end_time'] = timestamp + 1.0 / fps
+                if len(self.spare) < 4:
+                    self.spare.append(frame)
+
+                if recorder.fsync == 'interval' and time.time() - synced_at >= recorder.fsync_interval:
+                    # Bounds how much of the open segment a power cut can lose
+                    recorder._sync_file(recorder._temp_path(segment['filename']))
+                    synced_at = time.time()
+
+        except Exception as e:
+            logger.error(f"Error writing recording of camera {camera_id}: {str(e)}")
+        finally:
+            if writer is not None:
+                recorder._close_segment(writer, segment)
+            self.depth_metric.set(0)
+
+
 class VideoRecorder:
-    def __init__(self, storage_dir="./recordings"):
+    RECORDING_MODES = ('transcode', 'passthrough')
+    FSYNC_POLICIES = ('none', 'segment', 'interval')
+
+    def __init__(self, storage_dir="./recordings", ingest_manager=None,
+                 ffmpeg_path="ffmpeg", segment_duration=60, write_queue_frames=60,
+                 fsync='segment', fsync_interval=5, preallocate=False):
         self.storage_dir = storage_dir
+        self.ingest_manager = ingest_manager or IngestManager()
+        self.ffmpeg_path = ffmpeg_path
+        self.segment_duration = segment_duration
+        self.write_queue_frames = write_queue_frames
+        if fsync not in self.FSYNC_POLICIES:
+            raise ValueError(f"Unknown fsync policy: {fsync}")
+        # "none" leaves flushing to the OS, "segment" syncs every closed
+        # segment before it is published, "interval" also syncs the open
+        # segment every fsync_interval seconds
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.preallocate = preallocate
         self.active_recordings = {}
         self.recording_threads = {}
+        self.recording_processes = {}
+        self.segment_writers = {}
+        self.open_segments = set()
+        self.segments_lock = threading.Lock()
+        self.closed_listeners = []
+        self.deleted_listeners = []
         
         # Create storage directory if it doesn't exist
         if not os.path.exists(storage_dir):
             os.makedirs(storage_dir)
 
-    def _generate_filename(self, camera_id):
-        """Generate filename based on current timestamp"""
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        self.catalog = RecordingsCatalog(storage_dir)
+        self._discard_incomplete_segments()
+        if self.catalog.is_new:
+            self.catalog.reconcile()
+
+    def _generate_filename(self, camera_id, timestamp=None):
+        """Generate filename based on the segment start time"""
+        timestamp = datetime.fromtimestamp(timestamp or time.time()).strftime("%Y%m%d_%H%M%S")
         return f"camera_{camera_id}_{timestamp}.mp4"
 
-    def _record_camera(self, camera_id, rtsp_url):
-        """Recording function to run in separate thread"""
-        try:
-            cap = cv2.VideoCapture(rtsp_url)
-            if not cap.isOpened():
-                logger.error(f"Failed to open camera stream: {rtsp_url}")
-                return
+    def _temp_path(self, filename):
+        """Hidden path a segment is written to until it is closed"""
+        return os.path.join(self.storage_dir, '.' + filename)
 
-            # Get video properties
-            frame_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-            frame_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-            fps = int(cap.get(cv2.CAP_PROP_FPS))
+    def _discard_incomplete_segments(self):
+        """Remove segments left open by a crash; they have no moov atom and cannot be played"""
+        for filename in os.listdir(self.storage_dir):
+            if filename.startswith('.camera_'):
+                logger.warning(f"Discarding incomplete segment {filename}")
+                os.remove(os.path.join(self.storage_dir, filename))
 
-            # Create video writer
-            filename = self._generate_filename(camera_id)
+    def _finalize_segment(self, segment):
+        """Atomically publish a closed segment under its final name and index it"""
+        try:
+            filename = segment['filename']
             filepath = os.path.join(self.storage_dir, filename)
-            fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-            out = cv2.VideoWriter(filepath, fourcc, fps, (frame_width, frame_height))
+            temp_path = self._temp_path(filename)
+            # Put moov first so browsers can start playing and seeking immediately
+            faststart(temp_path, temp_path + '.faststart', preallocate=self.preallocate)
+            if self.fsync != 'none':
+                self._sync_file(temp_path)
+            os.replace(temp_path, filepath)
+            if self.fsync != 'none':
+                # Makes the rename durable, not only the data
+                self._sync_file(self.storage_dir)
+            segment['size'] = os.path.getsize(filepath)
+            segment['keyframes'] = read_keyframes(filepath)
+            self.catalog.add(segment)
+            RECORDED_BYTES.labels(segment['camera_id']).inc(segment['size'])
+            SEGMENTS_CLOSED.labels(segment['camera_id']).inc()
+            logger.info(f"Closed segment {filename}")
+            for listener in self.closed_listeners:
+                listener(segment)
+        except Exception as e:
+            logger.error(f"Failed to finalize segment {segment['filename']}: {str(e)}")
+        finally:
+            with self.segments_lock:
+                self.open_segments.discard(segment['filename'])
 
-            logger.info(f"Started recording camera {camera_id} to {filepath}")
+    @staticmethod
+    def _sync_file(path):
+        """fsync a file or directory by path"""
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except OSError:
+            # Directories cannot be opened this way on Windows
+            return
+        try:
+            os.fsync(fd)
+        except OSError as e:
+            logger.error(f"Failed to fsync {path}: {str(e)}")
+        finally:
+            os.close(fd)
+
+    def add_segment_listener(self, on_closed=None, on_deleted=None):
+        """Register on_closed(segment) and on_deleted(filename) callbacks"""
+        if on_closed:
+            self.closed_listeners.append(on_closed)
+        if on_deleted:
+            self.deleted_listeners.append(on_deleted)
+
+    def _open_segment(self, camera_id, start_time, fps, frame_size):
+        """Open a video writer for a new segment under its temporary name"""
+        filename = self._generate_filename(camera_id, start_time)
+        with self.segments_lock:
+            # A recording restarted within the same second must not reuse the
+            # name of the segment that is still being closed or already exists
+            base, suffix = filename[:-4], 1
+            while (filename in self.open_segments or os.path.exists(self._temp_path(filename))
+                   or os.path.exists(os.path.join(self.storage_dir, filename))):
+                filename = f"{base}_{suffix}.mp4"
+                suffix += 1
+            self.open_segments.add(filename)
+        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+        writer = cv2.VideoWriter(self._temp_path(filename), fourcc, fps, frame_size)
+        segment = {
+            'filename': filename,
+            'camera_id': camera_id,
+            'start_time': start_time,
+            'end_time': start_time
+        }
+        return writer, segment
 
-            while self.active_recordings.get(camera_id, False):
-                ret, frame = cap.read()
-                if not ret:
-                    logger.warning(f"Failed to read frame from camera {camera_id}")
+    def _close_segment(self, writer, segment):
+        """Flush a segment's writer and publish it"""
+        writer.release()
+        self._finalize_segment(segment)
+
+    def _wait_frame(self, camera_id, ingest, wait, after_seq, segment_writer=None):
+        """Wait for the next frame while the camera is reconnecting.
+
+        Returns None once the recording or the ingest was stopped. The
+        writer is told to close the open segment as soon as frames stop
+        arriving, so a camera outage splits the recording instead of
+        squeezing the gap out of the video.
+        """
+        gap = False
+        while self.active_recordings.get(camera_id, False) and ingest.running:
+            entry = wait(after_seq, timeout=5)
+            if entry is not None:
+                return entry
+            if segment_writer is not None and not gap:
+                logger.warning(f"No frames from camera {camera_id}, closing segment until it is back")
+                segment_writer.gap()
+                gap = True
+        return None
+
+    def _record_camera(self, camera_id, ingest, pre_roll=0):
+        """Recording function to run in separate thread.
+
+        Frames are handed to a SegmentWriter, whose thread does the encoding
+        and disk writes, so a slow disk does not hold up reading the ingest.
+        """
+        segment_writer = SegmentWriter(self, camera_id, self.write_queue_frames)
+        self.segment_writers[camera_id] = segment_writer
+        segment_writer.start()
+        queue_metric = RECORD_QUEUE_DEPTH.labels('record', camera_id)
+        try:
+            # Wait for the shared ingest to deliver its first frame; with a
+            # pre-roll, start from the buffered frames captured before now
+            if pre_roll:
+                entry = self._wait_frame(camera_id, ingest, ingest.buffer.wait_next,
+                                         ingest.buffer.seq_before(time.time() - pre_roll))
+            else:
+                entry = self._wait_frame(camera_id, ingest, ingest.buffer.wait_latest, 0)
+            if entry is None:
+                logger.error(f"Failed to open camera stream: {ingest.rtsp_url}")
+                return
+
+            last_seq, timestamp, frame = entry
+            logger.info(f"Started recording camera {camera_id} to {self.storage_dir}")
+            dropped_metric = FRAMES_DROPPED.labels(camera_id, 'record')
+
+            while True:
+                if not segment_writer.write(timestamp, frame, ingest.fps, ingest.buffer, last_seq):
                     break
-                
-                out.write(frame)
 
-            # Cleanup
-            cap.release()
-            out.release()
-            logger.info(f"Stopped recording camera {camera_id}")
+                entry = self._wait_frame(camera_id, ingest, ingest.buffer.wait_next, last_seq, segment_writer)
+                if entry is None:
+                    break
+                # The buffer drops frames the recorder fell too far behind on
+                if entry[0] > last_seq + 1:
+                    dropped_metric.inc(entry[0] - last_seq - 1)
+                last_seq, timestamp, frame = entry
+                queue_metric.set(ingest.buffer.sequence - last_seq)
+
+            if not segment_writer.thread.is_alive():
+                logger.warning(f"Writer for camera {camera_id} stopped, ending recording")
+            elif ingest.running:
+                logger.info(f"Stopped recording camera {camera_id}")
+            else:
+                logger.warning(f"Ingest for camera {camera_id} stopped, ending recording")
+
+        except Exception as e:
+            logger.error(f"Error recording camera {camera_id}: {str(e)}")
+        finally:
+            # Queued frames are copies, so the camera can be released before they are written
+            self.ingest_manager.release(camera_id, 'recorder', ingest)
+            segment_writer.close()
+            self.active_recordings[camera_id] = False
+            queue_metric.set(0)
+
+    def _build_remux_command(self, camera_id, rtsp_url):
+        """Build the ffmpeg command that copies the camera's compressed stream into segments"""
+        command = [self.ffmpeg_path, '-hide_banner', '-loglevel', 'error']
+        if rtsp_url.startswith('rtsp://'):
+            command += ['-rtsp_transport', 'tcp']
+        elif os.path.isfile(rtsp_url):
+            # Local test files stand in for cameras; read them at their native rate
+            command += ['-re']
+        command += [
+            '-i', rtsp_url,
+            # Only the video track is kept; camera audio (G.711/G.726) is not MP4-compatible
+            '-map', '0:v:0',
+            '-c', 'copy',
+            '-f', 'segment',
+            '-segment_time', str(self.segment_duration),
+            '-segment_format', 'mp4',
+            '-segment_format_options', 'movflags=+faststart',
+            '-reset_timestamps', '1',
+            # ffmpeg reports each closed segment as "filename,start,end" on stdout
+            '-segment_list', 'pipe:1',
+            '-segment_list_type', 'csv',
+            '-strftime', '1',
+            self._temp_path(f"camera_{camera_id}_%Y%m%d_%H%M%S.mp4")
+        ]
+        return command
+
+    def _remux_camera(self, camera_id, process, started_at):
+        """Supervise an ffmpeg passthrough recording until it is stopped or exits"""
+        try:
+            logger.info(f"Started passthrough recording camera {camera_id} (pid {process.pid})")
+
+            # Keep draining stderr so ffmpeg never blocks on a full pipe
+            errors = deque(maxlen=20)
+            stderr_thread = threading.Thread(
+                target=lambda: errors.extend(process.stderr),
+                daemon=True
+            )
+            stderr_thread.start()
+
+            for line in process.stdout:
+                temp_name, start, end = line.decode().strip().rsplit(',', 2)
+                self._finalize_segment({
+                    'filename': os.path.basename(temp_name).lstrip('.'),
+                    'camera_id': camera_id,
+                    'start_time': started_at + float(start),
+                    'end_time': started_at + float(end)
+                })
 
+            process.wait()
+            stderr_thread.join(timeout=1)
+            if self.active_recordings.get(camera_id, False):
+                logger.warning(f"Passthrough recording for camera {camera_id} exited with code "
+                               f"{process.returncode}: {b''.join(errors).decode(errors='replace').strip()}")
+            else:
+                logger.info(f"Stopped recording camera {camera_id}")
         except Exception as e:
             logger.error(f"Error recording camera {camera_id}: {str(e)}")
         finally:
+            self.recording_processes.pop(camera_id, None)
             self.active_recordings[camera_id] = False
 
-    def start_recording(self, camera_id, rtsp_url):
-        """Start recording a camera"""
+    def start_recording(self, camera_id, rtsp_url, mode='transcode', pre_roll=0):
+        """Start recording a camera, optionally including pre_roll seconds of buffered frames.
+
+        Pre-roll only applies to transcode mode; passthrough recordings are
+        fed by their own ffmpeg connection and start at the current frame.
+        """
         try:
             if camera_id in self.active_recordings and self.active_recordings[camera_id]:
                 logger.warning(f"Camera {camera_id} is already recording")
                 return False
 
+            if mode not in self.RECORDING_MODES:
+                logger.error(f"Unknown recording mode for camera {camera_id}: {mode}")
+                return False
+
+            # A recording that ended on its own may still be writing its last segment
+            self._join_segment_writer(camera_id)
+
+            if mode == 'passthrough':
+                if shutil.which(self.ffmpeg_path) is None:
+                    logger.error(f"ffmpeg not found at {self.ffmpeg_path}, cannot record camera {camera_id} in passthrough mode")
+                    return False
+                process = subprocess.Popen(
+                    self._build_remux_command(camera_id, rtsp_url),
+                    stdin=subprocess.PIPE,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE
+                )
+                self.recording_processes[camera_id] = process
+                target, args = self._remux_camera, (camera_id, process, time.time())
+            else:
+                ingest = self.ingest_manager.acquire(camera_id, rtsp_url, 'recorder')
+                target, args = self._record_camera, (camera_id, ingest, pre_roll)
+
             self.active_recordings[camera_id] = True
             thread = threading.Thread(
-                target=self._record_camera,
-                args=(camera_id, rtsp_url),
+                target=target,
+                args=args,
                 daemon=True
             )
             self.recording_threads[camera_id] = thread
@@ -82,6 +456,17 @@ class VideoRecorder:
             logger.error(f"Failed to start recording camera {camera_id}: {str(e)}")
             return False
 
+    def _join_segment_writer(self, camera_id, timeout=30):
+        """Wait until the camera's writer has written its queued frames and closed its last segment"""
+        segment_writer = self.segment_writers.get(camera_id)
+        if segment_writer is None:
+            return
+        segment_writer.thread.join(timeout=timeout)
+        if segment_writer.thread.is_alive():
+            logger.warning(f"Writer for camera {camera_id} is still closing its last segment")
+        elif self.segment_writers.get(camera_id) is segment_writer:
+            del self.segment_writers[camera_id]
+
     def stop_recording(self, camera_id):
         """Stop recording a camera"""
         try:
@@ -90,10 +475,21 @@ class VideoRecorder:
                 return False
 
             self.active_recordings[camera_id] = False
+            process = self.recording_processes.get(camera_id)
+            if process is not None:
+                # 'q' on stdin makes ffmpeg finish the current segment and exit cleanly
+                try:
+                    process.stdin.write(b'q')
+                    process.stdin.close()
+                except OSError:
+                    pass
             if camera_id in self.recording_threads:
                 self.recording_threads[camera_id].join(timeout=5)
                 del self.recording_threads[camera_id]
-            
+            if process is not None and process.poll() is None:
+                process.kill()
+            self._join_segment_writer(camera_id)
+
             logger.info(f"Stopped recording camera {camera_id}")
             return True
 
@@ -101,62 +497,65 @@ class VideoRecorder:
             logger.error(f"Failed to stop recording camera {camera_id}: {str(e)}")
             return False
 
-    def get_recordings(self, camera_id=None, date=None):
-        """Get list of recordings, optionally filtered by camera ID and date"""
+    def get_recordings(self, camera_id=None, date=None, start_time=None, end_time=None, limit=None, offset=0):
+        """Get list of recordings, optionally filtered by camera ID, date or time range"""
         try:
-            recordings = []
-            for filename in os.listdir(self.storage_dir):
-                if not filename.endswith('.mp4'):
-                    continue
-
-                # Parse filename to get camera ID and timestamp
-                parts = filename.split('_')
-                if len(parts) >= 3:
-                    file_camera_id = parts[1]
-                    timestamp = datetime.strptime('_'.join(parts[2:]).replace('.mp4', ''), 
-                                               "%Y%m%d_%H%M%S")
-
-                    # Apply filters
-                    if camera_id and file_camera_id != str(camera_id):
-                        continue
-                    if date and timestamp.date() != date:
-                        continue
-
-                    recordings.append({
-                        'filename': filename,
-                        'camera_id': file_camera_id,
-                        'timestamp': timestamp.strftime("%Y-%m-%d %H:%M:%S"),
-                        'filepath': os.path.join(self.storage_dir, filename)
-                    })
+            if date:
+                day_start = datetime.combine(date, datetime.min.time())
+                start_time = day_start.timestamp()
+                end_time = (day_start + timedelta(days=1)).timestamp()
 
-            return sorted(recordings, key=lambda x: x['timestamp'], reverse=True)
+            segments = self.catalog.query(camera_id, start_time, end_time, limit=limit, offset=offset, newest_first=True)
+            return [{
+                'filename': segment['filename'],
+                'camera_id': str(segment['camera_id']),
+                'timestamp': datetime.fromtimestamp(segment['start_time']).strftime("%Y-%m-%d %H:%M:%S"),
+                'filepath': os.path.join(self.storage_dir, segment['filename']),
+                'start_time': segment['start_time'],
+                'end_time': segment['end_time'],
+                'duration': round(segment['end_time'] - segment['start_time'], 3),
+                'size': segment['size']
+            } for segment in segments]
 
         except Exception as e:
             logger.error(f"Error getting recordings list: {str(e)}")
             return []
 
+    def count_recordings(self, camera_id=None, date=None, start_time=None, end_time=None):
+        """Count recordings matching the same filters as get_recordings"""
+        if date:
+            day_start = datetime.combine(date, datetime.min.time())
+            start_time = day_start.timestamp()
+            end_time = (day_start + timedelta(days=1)).timestamp()
+        return self.catalog.count(camera_id, start_time, end_time)
+
+    def delete_recording(self, filename):
+        """Delete a recording file and its catalog entry"""
+        try:
+            filepath = os.path.join(self.storage_dir, filename)
+            if os.path.exists(filepath):
+                os.remove(filepath)
+            self.catalog.remove([filename])
+            for listener in self.deleted_listeners:
+                listener(filename)
+            logger.info(f"Deleted recording: {filename}")
+            return True
+        except Exception as e:
+            logger.error(f"Failed to delete recording {filename}: {str(e)}")
+            return False
+
     def cleanup_old_recordings(self, retention_days):
         """Delete recordings older than retention_days"""
         try:
-            current_time = datetime.now()
             deleted_count = 0
 
-            for filename in os.listdir(self.storage_dir):
-                if not filename.endswith('.mp4'):
-                    continue
-
-                filepath = os.path.join(self.storage_dir, filename)
-                file_time = datetime.fromtimestamp(os.path.getctime(filepath))
-                age_days = (current_time - file_time).days
-
-                if age_days > retention_days:
-                    os.remove(filepath)
+            for segment in self.catalog.ended_before(time.time() - retention_days * 86400):
+                if self.delete_recording(segment['filename']):
                     deleted_count += 1
-                    logger.info(f"Deleted old recording: {filename}")
 
             logger.info(f"Cleanup complete. Deleted {deleted_count} old recordings")
             return deleted_count
 
         except Exception as e:
             logger.error(f"Error during cleanup: {str(e)}")
-            return 0
\ No newline at end of file
+            return 0
@@ -0,0 +1,278 @@
+import argparse
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from logger import logger
+from mp4_utils import read_duration, read_keyframes
+
+class RecordingsCatalog:
+    """Persistent SQLite catalog of closed recording segments.
+
+    The recorder adds a row whenever a segment is closed, so listing,
+    playback and retention never have to scan the storage directory.
+    Times are UNIX timestamps; keyframes are stored as a JSON list of
+    [seconds_from_start, byte_offset] pairs.
+    """
+
+    def __init__(self, storage_dir, db_name='recordings.db'):
+        self.storage_dir = storage_dir
+        self.db_path = os.path.join(storage_dir, db_name)
+        self.is_new = not os.path.exists(self.db_path)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self._create_schema()
+
+    def _create_schema(self):
+        """Create tables and indexes if they do not exist"""
+        with self.lock, self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS recordings (
+                    id INTEGER PRIMARY KEY,
+                    camera_id INTEGER NOT NULL,
+                    filename TEXT NOT NULL UNIQUE,
+                    start_time REAL NOT NULL,
+                    end_time REAL NOT NULL,
+                    size INTEGER NOT NULL DEFAULT 0,
+                    keyframes TEXT NOT NULL DEFAULT '[]'
+                )
+            """)
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_recordings_camera_start ON recordings (camera_id, start_time)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_recordings_start ON recordings (start_time)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_recordings_end ON recordings (end_time)")
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS thumbnails (
+                    filename TEXT PRIMARY KEY,
+                    tile_width INTEGER NOT NULL,
+                    tile_height INTEGER NOT NULL,
+                    times TEXT NOT NULL
+                )
+            """)
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS motion_events (
+                    id INTEGER PRIMARY KEY,
+                    camera_id INTEGER NOT NULL,
+                    start_time REAL NOT NULL,
+                    end_time REAL,
+                    peak_score REAL NOT NULL DEFAULT 0
+                )
+            """)
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_motion_camera_start ON motion_events (camera_id, start_time)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_motion_start ON motion_events (start_time)")
+
+    @staticmethod
+    def _row_to_segment(row):
+        segment = dict(row)
+        segment['keyframes'] = json.loads(segment['keyframes'])
+        return segment
+
+    def add(self, segment):
+        """Insert or replace a closed segment"""
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO recordings (camera_id, filename, start_time, end_time, size, keyframes) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (segment['camera_id'], segment['filename'], segment['start_time'], segment['end_time'],
+                 segment.get('size', 0), json.dumps(segment.get('keyframes', [])))
+            )
+
+    def remove(self, filenames):
+        """Delete segments by filename"""
+        params = [(f,) for f in filenames]
+        with self.lock, self.conn:
+            self.conn.executemany("DELETE FROM recordings WHERE filename = ?", params)
+            self.conn.executemany("DELETE FROM thumbnails WHERE filename = ?", params)
+
+    def set_thumbnails(self, filename, tile_width, tile_height, times):
+        """Record the thumbnail strip generated for a segment"""
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO thumbnails (filename, tile_width, tile_height, times) VALUES (?, ?, ?, ?)",
+                (filename, tile_width, tile_height, json.dumps(times))
+            )
+
+    def get_thumbnails(self, filenames):
+        """Return {filename: {tile_width, tile_height, times}} for segments that have thumbnails"""
+        result = {}
+        filenames = list(filenames)
+        with self.lock:
+            # Stay below SQLite's bound parameter limit
+            for i in range(0, len(filenames), 500):
+                batch = filenames[i:i + 500]
+                rows = self.conn.execute(
+                    f"SELECT * FROM thumbnails WHERE filename IN ({', '.join('?' * len(batch))})", batch
+                ).fetchall()
+                for row in rows:
+                    result[row['filename']] = {
+                        'tile_width': row['tile_width'],
+                        'tile_height': row['tile_height'],
+                        'times': json.loads(row['times'])
+                    }
+        return result
+
+    def missing_thumbnails(self, limit=100):
+        """Return the newest segments that have no thumbnails yet"""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT r.* FROM recordings r LEFT JOIN thumbnails t ON t.filename = r.filename "
+                "WHERE t.filename IS NULL ORDER BY r.start_time DESC LIMIT ?",
+                (limit,)
+            ).fetchall()
+        return [self._row_to_segment(row) for row in rows]
+
+    def start_motion_event(self, camera_id, start_time):
+        """Open a motion event and return its id"""
+        with self.lock, self.conn:
+            cursor = self.conn.execute(
+                "INSERT INTO motion_events (camera_id, start_time) VALUES (?, ?)", (camera_id, start_time)
+            )
+            return cursor.lastrowid
+
+    def end_motion_event(self, event_id, end_time, peak_score):
+        """Close a motion event"""
+        with self.lock, self.conn:
+            self.conn.execute(
+                "UPDATE motion_events SET end_time = ?, peak_score = ? WHERE id = ?",
+                (end_time, peak_score, event_id)
+            )
+
+    def query_motion_events(self, camera_id=None, start_time=None, end_time=None, min_score=None,
+                            limit=None, offset=0):
+        """Return motion events that start within [start_time, end_time), newest first.
+
+        Events that are still in progress have end_time None.
+        """
+        where, params = self._where(camera_id, start_time, end_time)
+        if min_score is not None:
+            where += (" AND " if where else " WHERE ") + "peak_score >= ?"
+            params.append(min_score)
+        sql = f"SELECT * FROM motion_events{where} ORDER BY start_time DESC"
+        if limit is not None:
+            sql += " LIMIT ? OFFSET ?"
+            params += [limit, offset]
+        with self.lock:
+            rows = self.conn.execute(sql, params).fetchall()
+        return [dict(row) for row in rows]
+
+    def remove_motion_events_before(self, cutoff):
+        """Delete motion events that ended (or, if never closed, started) before cutoff"""
+        with self.lock, self.conn:
+            return self.conn.execute(
+                "DELETE FROM motion_events WHERE COALESCE(end_time, start_time) < ?", (cutoff,)
+            ).rowcount
+
+    def get(self, filename):
+        """Return a single segment by filename or None"""
+        with self.lock:
+            row = self.conn.execute("SELECT * FROM recordings WHERE filename = ?", (filename,)).fetchone()
+        return self._row_to_segment(row) if row else None
+
+    @staticmethod
+    def _where(camera_id, start_time, end_time):
+        clauses, params = [], []
+        if camera_id is not None:
+            clauses.append("camera_id = ?")
+            params.append(camera_id)
+        if start_time is not None:
+            clauses.append("start_time >= ?")
+            params.append(start_time)
+        if end_time is not None:
+            clauses.append("start_time < ?")
+            params.append(end_time)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def query(self, camera_id=None, start_time=None, end_time=None, limit=None, offset=0, newest_first=False):
+        """Return segments that start within [start_time, end_time)"""
+        where, params = self._where(camera_id, start_time, end_time)
+        sql = f"SELECT * FROM recordings{where} ORDER BY start_time {'DESC' if newest_first else 'ASC'}"
+        if limit is not None:
+            sql += " LIMIT ? OFFSET ?"
+            params += [limit, offset]
+        with self.lock:
+            rows = self.conn.execute(sql, params).fetchall()
+        return [self._row_to_segment(row) for row in rows]
+
+    def count(self, camera_id=None, start_time=None, end_time=None):
+        """Return the number of segments that start within [start_time, end_time)"""
+        where, params = self._where(camera_id, start_time, end_time)
+        with self.lock:
+            return self.conn.execute(f"SELECT COUNT(*) FROM recordings{where}", params).fetchone()[0]
+
+    def overlapping(self, camera_id, start_time, end_time):
+        """Return a camera's segments that overlap [start_time, end_time], oldest first"""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT * FROM recordings WHERE camera_id = ? AND start_time <= ? AND end_time >= ? "
+                "ORDER BY start_time",
+                (camera_id, end_time, start_time)
+            ).fetchall()
+        return [self._row_to_segment(row) for row in rows]
+
+    def ended_before(self, cutoff, camera_id=None, exclude_camera_ids=(), limit=None):
+        """Return segments that ended before cutoff, oldest first"""
+        sql = "SELECT * FROM recordings WHERE end_time < ?"
+        params = [cutoff]
+        if camera_id is not None:
+            sql += " AND camera_id = ?"
+            params.append(camera_id)
+        if exclude_camera_ids:
+            sql += f" AND camera_id NOT IN ({', '.join('?' * len(exclude_camera_ids))})"
+            params += list(exclude_camera_ids)
+        sql += " ORDER BY start_time"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        with self.lock:
+            rows = self.conn.execute(sql, params).fetchall()
+        return [self._row_to_segment(row) for row in rows]
+
+    def reconcile(self):
+        """Bring the catalog in line with the storage directory.
+
+        Adds MP4 files that have no row yet and drops rows whose file no
+        longer exists.
+        """
+        stats = {'added': 0, 'removed': 0}
+
+        with self.lock:
+            known = {row[0] for row in self.conn.execute("SELECT filename FROM recordings")}
+
+        on_disk = {f for f in os.listdir(self.storage_dir) if f.startswith('camera_') and f.endswith('.mp4')}
+
+        for filename in sorted(on_disk - known):
+            try:
+                parts = filename[:-4].split('_')
+                # Names may end in _1, _2... when a recording restarted within the same second
+                start_time = datetime.strptime('_'.join(parts[2:4]), "%Y%m%d_%H%M%S").timestamp()
+                filepath = os.path.join(self.storage_dir, filename)
+                duration = read_duration(filepath)
+                self.add({
+                    'filename': filename,
+                    'camera_id': int(parts[1]),
+                    'start_time': start_time,
+                    'end_time': start_time + duration if duration else max(os.path.getmtime(filepath), start_time),
+                    'size': os.path.getsize(filepath),
+                    'keyframes': read_keyframes(filepath)
+                })
+                stats['added'] += 1
+            except Exception as e:
+                logger.warning(f"Could not catalog recording {filename}: {str(e)}")
+
+        missing = known - on_disk
+        if missing:
+            self.remove(missing)
+            stats['removed'] = len(missing)
+
+        logger.info(f"Recordings catalog reconciled: {stats}")
+        return stats
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Rebuild or reconcile the recordings catalog")
+    parser.add_argument('storage_dir', nargs='?', default='./recordings')
+    args = parser.parse_args()
+    RecordingsCatalog(args.storage_dir).reconcile()
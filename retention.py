@@ -0,0 +1,136 @@
+import threading
+import time
+from logger import logger
+from system_monitor import SystemMonitor
+
+class RetentionService:
+    """Background eviction of old recordings by age and by free disk space.
+
+    Runs every `interval` seconds and deletes segments oldest-first using the
+    recordings catalog. A camera's own `retention_days` overrides the global
+    setting. Deletions are paced to at most `max_deletes_per_second` so the
+    disk stays responsive for the active recorders.
+    """
+
+    def __init__(self, video_recorder, camera_manager, interval=300,
+                 min_free_percent=10, max_deletes_per_second=5, batch_size=100):
+        self.video_recorder = video_recorder
+        self.camera_manager = camera_manager
+        self.interval = interval
+        self.min_free_percent = min_free_percent
+        self.max_deletes_per_second = max_deletes_per_second
+        self.batch_size = batch_size
+        self.running = False
+        self.wake_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        """Start the retention thread"""
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        logger.info("Started retention service")
+
+    def stop(self):
+        """Stop the retention thread"""
+        self.running = False
+        self.wake_event.set()
+        if self.thread:
+            self.thread.join(timeout=5)
+
+    def trigger(self):
+        """Run a retention pass as soon as possible"""
+        self.wake_event.set()
+
+    def _run(self):
+        while self.running:
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"Error during retention pass: {str(e)}")
+            self.wake_event.wait(self.interval)
+            self.wake_event.clear()
+
+    def run_once(self):
+        """Run one age-based and one disk-pressure eviction pass"""
+        deleted = self._evict_by_age()
+        deleted += self._evict_by_disk_pressure()
+        if deleted:
+            logger.info(f"Retention pass complete. Deleted {deleted} recordings")
+        return deleted
+
+    def _delete(self, segments):
+        """Delete segments at a bounded rate; return how many were deleted"""
+        delay = 1.0 / self.max_deletes_per_second if self.max_deletes_per_second else 0
+        deleted = 0
+        for segment in segments:
+            if not self.running:
+                break
+            if self.video_recorder.delete_recording(segment['filename']):
+                deleted += 1
+            if delay:
+                time.sleep(delay)
+        return deleted
+
+    def _delete_batches(self, next_batch):
+        """Delete batches from next_batch() until it is empty or nothing could be deleted"""
+        deleted = 0
+        while self.running:
+            batch = next_batch()
+            if not batch:
+                break
+            count = self._delete(batch)
+            if not count:
+                break
+            deleted += count
+        return deleted
+
+    def _evict_by_age(self):
+        """Delete segments older than their camera's retention period"""
+        default_days = self.camera_manager.get_settings().get('retention_days', 7)
+        overrides = {
+            camera['id']: camera['retention_days']
+            for camera in self.camera_manager.list_cameras()
+            if camera.get('retention_days')
+        }
+        catalog = self.video_recorder.catalog
+        now = time.time()
+        deleted = 0
+
+        for camera_id, days in overrides.items():
+            deleted += self._delete_batches(
+                lambda: catalog.ended_before(now - days * 86400, camera_id=camera_id, limit=self.batch_size)
+            )
+
+        # Everything else uses the global setting
+        deleted += self._delete_batches(
+            lambda: catalog.ended_before(now - default_days * 86400, exclude_camera_ids=list(overrides),
+                                         limit=self.batch_size)
+        )
+
+        # Motion events are kept as long as the longest-lived recordings
+        catalog.remove_motion_events_before(now - max([default_days] + list(overrides.values())) * 86400)
+        return deleted
+
+    def _evict_by_disk_pressure(self):
+        """Delete the oldest segments while free space is below the high-water mark"""
+        catalog = self.video_recorder.catalog
+        deleted = 0
+        while self.running:
+            disk = SystemMonitor.get_disk_usage(self.video_recorder.storage_dir)
+            if not disk or 100 - disk['percent'] >= self.min_free_percent:
+                break
+            if not deleted:
+                logger.warning(f"Free disk space below {self.min_free_percent}%, evicting oldest recordings")
+            # Small batches so free space is re-checked often
+            batch = catalog.query(limit=self.batch_size // 10 or 1)
+            if not batch:
+                logger.warning("Disk space is low but there are no recordings left to evict")
+                break
+            count = self._delete(batch)
+            if not count:
+                break
+            deleted += count
+        return deleted
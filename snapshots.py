@@ -0,0 +1,153 @@
+import cv2
+import threading
+import time
+from collections import OrderedDict
+from logger import logger
+from metrics import metrics
+
+SNAPSHOTS = metrics.counter('nvr_snapshots_total', "Snapshot requests, served from the cache or encoded", ['camera', 'result'])
+
+class SnapshotService:
+    """Still JPEGs of each camera's latest frame, encoded once per frame and size.
+
+    Frames come from the shared camera ingest. The first snapshot of a
+    camera that nobody else is reading connects it, and the connection is
+    kept for idle_timeout seconds after the last snapshot so pollers do not
+    reconnect every time. Encoded images are memoized per (frame sequence,
+    width, quality): while the frame is unchanged, every poller after the
+    first gets the cached JPEG, and concurrent pollers of a new frame wait
+    for a single encode.
+    """
+
+    def __init__(self, ingest_manager, camera_manager, quality=80, idle_timeout=30, wait_timeout=5, max_variants=8):
+        self.ingest_manager = ingest_manager
+        self.camera_manager = camera_manager
+        self.quality = quality
+        self.idle_timeout = idle_timeout
+        self.wait_timeout = wait_timeout
+        self.max_variants = max_variants
+        self.held = {}
+        self.cache = {}
+        self.locks = {}
+        self.lock = threading.Lock()
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        """Start the thread that releases connections nobody polls any more"""
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._release_idle, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Release all held connections"""
+        self.running = False
+        for camera_id in list(self.held):
+            self._release(camera_id)
+
+    def _release(self, camera_id):
+        with self.lock:
+            held = self.held.pop(camera_id, None)
+            self.cache.pop(camera_id, None)
+        if held is not None:
+            self.ingest_manager.release(camera_id, 'snapshot', held[0])
+
+    def _release_idle(self):
+        while self.running:
+            time.sleep(5)
+            now = time.time()
+            for camera_id, (_, last_used) in list(self.held.items()):
+                if now - last_used > self.idle_timeout:
+                    self._release(camera_id)
+
+    def _ingest(self, camera):
+        """Return the camera's ingest, connecting it if nobody reads the camera yet"""
+        camera_id = camera['id']
+        with self.lock:
+            held = self.held.get(camera_id)
+            ingest = held[0] if held else None
+            # The held ingest may have been replaced after the camera was edited
+            if ingest is None or ingest is not self.ingest_manager.get(camera_id) or not ingest.running:
+                if ingest is not None:
+                    self.ingest_manager.release(camera_id, 'snapshot', ingest)
+                ingest = self.ingest_manager.acquire(camera_id, camera['rtsp_url'], 'snapshot')
+            self.held[camera_id] = (ingest, time.time())
+            return ingest
+
+    def _camera_lock(self, camera_id):
+        with self.lock:
+            return self.locks.setdefault(camera_id, threading.Lock())
+
+    @staticmethod
+    def _check_options(width, quality):
+        if width is not None and int(width) < 1:
+            raise ValueError("width must be at least 1")
+        if quality is not None and not 1 <= int(quality) <= 100:
+            raise ValueError("quality must be between 1 and 100")
+
+    def get(self, camera, width=None, quality=None, timeout=None):
+        """Return (jpeg bytes, sequence, frame timestamp) of the latest frame, or None if there is none.
+
+        Waits up to timeout (default wait_timeout) seconds for a camera that
+        has no frame yet. Raises ValueError for a width below 1 or a quality
+        outside 1-100.
+        """
+        self._check_options(width, quality)
+        camera_id = camera['id']
+        quality = self.quality if quality is None else int(quality)
+        timeout = self.wait_timeout if timeout is None else timeout
+        ingest = self._ingest(camera)
+        if ingest.buffer.latest() is None and ingest.buffer.wait_latest(0, timeout=timeout) is None:
+            return None
+
+        with self._camera_lock(camera_id):
+            # Picked under the lock so the cached frame only ever moves forward
+            seq, timestamp, frame = ingest.buffer.latest()
+            if width:
+                width = min(int(width), frame.shape[1])
+            if width == frame.shape[1]:
+                width = None
+            variant = (width, quality)
+
+            cached = self.cache.get(camera_id)
+            if cached is None or cached[0] != (seq, timestamp):
+                # A new frame makes every encoded size of the previous one stale
+                cached = ((seq, timestamp), OrderedDict())
+                self.cache[camera_id] = cached
+            variants = cached[1]
+            jpeg = variants.get(variant)
+            if jpeg is not None:
+                variants.move_to_end(variant)
+                SNAPSHOTS.labels(camera_id, 'cached').inc()
+                return jpeg, seq, timestamp
+
+            if width:
+                height = max(int(frame.shape[0] * width / frame.shape[1]) // 2 * 2, 2)
+                frame = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+            ok, encoded = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+            if not ok:
+                logger.error(f"Failed to encode snapshot for camera {camera_id}")
+                return None
+            jpeg = encoded.tobytes()
+            variants[variant] = jpeg
+            if len(variants) > self.max_variants:
+                variants.popitem(last=False)
+            SNAPSHOTS.labels(camera_id, 'encoded').inc()
+            return jpeg, seq, timestamp
+
+    def get_many(self, cameras, width=None, quality=None):
+        """Return {camera id: get() result} for several cameras.
+
+        Every camera is connected before waiting for the first one, so
+        cameras that are not streaming yet connect at the same time, and
+        they all wait under one deadline: cameras that are down cost
+        wait_timeout once, not once each.
+        """
+        self._check_options(width, quality)
+        for camera in cameras:
+            self._ingest(camera)
+        deadline = time.time() + self.wait_timeout
+        return {camera['id']: self.get(camera, width, quality, max(deadline - time.time(), 0))
+                for camera in cameras}
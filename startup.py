@@ -0,0 +1,116 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from logger import logger
+
+class StartupOrchestrator:
+    """Brings every enabled camera up after a start, a few at a time.
+
+    Up to max_parallel cameras connect at once, each waiting at most
+    connect_timeout seconds (or its own "connect_timeout") for a first
+    frame, so cameras that are down cost one timeout per batch instead of
+    one each. Once a camera is up, or has timed out, its motion analysis and
+    the recording it had before the restart (its "recording" flag) are
+    started; the supervisor keeps retrying the ones that are still down.
+    Cameras that nothing reads at startup are not opened and end up
+    'idle' rather than 'ready'. With warm_ingests the connections stay open
+    afterwards, so the first live viewer does not wait for the camera either.
+    """
+
+    def __init__(self, camera_manager, ingest_manager, supervisor, motion_service,
+                 max_parallel=8, connect_timeout=10, warm_ingests=False):
+        self.camera_manager = camera_manager
+        self.ingest_manager = ingest_manager
+        self.supervisor = supervisor
+        self.motion_service = motion_service
+        self.max_parallel = max_parallel
+        self.connect_timeout = connect_timeout
+        self.warm_ingests = warm_ingests
+        self.cameras = {}
+        self.started_at = None
+        self.finished_at = None
+        self.thread = None
+
+    def start(self):
+        """Bring the cameras up in the background"""
+        if self.thread is not None:
+            return
+        self.started_at = time.time()
+        cameras = [camera for camera in self.camera_manager.list_cameras() if camera.get('enabled', True)]
+        for camera in cameras:
+            self.cameras[camera['id']] = {'state': 'pending', 'connect_seconds': None, 'recording': False}
+        self.thread = threading.Thread(target=self._run, args=(cameras,), daemon=True)
+        self.thread.start()
+        logger.info(f"Starting {len(cameras)} cameras, {self.max_parallel} at a time")
+
+    def _run(self, cameras):
+        with ThreadPoolExecutor(max_workers=self.max_parallel, thread_name_prefix='startup') as executor:
+            for camera in cameras:
+                executor.submit(self._bring_up, camera)
+        self.finished_at = time.time()
+        ready = sum(1 for status in self.cameras.values() if status['state'] == 'ready')
+        idle = sum(1 for status in self.cameras.values() if status['state'] == 'idle')
+        logger.info(f"Startup finished in {self.finished_at - self.started_at:.1f} seconds: "
+                    f"{ready} of {len(cameras) - idle} cameras connected, {idle} not opened")
+
+    def _needs_ingest(self, camera):
+        # Passthrough recordings read the camera with their own ffmpeg
+        return (self.warm_ingests or self.camera_manager.get_motion_settings(camera)['enabled']
+                or (camera.get('recording') and camera.get('recording_mode', 'transcode') != 'passthrough'))
+
+    def _bring_up(self, camera):
+        """Connect one camera, then start its motion analysis and recording"""
+        camera_id = camera['id']
+        status = self.cameras[camera_id]
+        try:
+            # The camera may have been edited or removed while it waited for its turn
+            camera = self.camera_manager.get_camera(camera_id)
+            if camera is None or not camera.get('enabled', True):
+                status['state'] = 'skipped'
+                return
+
+            started = time.time()
+            ingest = None
+            if not self._needs_ingest(camera):
+                # Nothing reads it yet; the first viewer or snapshot connects it
+                status['state'] = 'idle'
+            else:
+                status['state'] = 'connecting'
+                ingest = self.ingest_manager.acquire(camera_id, camera['rtsp_url'], 'startup')
+                timeout = camera.get('connect_timeout', self.connect_timeout)
+                if ingest.buffer.wait_latest(0, timeout=timeout) is None:
+                    status['state'] = 'timeout'
+                    logger.warning(f"Camera {camera_id} did not connect within {timeout} seconds, "
+                                   f"it keeps retrying in the background")
+                else:
+                    status['state'] = 'ready'
+                    status['connect_seconds'] = round(time.time() - started, 2)
+
+            if self.camera_manager.get_motion_settings(camera)['enabled']:
+                self.motion_service.start_camera(camera)
+            if camera.get('recording'):
+                status['recording'] = self.supervisor.start_recording(camera_id)
+            if ingest is not None and not self.warm_ingests:
+                self.ingest_manager.release(camera_id, 'startup', ingest)
+
+        except Exception as e:
+            status['state'] = 'failed'
+            status['error'] = str(e)
+            logger.error(f"Error starting camera {camera_id}: {str(e)}")
+
+    def is_ready(self):
+        """Return True once every camera has been brought up or has timed out"""
+        return self.finished_at is not None
+
+    def get_status(self):
+        """Return the startup progress and the outcome for each camera"""
+        now = time.time()
+        states = {}
+        for status in self.cameras.values():
+            states[status['state']] = states.get(status['state'], 0) + 1
+        return {
+            'ready': self.is_ready(),
+            'elapsed': round((self.finished_at or now) - self.started_at, 2) if self.started_at else None,
+            'states': states,
+            'cameras': {camera_id: dict(status) for camera_id, status in self.cameras.items()}
+        }
@@ -2,101 +2,213 @@ import cv2
 from flask import Response
 import threading
 import time
+from broadcast import FrameBroadcaster
+from camera_ingest import IngestManager
 from logger import logger
+from metrics import metrics
+
+ENCODE_SECONDS = metrics.histogram('nvr_encode_seconds', "Time to scale and JPEG-encode one live frame", ['camera', 'profile'])
+LIVE_VIEWERS = metrics.gauge('nvr_live_viewers', "Connected live viewers", ['camera', 'stream'])
+
+DEFAULT_PROFILES = {
+    'full': {'width': None, 'quality': 80, 'fps': None, 'substream': False},
+    'preview': {'width': 640, 'quality': 60, 'fps': 10, 'substream': True}
+}
 
 class StreamHandler:
-    def __init__(self):
+    """Live MJPEG streams, one per camera and size/quality profile.
+
+    Every active (camera, profile) pair has a single encoder thread that
+    scales and encodes each frame once and shares the result with all of its
+    viewers. Profiles with "substream" set read the camera's substream_url
+    when one is configured instead of downscaling the main stream.
+    """
+
+    def __init__(self, ingest_manager=None, idle_timeout=30, profiles=None):
+        self.ingest_manager = ingest_manager or IngestManager()
+        self.idle_timeout = idle_timeout
+        self.profiles = profiles or DEFAULT_PROFILES
         self.active_streams = {}
         self.stream_locks = {}
         self.frames = {}
+        self.broadcasters = {}
+        self.lock = threading.RLock()
+        LIVE_VIEWERS.add_function(self._viewer_counts)
 
-    def _capture_stream(self, camera_id, rtsp_url):
-        """Continuously capture frames from RTSP stream"""
-        retry_count = 0
-        max_retries = 3
-        
-        while self.active_streams.get(camera_id, False):
-            try:
-                cap = cv2.VideoCapture(rtsp_url)
-                if not cap.isOpened():
-                    raise Exception("Failed to open RTSP stream")
-
-                logger.info(f"Successfully connected to camera {camera_id}")
-                retry_count = 0  # Reset retry count on successful connection
-                
-                while self.active_streams.get(camera_id, False):
-                    ret, frame = cap.read()
-                    if not ret:
-                        raise Exception("Failed to read frame")
-
-                    # Acquire lock before updating frame
-                    with self.stream_locks[camera_id]:
-                        _, jpeg = cv2.imencode('.jpg', frame)
-                        self.frames[camera_id] = jpeg.tobytes()
-                    
-                    time.sleep(0.033)  # ~30 FPS
-
-            except Exception as e:
-                logger.error(f"Error capturing stream for camera {camera_id}: {str(e)}")
-                retry_count += 1
-                
-                if retry_count >= max_retries:
-                    logger.error(f"Max retries reached for camera {camera_id}, stopping stream")
-                    self.active_streams[camera_id] = False
-                    break
-                
-                logger.info(f"Retrying connection to camera {camera_id} in 5 seconds... (Attempt {retry_count}/{max_retries})")
-                time.sleep(5)
-            
-            finally:
-                if 'cap' in locals():
-                    cap.release()
-
-        logger.info(f"Stream capture stopped for camera {camera_id}")
-
-    def start_stream(self, camera_id, rtsp_url):
-        """Start capturing stream for a camera"""
-        if camera_id in self.active_streams and self.active_streams[camera_id]:
-            return
+    def _viewer_counts(self):
+        return {key: broadcaster.subscribers for key, broadcaster in list(self.broadcasters.items())}
+
+    @staticmethod
+    def _ingest_key(camera_id, use_substream):
+        # Substreams get their own ingest next to the camera's main one
+        return f"{camera_id}-sub" if use_substream else camera_id
+
+    def _capture_stream(self, key, ingest, settings):
+        """Encode frames from the shared camera ingest, only as fast as viewers consume them"""
+        camera_id, profile = key
+        last_seq = 0
+        last_encoded = 0
+        idle_since = time.time()
+        lock = self.stream_locks[key]
+        broadcaster = self.broadcasters[key]
+        min_interval = 1.0 / settings['fps'] if settings.get('fps') else 0
+        encode_params = [cv2.IMWRITE_JPEG_QUALITY, settings.get('quality', 80)]
+        encode_metric = ENCODE_SECONDS.labels(camera_id, profile)
+
+        # A stop closes this thread's broadcaster; a restart of the same key
+        # gets a new one, so the old thread ends instead of serving it
+        while not broadcaster.closed:
+            # Skip encoding entirely until a viewer is waiting for the next frame
+            if not broadcaster.wait_for_demand(timeout=1.0):
+                if broadcaster.subscribers > 0:
+                    idle_since = time.time()
+                elif time.time() - idle_since > self.idle_timeout:
+                    logger.info(f"No viewers for camera {camera_id} ({profile}) in {self.idle_timeout}s, idling stream")
+                    self._stop_generation(key, broadcaster)
+                continue
+            idle_since = time.time()
+
+            if min_interval:
+                delay = last_encoded + min_interval - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+
+            entry = ingest.buffer.wait_latest(last_seq, timeout=1.0)
+            if entry is None:
+                if not ingest.running:
+                    logger.error(f"Ingest stopped for camera {camera_id}, stopping stream")
+                    self._stop_generation(key, broadcaster)
+                continue
+
+            last_seq, _, frame = entry
+            last_encoded = time.time()
+            encode_started = time.perf_counter()
+            width = settings.get('width')
+            if width and frame.shape[1] > width:
+                height = max(int(frame.shape[0] * width / frame.shape[1]) // 2 * 2, 2)
+                frame = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+            _, jpeg = cv2.imencode('.jpg', frame, encode_params)
+            encode_metric.observe(time.perf_counter() - encode_started)
+
+            # Build the multipart chunk once, straight from the encoder's buffer,
+            # and share it with every viewer
+            header = (b'--frame\r\n'
+                      b'Content-Type: image/jpeg\r\n'
+                      b'Content-Length: ' + str(len(jpeg)).encode() + b'\r\n\r\n')
+            chunk = b''.join((header, jpeg, b'\r\n'))
+
+            # Acquire lock before updating frame
+            with lock:
+                if self.broadcasters.get(key) is broadcaster:
+                    # The latest JPEG is a view into the chunk, not another copy
+                    self.frames[key] = memoryview(chunk)[len(header):-2]
 
-        self.active_streams[camera_id] = True
-        self.stream_locks[camera_id] = threading.Lock()
-        self.frames[camera_id] = None
+            broadcaster.publish(chunk)
 
+        broadcaster.close()
+        self.ingest_manager.release(ingest.camera_id, f'live-{profile}', ingest)
+        logger.info(f"Stream capture stopped for camera {camera_id} ({profile})")
+
+    def _stop_generation(self, key, broadcaster):
+        """Stop a stream only if it still belongs to the encoder thread serving this broadcaster"""
+        with self.lock:
+            if self.broadcasters.get(key) is broadcaster:
+                self.stop_stream(*key)
+            else:
+                broadcaster.close()
+
+    def start_stream(self, camera_id, rtsp_url, profile='full', substream_url=None):
+        """Start capturing stream for a camera in the given profile"""
+        if profile not in self.profiles:
+            raise ValueError(f"Unknown stream profile: {profile}")
+        key = (camera_id, profile)
+        settings = self.profiles[profile]
+        use_substream = bool(settings.get('substream') and substream_url)
+        with self.lock:
+            if self.active_streams.get(key, False):
+                return
+            self.active_streams[key] = True
+            self.stream_locks[key] = threading.Lock()
+            self.frames[key] = None
+            self.broadcasters[key] = FrameBroadcaster()
+
+        ingest = self.ingest_manager.acquire(
+            self._ingest_key(camera_id, use_substream),
+            substream_url if use_substream else rtsp_url,
+            f'live-{profile}'
+        )
         thread = threading.Thread(
             target=self._capture_stream,
-            args=(camera_id, rtsp_url),
+            args=(key, ingest, settings),
             daemon=True
         )
         thread.start()
-        logger.info(f"Started stream capture for camera {camera_id}")
-
-    def stop_stream(self, camera_id):
-        """Stop capturing stream for a camera"""
-        if camera_id in self.active_streams:
-            self.active_streams[camera_id] = False
-            if camera_id in self.frames:
-                del self.frames[camera_id]
-            if camera_id in self.stream_locks:
-                del self.stream_locks[camera_id]
-            logger.info(f"Stopped stream capture for camera {camera_id}")
-
-    def get_frame(self, camera_id):
-        """Get the latest frame for a camera"""
-        if camera_id not in self.frames or not self.frames[camera_id]:
+        logger.info(f"Started stream capture for camera {camera_id} ({profile})")
+
+    def stop_stream(self, camera_id, profile=None):
+        """Stop capturing stream for a camera, in one profile or in all of them"""
+        with self.lock:
+            keys = [k for k in self.active_streams if k[0] == camera_id and profile in (None, k[1])]
+            for key in keys:
+                self.active_streams[key] = False
+                self.frames.pop(key, None)
+                self.stream_locks.pop(key, None)
+                broadcaster = self.broadcasters.pop(key, None)
+                if broadcaster is not None:
+                    broadcaster.close()
+        for key in keys:
+            logger.info(f"Stopped stream capture for camera {camera_id} ({key[1]})")
+
+    def get_frame(self, camera_id, profile='full'):
+        """Get the latest JPEG frame for a camera as a read-only memoryview"""
+        key = (camera_id, profile)
+        # The stream can be stopped between these lookups, so never index directly
+        lock = self.stream_locks.get(key)
+        if lock is None:
             return None
-        
-        with self.stream_locks[camera_id]:
-            return self.frames[camera_id]
 
-    def generate_mjpeg(self, camera_id):
+        with lock:
+            return self.frames.get(key) or None
+
+    def generate_mjpeg(self, camera_id, profile='full'):
         """Generate MJPEG stream"""
-        while True:
-            frame = self.get_frame(camera_id)
-            if frame is None:
-                time.sleep(0.1)
-                continue
+        broadcaster = self.broadcasters.get((camera_id, profile))
+        if broadcaster is None:
+            return
+
+        broadcaster.subscribe()
+        try:
+            last_seq = 0
+            while True:
+                # Block until a new frame is published; slow clients skip to the newest one
+                result = broadcaster.wait(last_seq, timeout=10)
+                if result is None:
+                    if broadcaster.closed:
+                        return
+                    continue
+
+                last_seq, chunk = result
+                yield chunk
+        finally:
+            broadcaster.unsubscribe()
+
+    async def generate_mjpeg_async(self, camera_id, profile='full'):
+        """Async generator version of generate_mjpeg() for the ASGI server"""
+        broadcaster = self.broadcasters.get((camera_id, profile))
+        if broadcaster is None:
+            return
+
+        broadcaster.subscribe()
+        try:
+            last_seq = 0
+            while True:
+                result = await broadcaster.wait_async(last_seq, timeout=10)
+                if result is None:
+                    if broadcaster.closed:
+                        return
+                    continue
 
-            yield (b'--frame\r\n'
-                  b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
-            time.sleep(0.033)  # ~30 FPS
\ No newline at end of file
+                last_seq, chunk = result
+                yield chunk
+        finally:
+            broadcaster.unsubscribe()
@@ -1,14 +1,142 @@
 import psutil
-import os
+import threading
+import time
+from collections import deque
 from datetime import datetime
 from logger import logger
 
 class SystemMonitor:
+    """Host and process metrics sampled in the background.
+
+    A sampler thread collects CPU (total and per core), memory, disk usage,
+    disk and network I/O rates and the stats of this process and its children
+    (capture workers, ffmpeg) every `interval` seconds into a bounded history.
+    Requests read the latest sample and never wait for psutil.
+    """
+
+    def __init__(self, path="./recordings", interval=2, history_size=1800):
+        self.path = path
+        self.interval = interval
+        self.history = deque(maxlen=history_size)
+        self.latest = None
+        self.process = psutil.Process()
+        self.children = {}
+        self.previous_io = None
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        """Start the sampler thread"""
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        logger.info("Started system monitor")
+
+    def stop(self):
+        """Stop the sampler thread"""
+        self.running = False
+        if self.thread:
+            self.thread.join(timeout=5)
+
+    def _run(self):
+        while self.running:
+            try:
+                sample = self._sample()
+                # The first CPU and I/O readings are only the baseline for the next ones
+                if self.latest is not None:
+                    self.history.append(sample)
+                self.latest = sample
+            except Exception as e:
+                logger.error(f"Error sampling system metrics: {str(e)}")
+            time.sleep(self.interval)
+
+    def _io_rates(self, now):
+        """Return per-second disk and network I/O since the previous sample"""
+        network = psutil.net_io_counters()
+        disk = psutil.disk_io_counters()
+        previous = self.previous_io
+        self.previous_io = (now, network, disk)
+        if previous is None:
+            return {}, {}
+
+        elapsed = now - previous[0]
+        network_rates = {
+            'bytes_sent': round((network.bytes_sent - previous[1].bytes_sent) / elapsed),
+            'bytes_recv': round((network.bytes_recv - previous[1].bytes_recv) / elapsed),
+            'errors': network.errin + network.errout,
+            'drops': network.dropin + network.dropout
+        }
+        disk_rates = {}
+        # disk_io_counters() returns None where the kernel does not expose it (some containers)
+        if disk is not None and previous[2] is not None:
+            disk_rates = {
+                'read_bytes': round((disk.read_bytes - previous[2].read_bytes) / elapsed),
+                'write_bytes': round((disk.write_bytes - previous[2].write_bytes) / elapsed)
+            }
+        return network_rates, disk_rates
+
+    @staticmethod
+    def _process_stats(process):
+        with process.oneshot():
+            return {
+                'pid': process.pid,
+                'name': process.name(),
+                'cpu': process.cpu_percent(),
+                'rss': process.memory_info().rss,
+                'threads': process.num_threads()
+            }
+
+    def _processes(self):
+        """Return stats for this process and each of its children"""
+        stats = [self._process_stats(self.process)]
+        children = {}
+        for child in self.process.children(recursive=True):
+            # Reuse Process objects so cpu_percent() measures since the previous sample
+            process = self.children.get(child.pid, child)
+            try:
+                stats.append(self._process_stats(process))
+                children[child.pid] = process
+            except psutil.Error:
+                pass
+        self.children = children
+        return stats
+
+    def _sample(self):
+        """Collect one sample of every metric"""
+        now = time.time()
+        per_core = psutil.cpu_percent(percpu=True)
+        network, disk_io = self._io_rates(now)
+        return {
+            'time': now,
+            'timestamp': datetime.fromtimestamp(now).strftime("%Y-%m-%d %H:%M:%S"),
+            'cpu': round(sum(per_core) / len(per_core), 1) if per_core else 0,
+            'cpu_per_core': per_core,
+            'memory': SystemMonitor.get_memory_usage(),
+            'disk': SystemMonitor.get_disk_usage(self.path),
+            'disk_io': disk_io,
+            'network': network,
+            'processes': self._processes(),
+            'uptime': SystemMonitor.get_system_uptime()
+        }
+
+    def get_history(self, seconds):
+        """Return the samples of the last `seconds` seconds, oldest first"""
+        cutoff = time.time() - seconds
+        return [{
+            'timestamp': sample['timestamp'],
+            'cpu': sample['cpu'],
+            'memory': sample['memory'].get('percent'),
+            'disk': sample['disk'].get('percent'),
+            'network': sample['network']
+        } for sample in list(self.history) if sample['time'] >= cutoff]
+
     @staticmethod
     def get_cpu_usage():
-        """Get CPU usage percentage"""
+        """Get CPU usage percentage since the previous call, without blocking"""
         try:
-            return psutil.cpu_percent(interval=1)
+            return psutil.cpu_percent(interval=None)
         except Exception as e:
             logger.error(f"Error getting CPU usage: {str(e)}")
             return 0
@@ -33,8 +161,6 @@ class SystemMonitor:
     def get_disk_usage(path="./recordings"):
         """Get disk usage statistics for recordings directory"""
         try:
-            if not os.path.exists(path):
-                os.makedirs(path)
             disk = psutil.disk_usage(path)
             return {
                 'total': disk.total,
@@ -55,16 +181,13 @@ class SystemMonitor:
             logger.error(f"Error getting system uptime: {str(e)}")
             return None
 
-    @staticmethod
-    def get_all_metrics():
-        """Get all system metrics"""
-        return {
-            'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            'cpu': SystemMonitor.get_cpu_usage(),
-            'memory': SystemMonitor.get_memory_usage(),
-            'disk': SystemMonitor.get_disk_usage(),
-            'uptime': SystemMonitor.get_system_uptime()
-        }
+    def get_all_metrics(self):
+        """Get the latest sample of all system metrics"""
+        sample = self.latest
+        if sample is None:
+            # The sampler was not started
+            sample = self._sample()
+        return {key: value for key, value in sample.items() if key != 'time'}
 
     @staticmethod
     def format_bytes(bytes_value):
@@ -73,4 +196,4 @@ class SystemMonitor:
             if bytes_value < 1024:
                 return f"{bytes_value:.2f} {unit}"
             bytes_value /= 1024
-        return f"{bytes_value:.2f} PB"
\ No newline at end of file
+        return f"{bytes_value:.2f} PB"
@@ -0,0 +1,116 @@
+import atexit
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Importing any repo module sets up logs/nvr.log relative to the working
+# directory, so move into a scratch directory before the first import
+WORKDIR = tempfile.mkdtemp(prefix='nvr-tests-')
+os.chdir(WORKDIR)
+atexit.register(shutil.rmtree, WORKDIR, True)
+
+from camera_ingest import FrameBuffer
+
+
+class FakeIngest:
+    """Stands in for CameraIngest: a thread puts small numbered frames into a FrameBuffer"""
+
+    def __init__(self, camera_id, rtsp_url='rtsp://camera', fps=50, shape=(48, 64, 3), buffer_size=8):
+        self.camera_id = camera_id
+        self.rtsp_url = rtsp_url
+        self.buffer = FrameBuffer(buffer_size)
+        self.fps = fps
+        self.shape = shape
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self.buffer.close()
+        if self.thread is not None:
+            self.thread.join(timeout=5)
+
+    def _run(self):
+        frame = np.zeros(self.shape, dtype=np.uint8)
+        while self.running:
+            frame[:] = (self.buffer.sequence + 1) % 256
+            self.buffer.put(frame)
+            time.sleep(1.0 / self.fps)
+
+
+class FakeIngestManager:
+    """Refcounted like IngestManager, but hands out FakeIngests; cameras in dead never deliver a frame"""
+
+    def __init__(self, dead=(), **ingest_options):
+        self.dead = set(dead)
+        self.ingest_options = ingest_options
+        self.ingests = {}
+        self.consumers = {}
+        self.released = []
+        self.lock = threading.Lock()
+
+    def acquire(self, camera_id, rtsp_url, consumer):
+        with self.lock:
+            ingest = self.ingests.get(camera_id)
+            if ingest is None:
+                ingest = FakeIngest(camera_id, rtsp_url, **self.ingest_options)
+                if camera_id in self.dead:
+                    ingest.running = True
+                else:
+                    ingest.start()
+                self.ingests[camera_id] = ingest
+            self.consumers.setdefault(camera_id, []).append(consumer)
+            return ingest
+
+    def release(self, camera_id, consumer, ingest=None):
+        with self.lock:
+            self.released.append((camera_id, consumer))
+            consumers = self.consumers.get(camera_id, [])
+            if consumer in consumers:
+                consumers.remove(consumer)
+
+    def get(self, camera_id):
+        return self.ingests.get(camera_id)
+
+    def stop_all(self):
+        for ingest in self.ingests.values():
+            ingest.stop()
+
+
+@pytest.fixture
+def ingest_manager():
+    manager = FakeIngestManager()
+    yield manager
+    manager.stop_all()
+
+
+@pytest.fixture(scope='session')
+def app_module(tmp_path_factory):
+    """The Flask app, built in a scratch directory with one camera nobody reads yet"""
+    workdir = tmp_path_factory.mktemp('app')
+    with open(workdir / 'config.json', 'w') as f:
+        json.dump({
+            'cameras': [{'id': 1, 'name': 'camera1', 'rtsp_url': 'rtsp://127.0.0.1:9/none',
+                         'substream_url': None, 'enabled': True, 'recording_mode': 'transcode',
+                         'motion': {'enabled': False, 'sensitivity': 50, 'mask': []}}],
+            'stream_settings': {'live_mode': 'mjpeg'}
+        }, f)
+    # Storage and thumbnail paths are relative, so stay there until the session ends
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    import app
+    yield app
+    os.chdir(cwd)
@@ -0,0 +1,106 @@
+import asyncio
+import os
+import pytest
+
+
+def test_import_starts_no_services(app_module):
+    assert app_module.startup_orchestrator.thread is None
+    assert not app_module.camera_supervisor.running
+    assert not app_module.camera_manager.watching
+
+
+def test_asgi_lifespan_starts_services(app_module, monkeypatch):
+    import asgi
+    started = []
+    monkeypatch.setattr(asgi, 'start_services', lambda: started.append(True))
+    messages = [{'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message['type'])
+
+    asyncio.run(asgi.application({'type': 'lifespan'}, receive, send))
+    assert started == [True]
+    assert sent == ['lifespan.startup.complete', 'lifespan.shutdown.complete']
+
+
+def test_malformed_recording_filters_are_bad_requests(app_module):
+    client = app_module.app.test_client()
+    for query in ('date=yesterday', 'date=2024-13-01', 'start=soon', 'camera_id=front'):
+        response = client.get(f'/api/recordings?{query}')
+        assert response.status_code == 400, query
+    assert client.get('/api/recordings?date=2024-01-31').status_code == 200
+
+
+def test_snapshot_quality_outside_range_is_bad_request(app_module):
+    client = app_module.app.test_client()
+    assert client.get('/api/cameras/1/snapshot?quality=0').status_code == 400
+    assert client.get('/api/snapshots?quality=101').status_code == 400
+
+
+@pytest.fixture
+def recording(app_module):
+    recorder = app_module.video_recorder
+    filename = 'camera_1_range_test.mp4'
+    data = bytes(range(256)) * 40
+    with open(os.path.join(recorder.storage_dir, filename), 'wb') as f:
+        f.write(data)
+    recorder.catalog.add({'camera_id': 1, 'filename': filename, 'start_time': 1, 'end_time': 2, 'size': len(data)})
+    yield filename, data
+    recorder.delete_recording(filename)
+
+
+def test_recording_is_served_with_validators(app_module, recording):
+    filename, data = recording
+    response = app_module.app.test_client().get(f'/api/recordings/{filename}')
+    assert response.status_code == 200 and response.data == data
+    assert response.headers['Accept-Ranges'] == 'bytes'
+    assert response.headers['ETag'] and response.headers['Last-Modified']
+    assert response.cache_control.max_age == app_module.playback_settings['cache_max_age']
+
+
+@pytest.mark.parametrize('header, status, expected', [
+    ('bytes=10-19', 206, slice(10, 20)),
+    ('bytes=-5', 206, slice(-5, None)),
+    ('bytes=10200-', 206, slice(10200, None)),
+    ('bytes=20000-', 416, None),
+])
+def test_recording_byte_ranges(app_module, recording, header, status, expected):
+    filename, data = recording
+    response = app_module.app.test_client().get(f'/api/recordings/{filename}', headers={'Range': header})
+    assert response.status_code == status
+    assert response.headers['Content-Range'].endswith(f'/{len(data)}')
+    if expected is not None:
+        assert response.data == data[expected]
+
+
+def test_recording_conditional_requests(app_module, recording):
+    filename, data = recording
+    client = app_module.app.test_client()
+    first = client.get(f'/api/recordings/{filename}')
+    etag, modified = first.headers['ETag'], first.headers['Last-Modified']
+    assert client.get(f'/api/recordings/{filename}', headers={'If-None-Match': etag}).status_code == 304
+    assert client.get(f'/api/recordings/{filename}', headers={'If-Modified-Since': modified}).status_code == 304
+    # A range against a stale ETag gets the whole file
+    stale = client.get(f'/api/recordings/{filename}', headers={'Range': 'bytes=0-9', 'If-Range': '"stale"'})
+    assert stale.status_code == 200 and stale.data == data
+    fresh = client.get(f'/api/recordings/{filename}', headers={'Range': 'bytes=0-9', 'If-Range': etag})
+    assert fresh.status_code == 206 and fresh.data == data[:10]
+
+
+def test_only_cataloged_recordings_are_served(app_module, recording):
+    client = app_module.app.test_client()
+    assert client.get('/api/recordings/missing.mp4').status_code == 404
+    assert client.get('/api/recordings/../config.json').status_code == 404
+    assert client.get('/api/recordings/%2e%2e%2fconfig.json').status_code == 404
+
+
+def test_recording_can_be_handed_to_nginx(app_module, recording, monkeypatch):
+    filename, _ = recording
+    monkeypatch.setitem(app_module.playback_settings, 'x_accel_redirect', '/protected/')
+    response = app_module.app.test_client().get(f'/api/recordings/{filename}')
+    assert response.headers['X-Accel-Redirect'] == f'/protected/{filename}'
+    assert response.data == b''
@@ -0,0 +1,115 @@
+import asyncio
+import threading
+import time
+import pytest
+from live_fmp4 import LiveFmp4Stream
+
+
+@pytest.fixture
+def asgi_app(app_module, monkeypatch):
+    import asgi
+    stream = LiveFmp4Stream(1, 'rtsp://camera')
+    stream.init_segment = b'init'
+    stream.codec = 'avc1.42E01E'
+    stream.running = True
+    monkeypatch.setattr(asgi, 'start_live_fmp4', lambda camera_id, source=None: (stream, None))
+    yield asgi.application, stream
+    stream.broadcaster.close()
+
+
+def http_scope(path):
+    return {'type': 'http', 'method': 'GET', 'path': path, 'query_string': b'',
+            'headers': [(b'host', b'localhost')], 'http_version': '1.1'}
+
+
+class Client:
+    """Plays the ASGI server's part for one request; disconnect() is a closed tab"""
+
+    def __init__(self):
+        self.messages = []
+        self.gone = asyncio.Event()
+        self.requested = False
+
+    async def receive(self):
+        if not self.requested:
+            self.requested = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        await self.gone.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(self, message):
+        self.messages.append(message)
+
+    def body(self):
+        return b''.join(m.get('body', b'') for m in self.messages if m['type'] == 'http.response.body')
+
+
+def publish_fragments(stream, count, interval=0.02):
+    def run():
+        for _ in range(count):
+            stream.broadcaster.publish((b'frag', True))
+            time.sleep(interval)
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
+
+
+def test_live_fmp4_is_served_natively(asgi_app):
+    application, stream = asgi_app
+
+    async def run():
+        client = Client()
+        task = asyncio.ensure_future(application(http_scope('/live/1.mp4'), client.receive, client.send))
+        await asyncio.sleep(0.1)
+        await asyncio.to_thread(publish_fragments(stream, 5).join)
+        await asyncio.sleep(0.1)
+        client.gone.set()
+        await asyncio.wait_for(task, 2)
+        return client
+
+    client = asyncio.run(run())
+    start = client.messages[0]
+    assert start['status'] == 200
+    assert (b'x-codec', b'avc1.42E01E') in start['headers']
+    assert client.body().startswith(b'init')
+    assert client.body().count(b'frag') == 5
+    assert stream.broadcaster.subscribers == 0
+
+
+def test_closed_tab_ends_stream_without_new_fragments(asgi_app):
+    application, stream = asgi_app
+
+    async def run():
+        client = Client()
+        task = asyncio.ensure_future(application(http_scope('/live/1.mp4'), client.receive, client.send))
+        await asyncio.sleep(0.1)
+        assert stream.broadcaster.subscribers == 1
+        # Nothing is published, the camera is quiet; the viewer still has to go away
+        client.gone.set()
+        await asyncio.wait_for(task, 1)
+
+    asyncio.run(run())
+    assert stream.broadcaster.subscribers == 0
+    assert stream.broadcaster.waiting == 0
+
+
+def test_viewers_do_not_hold_worker_threads(asgi_app):
+    application, stream = asgi_app
+
+    async def run():
+        viewers = [Client() for _ in range(64)]
+        tasks = [asyncio.ensure_future(application(http_scope('/live/1.mp4'), c.receive, c.send)) for c in viewers]
+        await asyncio.sleep(0.3)
+        assert stream.broadcaster.subscribers == 64
+
+        # Every other request still goes through the worker threads
+        client = Client()
+        await asyncio.wait_for(application(http_scope('/api/health/live'), client.receive, client.send), 5)
+        assert client.messages[0]['status'] in (200, 503)
+
+        for viewer in viewers:
+            viewer.gone.set()
+        await asyncio.wait_for(asyncio.gather(*tasks), 2)
+
+    asyncio.run(run())
+    assert stream.broadcaster.subscribers == 0
@@ -0,0 +1,77 @@
+import asyncio
+import threading
+import time
+from broadcast import FrameBroadcaster
+
+
+def test_every_subscriber_gets_the_same_chunk():
+    broadcaster = FrameBroadcaster()
+    results = []
+
+    def subscriber():
+        results.append(broadcaster.wait(0, timeout=2))
+
+    threads = [threading.Thread(target=subscriber) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    assert broadcaster.wait_for_demand(timeout=2)
+    while broadcaster.waiting < 5:
+        time.sleep(0.01)
+    chunk = b'jpeg'
+    broadcaster.publish(chunk)
+    for thread in threads:
+        thread.join()
+    assert results == [(1, chunk)] * 5
+    assert all(result[1] is chunk for result in results)
+
+
+def test_slow_subscriber_skips_to_newest_chunk():
+    broadcaster = FrameBroadcaster()
+    for chunk in (b'a', b'b', b'c'):
+        broadcaster.publish(chunk)
+    assert broadcaster.wait(0, timeout=0) == (3, b'c')
+    assert broadcaster.wait(3, timeout=0) is None
+
+
+def test_no_demand_without_waiting_subscribers():
+    broadcaster = FrameBroadcaster()
+    broadcaster.subscribe()
+    assert not broadcaster.wait_for_demand(timeout=0.05)
+    broadcaster.unsubscribe()
+    broadcaster.unsubscribe()
+    assert broadcaster.subscribers == 0
+
+
+def test_close_wakes_subscribers():
+    broadcaster = FrameBroadcaster()
+    results = []
+    thread = threading.Thread(target=lambda: results.append(broadcaster.wait(0, timeout=5)))
+    thread.start()
+    broadcaster.wait_for_demand(timeout=2)
+    started = time.time()
+    broadcaster.close()
+    thread.join()
+    assert results == [None]
+    assert time.time() - started < 1
+    assert not broadcaster.wait_for_demand(timeout=0)
+
+
+def test_async_subscribers_are_woken_by_publish_and_close():
+    broadcaster = FrameBroadcaster()
+
+    async def run():
+        waiters = [asyncio.ensure_future(broadcaster.wait_async(0, timeout=5)) for _ in range(3)]
+        await asyncio.sleep(0.05)
+        assert broadcaster.waiting == 3
+        # Published from another thread, like the encoder does
+        await asyncio.to_thread(broadcaster.publish, b'chunk')
+        assert await asyncio.gather(*waiters) == [(1, b'chunk')] * 3
+
+        waiter = asyncio.ensure_future(broadcaster.wait_async(1, timeout=5))
+        await asyncio.sleep(0.05)
+        await asyncio.to_thread(broadcaster.close)
+        assert await asyncio.wait_for(waiter, 1) is None
+
+    asyncio.run(run())
+    assert broadcaster.waiting == 0
+    assert broadcaster.async_waiters == {}
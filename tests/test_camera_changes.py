@@ -0,0 +1,71 @@
+import threading
+import time
+import pytest
+from conftest import FakeIngestManager
+
+
+@pytest.fixture
+def viewing(app_module, monkeypatch):
+    """The app's live streams fed from fake ingests, with a short idle timeout"""
+    # A slow camera: the encoder thread spends most of its time waiting for a
+    # frame, which is when a quick reconnect used to race with it
+    manager = FakeIngestManager(fps=5)
+    handler = app_module.stream_handler
+    monkeypatch.setattr(handler, 'ingest_manager', manager)
+    monkeypatch.setattr(handler, 'idle_timeout', 0.3)
+    camera = dict(app_module.camera_manager.get_camera(1))
+    yield app_module
+    handler.stop_stream(1)
+    app_module.camera_manager.update_camera(1, {'rtsp_url': camera['rtsp_url']}, notify=False)
+    manager.stop_all()
+
+
+class Viewer(threading.Thread):
+    """Watches /stream/1 the way a browser tab does: reconnects when the stream ends"""
+
+    def __init__(self, app_module, seconds):
+        super().__init__(daemon=True)
+        self.app_module = app_module
+        self.seconds = seconds
+        self.connections = []
+
+    def run(self):
+        deadline = time.time() + self.seconds
+        while time.time() < deadline:
+            profile, error = self.app_module.start_live_stream(1)
+            assert error is None
+            frames = 0
+            self.connections.append(0)
+            for _ in self.app_module.stream_handler.generate_mjpeg(1, profile):
+                frames += 1
+                self.connections[-1] = frames
+                if time.time() > deadline:
+                    break
+
+
+def test_edit_while_viewing_reconnects_and_keeps_streaming(viewing):
+    viewer = Viewer(viewing, 2.5)
+    viewer.start()
+    time.sleep(0.3)
+
+    response = viewing.app.test_client().put('/api/cameras/1', json={'rtsp_url': 'rtsp://127.0.0.1:9/new'})
+    assert response.status_code == 200
+    viewer.join(timeout=10)
+
+    # One reconnect after the edit, and the new stream outlived the old
+    # encoder thread's idle timer instead of being stopped by it
+    assert len(viewer.connections) == 2
+    assert viewer.connections[0] >= 1
+    assert viewer.connections[1] >= 8
+    assert (1, 'full') in viewing.stream_handler.broadcasters
+
+
+def test_rename_does_not_interrupt_viewers(viewing):
+    viewer = Viewer(viewing, 1.0)
+    viewer.start()
+    time.sleep(0.3)
+    response = viewing.app.test_client().put('/api/cameras/1', json={'name': 'renamed'})
+    assert response.status_code == 200
+    viewer.join(timeout=10)
+    assert len(viewer.connections) == 1
+    viewing.camera_manager.update_camera(1, {'name': 'camera1'}, notify=False)
@@ -0,0 +1,44 @@
+import json
+import os
+from camera_manager import CameraManager
+
+
+def write_config(path, cameras):
+    with open(path, 'w') as f:
+        json.dump({'cameras': cameras, 'next_camera_id': len(cameras) + 1}, f)
+    # Make sure the change is visible even on filesystems with coarse mtimes
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+
+def test_reload_applies_external_edits(tmp_path):
+    path = tmp_path / 'config.json'
+    write_config(path, [{'id': 1, 'name': 'one', 'rtsp_url': 'rtsp://1'}])
+    manager = CameraManager(str(path), save_delay=60)
+    changes = []
+    manager.add_listener(lambda added, changed, removed: changes.append((added, changed, removed)))
+
+    write_config(path, [{'id': 1, 'name': 'one', 'rtsp_url': 'rtsp://1'},
+                        {'id': 2, 'name': 'two', 'rtsp_url': 'rtsp://2'}])
+    assert manager.reload()
+    assert manager.get_camera(2)['name'] == 'two'
+    assert [camera['id'] for camera in changes[0][0]] == [2]
+    assert not manager.reload()
+
+
+def test_reload_after_own_save_keeps_pending_changes(tmp_path):
+    path = tmp_path / 'config.json'
+    write_config(path, [{'id': 1, 'name': 'one', 'rtsp_url': 'rtsp://1'}])
+    manager = CameraManager(str(path), save_delay=60)
+
+    manager.update_camera(1, {'name': 'saved'}, notify=False)
+    manager.flush()
+    # The watcher saw the file change before the save above and reloads now,
+    # while the next API change is still waiting to be saved
+    manager.update_camera(1, {'name': 'pending'}, notify=False)
+    assert not manager.reload()
+    assert manager.get_camera(1)['name'] == 'pending'
+
+    manager.flush()
+    with open(path) as f:
+        assert json.load(f)['cameras'][0]['name'] == 'pending'
@@ -0,0 +1,110 @@
+import threading
+import time
+import pytest
+from camera_supervisor import CameraSupervisor, backoff_delay
+from conftest import FakeIngestManager
+
+
+class Cameras:
+    def __init__(self):
+        self.cameras = {1: {'id': 1, 'rtsp_url': 'rtsp://1'}}
+
+    def get_camera(self, camera_id):
+        return self.cameras.get(camera_id)
+
+    def list_cameras(self):
+        return list(self.cameras.values())
+
+    def update_camera(self, camera_id, changes, notify=True):
+        self.cameras[camera_id].update(changes)
+
+
+class Recorder:
+    """Records start/stop calls; starts block until gate is set, like a start waiting for a writer"""
+
+    def __init__(self):
+        self.active_recordings = {}
+        self.calls = []
+        self.gate = threading.Event()
+        self.gate.set()
+
+    def start_recording(self, camera_id, rtsp_url, mode='transcode'):
+        self.calls.append('start')
+        self.gate.wait(10)
+        self.active_recordings[camera_id] = True
+        return True
+
+    def stop_recording(self, camera_id):
+        self.calls.append('stop')
+        self.active_recordings[camera_id] = False
+        return True
+
+
+@pytest.fixture
+def supervisor():
+    return CameraSupervisor(FakeIngestManager(), Recorder(), Cameras(), retry_initial=1, retry_max=8)
+
+
+@pytest.mark.parametrize('attempt, low, high', [(1, 0.5, 1), (2, 1, 2), (4, 4, 8), (10, 30, 60), (50, 30, 60)])
+def test_backoff_delay_doubles_up_to_the_maximum(attempt, low, high):
+    delays = [backoff_delay(attempt, 1, 60) for _ in range(200)]
+    assert low <= min(delays) and max(delays) <= high
+    # Jittered, so cameras that dropped together spread out
+    assert len(set(delays)) > 1
+
+
+def test_start_recording_does_not_hold_the_lock(supervisor):
+    recorder = supervisor.video_recorder
+    recorder.gate.clear()
+    starter = threading.Thread(target=lambda: supervisor.start_recording(1))
+    starter.start()
+    time.sleep(0.1)
+
+    started = time.time()
+    assert supervisor.get_status()[1]['recording'] is False
+    supervisor._check_recordings(time.time())
+    # A second start of the same camera does not start a second recording
+    assert supervisor.start_recording(1) is False
+    assert time.time() - started < 0.5
+
+    recorder.gate.set()
+    starter.join(timeout=5)
+    assert supervisor.wants_recording(1)
+    assert supervisor.camera_manager.get_camera(1)['recording'] is True
+    assert recorder.calls == ['start']
+
+
+def test_ended_recording_is_restarted_with_backoff(supervisor):
+    recorder = supervisor.video_recorder
+    assert supervisor.start_recording(1)
+    recorder.active_recordings[1] = False
+
+    now = time.time()
+    supervisor._check_recordings(now)
+    assert supervisor.recordings[1]['attempts'] == 1
+    supervisor._check_recordings(now)
+    assert recorder.calls == ['start']
+
+    supervisor._check_recordings(now + 2)
+    assert recorder.calls == ['start', 'start']
+    assert supervisor.get_status()[1]['recording_restarts'] == 1
+
+
+def test_stop_while_restarting_stops_the_new_recording(supervisor):
+    recorder = supervisor.video_recorder
+    assert supervisor.start_recording(1)
+    recorder.active_recordings[1] = False
+    now = time.time()
+    supervisor._check_recordings(now)
+
+    recorder.gate.clear()
+    restart = threading.Thread(target=supervisor._check_recordings, args=(now + 2,))
+    restart.start()
+    time.sleep(0.1)
+    supervisor.stop_recording(1)
+    recorder.gate.set()
+    restart.join(timeout=5)
+
+    assert not supervisor.wants_recording(1)
+    assert recorder.active_recordings[1] is False
+    assert recorder.calls[-1] == 'stop'
@@ -0,0 +1,76 @@
+import time
+import numpy as np
+import pytest
+from multiprocessing import resource_tracker
+from capture_workers import WorkerIngest
+from frame_ring import FrameRing
+
+
+class Pool:
+    def attach(self, ingest):
+        pass
+
+    def detach(self, ingest):
+        pass
+
+
+@pytest.fixture
+def rings():
+    created = []
+
+    def make(shape=(4, 4, 3), slots=8):
+        ring = FrameRing(shape, slots, shared=True)
+        created.append(ring)
+        return ring
+
+    yield make
+    for ring in created:
+        # The reader unregistered the segment, in the process that created it here
+        resource_tracker.register(ring.shm._name, 'shared_memory')
+        ring.close(unlink=True)
+
+
+def wait_for(condition, timeout=2):
+    deadline = time.time() + timeout
+    while time.time() < deadline and not condition():
+        time.sleep(0.005)
+    return condition()
+
+
+def announce(ingest, ring):
+    ingest.on_format(ring.name, list(ring.shape), ring.slots, 10)
+
+
+def test_newest_of_several_format_events_wins(rings):
+    ingest = WorkerIngest(Pool(), 1, 'rtsp://camera', 8, poll_interval=0.001)
+    first, second = rings(), rings((8, 8, 3))
+    # Two resolution changes arrive before the reader gets to either of them
+    announce(ingest, first)
+    announce(ingest, second)
+    ingest.start()
+    try:
+        second.write(np.full((8, 8, 3), 7, dtype=np.uint8))
+        assert wait_for(lambda: ingest.buffer.latest() is not None)
+        seq, _, frame = ingest.buffer.latest()
+        assert frame.shape == (8, 8, 3) and frame[0, 0, 0] == 7
+        assert ingest.buffer.intact(seq)
+    finally:
+        ingest.stop()
+
+
+def test_format_change_while_reading(rings):
+    ingest = WorkerIngest(Pool(), 1, 'rtsp://camera', 8, poll_interval=0.001)
+    first = rings()
+    announce(ingest, first)
+    ingest.start()
+    try:
+        first.write(np.full((4, 4, 3), 1, dtype=np.uint8))
+        assert wait_for(lambda: ingest.buffer.sequence == 1)
+
+        second = rings((8, 8, 3))
+        announce(ingest, second)
+        second.write(np.full((8, 8, 3), 2, dtype=np.uint8))
+        assert wait_for(lambda: ingest.buffer.sequence == 2)
+        assert ingest.buffer.latest()[2][0, 0, 0] == 2
+    finally:
+        ingest.stop()
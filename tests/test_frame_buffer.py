@@ -0,0 +1,72 @@
+import numpy as np
+from camera_ingest import FrameBuffer
+from frame_ring import FrameRing
+from recorder import FRAMES_DROPPED, SegmentWriter, VideoRecorder
+
+
+def put_frames(buffer, count, start=1):
+    for value in range(start, start + count):
+        buffer.put(np.full((4, 4, 3), value, dtype=np.uint8))
+
+
+def test_wait_next_replays_in_order():
+    buffer = FrameBuffer(4)
+    put_frames(buffer, 3)
+    assert [buffer.wait_next(seq, timeout=0)[0] for seq in range(3)] == [1, 2, 3]
+    assert buffer.wait_latest(0, timeout=0)[0] == 3
+    assert buffer.wait_latest(3, timeout=0) is None
+
+
+def test_oldest_view_is_overwritten_by_the_next_frame():
+    buffer = FrameBuffer(4)
+    put_frames(buffer, 3)
+    seq, _, frame = buffer.wait_next(0, timeout=0)
+    assert seq == 1 and frame[0, 0, 0] == 1
+    assert buffer.intact(seq)
+
+    # The writer moves on while a lagging consumer still holds frame 1
+    put_frames(buffer, 1, start=4)
+    assert not buffer.intact(seq)
+    assert buffer.intact(4)
+    put_frames(buffer, 1, start=5)
+    assert frame[0, 0, 0] == 5
+
+
+def test_external_views_are_checked_against_their_ring():
+    ring = FrameRing((4, 4, 3), 4)
+    buffer = FrameBuffer(4)
+    for _ in range(3):
+        ring_seq = ring.write(np.full((4, 4, 3), ring.latest_seq() + 1, dtype=np.uint8))
+        timestamp, view = ring.entry(ring_seq)
+        buffer.put_view(view, timestamp, ring, ring_seq)
+    seq, _, frame = buffer.wait_next(0, timeout=0)
+    assert buffer.intact(seq)
+
+    # The worker writes ahead of what the buffer has been told about
+    for _ in range(4):
+        ring.write(np.zeros((4, 4, 3), dtype=np.uint8))
+    assert not buffer.intact(seq)
+    assert buffer.sequence == 3
+
+
+def test_segment_writer_drops_torn_copies(tmp_path):
+    recorder = VideoRecorder(str(tmp_path))
+    recorder.active_recordings[7] = True
+    writer = SegmentWriter(recorder, 7)
+    writer.start()
+    dropped = FRAMES_DROPPED.labels(7, 'overwritten')
+    before = dropped.value
+
+    buffer = FrameBuffer(4)
+    put_frames(buffer, 3)
+    seq, timestamp, frame = buffer.wait_next(0, timeout=0)
+    put_frames(buffer, 1, start=4)
+    assert writer.write(timestamp, frame, 10, buffer, seq)
+    assert dropped.value == before + 1
+
+    seq, timestamp, frame = buffer.latest()
+    assert writer.write(timestamp, frame, 10, buffer, seq)
+    assert dropped.value == before + 1
+    writer.close()
+    writer.thread.join(timeout=10)
+    recorder.active_recordings[7] = False
@@ -0,0 +1,42 @@
+import logging
+from logger import LOG_SUPPRESSED, RateLimitFilter
+
+
+def record(msg, level=logging.INFO, lineno=10):
+    return logging.LogRecord('nvr', level, 'recorder.py', lineno, msg, None, None)
+
+
+def test_distinct_messages_are_not_limited():
+    limit = RateLimitFilter(burst=5, window=60)
+    assert all(limit.filter(record(f"Closed segment camera_{i}_20260101_120000.mp4")) for i in range(8))
+    assert all(limit.filter(record(f"Deleted recording: camera_1_2026010{i}_120000.mp4")) for i in range(8))
+
+
+def test_repeated_message_is_limited_per_camera():
+    limit = RateLimitFilter(burst=5, window=60)
+    suppressed = LOG_SUPPRESSED.labels('rate_limit')
+    before = suppressed.value
+    results = [limit.filter(record("Failed to read frame from camera 3", logging.ERROR)) for _ in range(8)]
+    assert results == [True] * 5 + [False] * 3
+    assert suppressed.value == before + 3
+    # Another camera failing the same way has its own budget
+    assert limit.filter(record("Failed to read frame from camera 4", logging.ERROR))
+
+
+def test_next_message_after_window_reports_suppressed(monkeypatch):
+    limit = RateLimitFilter(burst=1, window=60)
+    now = [1000.0]
+    monkeypatch.setattr('logger.time.time', lambda: now[0])
+    assert limit.filter(record("Camera 3 is down"))
+    assert not limit.filter(record("Camera 3 is down"))
+    assert not limit.filter(record("Camera 3 is down"))
+    now[0] += 61
+    message = record("Camera 3 is down")
+    assert limit.filter(message)
+    assert message.suppressed == 2
+    assert message.getMessage() == "Camera 3 is down (2 similar messages suppressed)"
+
+
+def test_critical_messages_are_never_limited():
+    limit = RateLimitFilter(burst=1, window=60)
+    assert all(limit.filter(record("Disk full", logging.CRITICAL)) for _ in range(5))
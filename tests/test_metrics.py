@@ -0,0 +1,51 @@
+import threading
+import time
+import pytest
+from metrics import MetricsRegistry
+from recorder import RECORDED_BYTES, SEGMENTS_CLOSED
+from logger import LOG_SUPPRESSED
+
+
+class Yielding(int):
+    """An increment that lets other threads run between reading and writing the counter"""
+
+    def __radd__(self, other):
+        time.sleep(0)
+        return other + int(self)
+
+
+def increment_concurrently(child, amount=1, threads=8, count=500):
+    amount = Yielding(amount)
+    workers = [threading.Thread(target=lambda: [child.inc(amount) for _ in range(count)]) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+
+def test_shared_counter_does_not_lose_increments():
+    registry = MetricsRegistry()
+    counter = registry.counter('test_total', "Test", ['camera'], shared=True)
+    child = counter.labels(1)
+    increment_concurrently(child)
+    assert child.value == 4000
+    assert 'test_total{camera="1"} 4000' in registry.render_prometheus()
+
+
+@pytest.mark.parametrize('counter', [RECORDED_BYTES, SEGMENTS_CLOSED, LOG_SUPPRESSED])
+def test_multi_writer_counters_do_not_lose_increments(counter):
+    # Several recorder writer threads, or every logging thread, update these
+    child = counter.labels('concurrency-test')
+    try:
+        increment_concurrently(child, amount=3)
+        assert child.value == 12000
+    finally:
+        counter.remove('concurrency-test')
+
+
+def test_same_name_is_one_metric():
+    registry = MetricsRegistry()
+    first = registry.gauge('test_depth', "Test", ['queue'])
+    assert registry.gauge('test_depth', "Test", ['queue']) is first
+    first.labels('a').set(3)
+    assert registry.to_json()['test_depth']['samples'] == [{'labels': {'queue': 'a'}, 'value': 3}]
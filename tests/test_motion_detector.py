@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+from motion_detector import MotionAnalyzer
+
+
+def scene(width=640, height=480, box=None, shade=200):
+    """A flat grey frame, with a bright box at (x, y, w, h) fractions of the frame"""
+    frame = np.full((height, width, 3), 60, np.uint8)
+    if box:
+        x, y, w, h = box
+        frame[int(y * height):int((y + h) * height), int(x * width):int((x + w) * width)] = shade
+    return frame
+
+
+def test_first_frame_and_static_scene_have_no_motion():
+    analyzer = MotionAnalyzer()
+    assert analyzer.analyze(scene()) == 0.0
+    assert analyzer.analyze(scene()) == 0.0
+
+
+def test_score_is_the_changed_fraction():
+    analyzer = MotionAnalyzer()
+    analyzer.analyze(scene())
+    score = analyzer.analyze(scene(box=(0.5, 0.5, 0.25, 0.5)))
+    assert score == pytest.approx(0.125, abs=0.01)
+    assert analyzer.is_motion(score)
+
+
+def test_small_brightness_changes_are_ignored():
+    analyzer = MotionAnalyzer(sensitivity=50)
+    analyzer.analyze(scene())
+    noisy = scene().astype(np.int16) + np.random.default_rng(1).integers(-8, 9, (480, 640, 1))
+    assert analyzer.analyze(noisy.clip(0, 255).astype(np.uint8)) == 0.0
+
+
+def test_masked_area_is_ignored():
+    analyzer = MotionAnalyzer(mask=[[0, 0, 0.5, 1]])
+    analyzer.analyze(scene())
+    assert analyzer.analyze(scene(box=(0, 0, 0.5, 1))) == 0.0
+    # The score is relative to the unmasked half
+    assert analyzer.analyze(scene(box=(0.5, 0, 0.25, 1))) == pytest.approx(0.5, abs=0.02)
+
+
+def test_fully_masked_frame_has_no_motion():
+    analyzer = MotionAnalyzer(mask=[[0, 0, 1, 1]])
+    analyzer.analyze(scene())
+    assert analyzer.analyze(scene(box=(0, 0, 1, 1))) == 0.0
+
+
+def test_large_frames_are_analysed_at_the_analysis_width():
+    analyzer = MotionAnalyzer(analysis_width=160)
+    analyzer.analyze(scene(1920, 1080))
+    assert analyzer.background.shape == (90, 160)
+    # A change of resolution starts over with a new background
+    assert analyzer.analyze(scene(640, 480, box=(0, 0, 1, 1))) == 0.0
+    assert analyzer.background.shape == (120, 160)
+
+
+def test_background_absorbs_a_stopped_object():
+    analyzer = MotionAnalyzer(learning_rate=0.5)
+    analyzer.analyze(scene())
+    parked = scene(box=(0, 0, 0.5, 0.5))
+    scores = [analyzer.analyze(parked) for _ in range(10)]
+    assert scores[0] > 0.2 and scores[-1] == 0.0
+
+
+def test_higher_sensitivity_detects_smaller_motion():
+    low, high = MotionAnalyzer(sensitivity=1), MotionAnalyzer(sensitivity=100)
+    assert high.pixel_threshold < low.pixel_threshold and high.min_area < low.min_area
+    for analyzer in (low, high):
+        analyzer.analyze(scene())
+    faint = scene(box=(0.4, 0.4, 0.1, 0.1), shade=90)
+    assert not low.is_motion(low.analyze(faint))
+    assert high.is_motion(high.analyze(faint))
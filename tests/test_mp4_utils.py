@@ -0,0 +1,151 @@
+import io
+import struct
+import cv2
+import numpy as np
+import pytest
+import mp4_utils
+
+
+def box(box_type, *children):
+    payload = b''.join(children)
+    return struct.pack('>I4s', 8 + len(payload), box_type) + payload
+
+
+def full_box(box_type, payload, flags=0):
+    return box(box_type, struct.pack('>I', flags), payload)
+
+
+SAMPLES = [bytes([i]) * (10 * (i + 1)) for i in range(6)]
+
+
+def movie(path, keyframes=(1, 4)):
+    """A moov-at-end MP4 with one video track of six samples in two chunks of three"""
+    ftyp = box(b'ftyp', b'isom', struct.pack('>I', 512), b'isomiso2')
+    mdat = box(b'mdat', *SAMPLES)
+    first_chunk = len(ftyp) + 8
+    chunks = [first_chunk, first_chunk + sum(len(s) for s in SAMPLES[:3])]
+    stbl = box(b'stbl',
+               full_box(b'stts', struct.pack('>III', 1, len(SAMPLES), 500)),
+               full_box(b'stsz', struct.pack(f'>II{len(SAMPLES)}I', 0, len(SAMPLES), *map(len, SAMPLES))),
+               full_box(b'stsc', struct.pack('>IIII', 1, 1, 3, 1)),
+               full_box(b'stco', struct.pack(f'>I{len(chunks)}I', len(chunks), *chunks)),
+               full_box(b'stss', struct.pack(f'>I{len(keyframes)}I', len(keyframes), *keyframes)))
+    mdia = box(b'mdia',
+               full_box(b'mdhd', struct.pack('>IIII', 0, 0, 1000, 3000)),
+               full_box(b'hdlr', struct.pack('>I4s', 0, b'vide') + bytes(13)),
+               box(b'minf', stbl))
+    moov = box(b'moov', full_box(b'mvhd', struct.pack('>IIII', 0, 0, 1000, 3000)), box(b'trak', mdia))
+    with open(path, 'wb') as f:
+        f.write(ftyp + mdat + moov)
+    return path
+
+
+def sample_at(path, offset, index):
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        return f.read(len(SAMPLES[index]))
+
+
+def test_read_keyframes_maps_sync_samples_to_offsets(tmp_path):
+    path = movie(tmp_path / 'a.mp4')
+    keyframes = mp4_utils.read_keyframes(path)
+    assert [time for time, _ in keyframes] == [0.0, 1.5]
+    assert [sample_at(path, offset, index) for (_, offset), index in zip(keyframes, (0, 3))] == [SAMPLES[0], SAMPLES[3]]
+    assert mp4_utils.read_duration(path) == 3.0
+
+
+def test_without_sync_sample_table_every_sample_is_a_keyframe(tmp_path):
+    path = movie(tmp_path / 'a.mp4', keyframes=())
+    data = bytearray(path.read_bytes())
+    # Rename the empty stss so the track has no sync sample table
+    stss = data.index(b'stss')
+    data[stss:stss + 4] = b'free'
+    path.write_bytes(bytes(data))
+    assert [time for time, _ in mp4_utils.read_keyframes(path)] == [0.0, 0.5, 1.0, 1.5, 2.0, 2.5]
+
+
+def test_read_keyframes_of_file_without_moov(tmp_path):
+    path = tmp_path / 'a.mp4'
+    path.write_bytes(box(b'ftyp', b'isom') + box(b'mdat', b'x' * 10))
+    assert mp4_utils.read_keyframes(path) == []
+    assert mp4_utils.read_duration(path) is None
+
+
+def test_faststart_moves_moov_and_shifts_chunk_offsets(tmp_path):
+    path = movie(tmp_path / 'a.mp4')
+    size = path.stat().st_size
+    assert mp4_utils.faststart(str(path), preallocate=True)
+    assert [b[0] for b in mp4_utils.read_top_level_boxes(path)] == [b'ftyp', b'moov', b'mdat']
+    assert path.stat().st_size == size
+    keyframes = mp4_utils.read_keyframes(path)
+    assert [sample_at(path, offset, index) for (_, offset), index in zip(keyframes, (0, 3))] == [SAMPLES[0], SAMPLES[3]]
+    # Already fast-start
+    assert not mp4_utils.faststart(str(path))
+
+
+def test_faststart_keeps_a_real_recording_playable(tmp_path):
+    path = str(tmp_path / 'cv.mp4')
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), 10, (64, 48))
+    for i in range(20):
+        writer.write(np.full((48, 64, 3), i * 10, np.uint8))
+    writer.release()
+    assert mp4_utils.read_top_level_boxes(path)[-1][0] == b'moov'
+
+    assert mp4_utils.faststart(path)
+    capture = cv2.VideoCapture(path)
+    frames = []
+    while True:
+        ok, frame = capture.read()
+        if not ok:
+            break
+        frames.append(int(frame.mean()))
+    capture.release()
+    assert len(frames) == 20
+    assert frames[-1] == pytest.approx(190, abs=5)
+
+
+def test_read_box_reads_complete_boxes():
+    large = struct.pack('>I4sQ', 1, b'mdat', 16 + 4) + b'data'
+    stream = io.BytesIO(box(b'moof', b'abc') + large + box(b'mdat', b'xyz')[:-1])
+    assert mp4_utils.read_box(stream) == (b'moof', box(b'moof', b'abc'))
+    assert mp4_utils.read_box(stream) == (b'mdat', large)
+    # A box cut off by the end of the stream
+    assert mp4_utils.read_box(stream) is None
+    assert mp4_utils.read_box(stream) is None
+
+
+def test_read_box_rejects_sizes_below_the_header():
+    with pytest.raises(ValueError):
+        mp4_utils.read_box(io.BytesIO(struct.pack('>I4s', 4, b'moof')))
+
+
+NON_SYNC = 0x10000
+
+
+def fragment(tfhd_flags=0, tfhd_fields=b'', trun_flags=0, trun_fields=b''):
+    traf = box(b'traf',
+               full_box(b'tfhd', struct.pack('>I', 1) + tfhd_fields, tfhd_flags),
+               full_box(b'trun', struct.pack('>I', 1) + trun_fields, trun_flags))
+    return box(b'moof', full_box(b'mfhd', struct.pack('>I', 1)), traf)
+
+
+@pytest.mark.parametrize('flags, expected', [(0x2000000, True), (0x1010000, False)])
+def test_first_sample_flags_decide_the_keyframe(flags, expected):
+    moof = fragment(trun_flags=0x1 | 0x4, trun_fields=struct.pack('>iI', 0, flags))
+    assert mp4_utils.fragment_starts_with_keyframe(moof) is expected
+
+
+@pytest.mark.parametrize('flags, expected', [(0, True), (NON_SYNC, False)])
+def test_per_sample_flags_follow_duration_and_size(flags, expected):
+    moof = fragment(trun_flags=0x100 | 0x200 | 0x400, trun_fields=struct.pack('>III', 3000, 1234, flags))
+    assert mp4_utils.fragment_starts_with_keyframe(moof) is expected
+
+
+@pytest.mark.parametrize('flags, expected', [(0, True), (NON_SYNC, False)])
+def test_default_sample_flags_from_tfhd(flags, expected):
+    moof = fragment(tfhd_flags=0x8 | 0x20, tfhd_fields=struct.pack('>II', 3000, flags))
+    assert mp4_utils.fragment_starts_with_keyframe(moof) is expected
+
+
+def test_fragment_without_track_is_not_a_keyframe():
+    assert not mp4_utils.fragment_starts_with_keyframe(box(b'moof', full_box(b'mfhd', struct.pack('>I', 1))))
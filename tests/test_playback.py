@@ -0,0 +1,84 @@
+import os
+import shutil
+import cv2
+import numpy as np
+import pytest
+import mp4_utils
+from playback import PlaybackStitcher
+from recordings_catalog import RecordingsCatalog
+
+START = 1700000000
+
+
+class Recorder:
+    def __init__(self, storage_dir):
+        self.storage_dir = storage_dir
+        self.catalog = RecordingsCatalog(storage_dir)
+
+
+@pytest.fixture
+def recorder(tmp_path):
+    return Recorder(str(tmp_path))
+
+
+def add(recorder, filename, start, seconds, shade=None):
+    """Catalog a segment; with a shade, also write it as a 10 fps file of flat frames"""
+    if shade is not None:
+        writer = cv2.VideoWriter(os.path.join(recorder.storage_dir, filename),
+                                 cv2.VideoWriter_fourcc(*'mp4v'), 10, (64, 48))
+        for _ in range(int(seconds * 10)):
+            writer.write(np.full((48, 64, 3), shade, np.uint8))
+        writer.release()
+    recorder.catalog.add({'camera_id': 1, 'filename': filename,
+                          'start_time': START + start, 'end_time': START + start + seconds})
+
+
+def test_find_segments_trims_the_ends(recorder):
+    add(recorder, 'a.mp4', 0, 60)
+    add(recorder, 'b.mp4', 60, 60)
+    add(recorder, 'c.mp4', 120, 60)
+    segments = PlaybackStitcher(recorder).find_segments(1, START + 30, START + 90)
+    assert [(s['filename'], s['inpoint'], s['outpoint']) for s in segments] == [('a.mp4', 30, 60), ('b.mp4', 0, 30)]
+
+
+def test_segment_that_only_touches_the_range_is_skipped(recorder):
+    add(recorder, 'a.mp4', 0, 60)
+    add(recorder, 'b.mp4', 60, 60)
+    segments = PlaybackStitcher(recorder).find_segments(1, START + 60, START + 70)
+    assert [s['filename'] for s in segments] == ['b.mp4']
+
+
+def test_concat_list_only_trims_where_needed(recorder):
+    add(recorder, "it's.mp4", 0, 60)
+    add(recorder, 'b.mp4', 60, 60)
+    stitcher = PlaybackStitcher(recorder)
+    script = stitcher._build_concat_list(stitcher.find_segments(1, START + 30, START + 120))
+    path = os.path.abspath(os.path.join(recorder.storage_dir, 'it'))
+    assert script.splitlines() == [
+        'ffconcat version 1.0',
+        f"file 'file:{path}'\\''s.mp4'",
+        'inpoint 30.0',
+        f"file 'file:{os.path.abspath(os.path.join(recorder.storage_dir, 'b.mp4'))}'",
+    ]
+
+
+@pytest.mark.skipif(shutil.which('ffmpeg') is None, reason="needs ffmpeg")
+def test_stream_stitches_segments_into_one_fragmented_mp4(recorder, tmp_path):
+    add(recorder, 'a.mp4', 0, 2, shade=40)
+    add(recorder, 'b.mp4', 2, 2, shade=200)
+    stitcher = PlaybackStitcher(recorder, chunk_size=1024)
+    output = tmp_path / 'out.mp4'
+    output.write_bytes(b''.join(stitcher.stream(stitcher.find_segments(1, START, START + 4))))
+
+    boxes = [box[0] for box in mp4_utils.read_top_level_boxes(output)]
+    assert boxes[:2] == [b'ftyp', b'moov'] and b'moof' in boxes
+    capture = cv2.VideoCapture(str(output))
+    shades = []
+    while True:
+        ok, frame = capture.read()
+        if not ok:
+            break
+        shades.append(int(frame.mean()))
+    capture.release()
+    assert len(shades) == 40
+    assert shades[0] == pytest.approx(40, abs=5) and shades[-1] == pytest.approx(200, abs=5)
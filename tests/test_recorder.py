@@ -0,0 +1,116 @@
+import os
+import threading
+import time
+import numpy as np
+import pytest
+from recorder import RECORD_QUEUE_DEPTH, SegmentWriter, VideoRecorder
+
+
+def test_restart_within_one_second_keeps_both_segments(ingest_manager, tmp_path):
+    recorder = VideoRecorder(str(tmp_path), ingest_manager)
+    for _ in range(3):
+        assert recorder.start_recording(1, 'rtsp://camera')
+        time.sleep(0.2)
+        assert recorder.stop_recording(1)
+
+    # stop_recording returns once the last segment has been published
+    files = sorted(f for f in os.listdir(tmp_path) if f.endswith('.mp4'))
+    assert len(files) == 3
+    assert not [f for f in files if f.startswith('.')]
+    assert recorder.count_recordings(1) == 3
+    assert not recorder.open_segments
+    assert 1 not in recorder.segment_writers
+
+
+def test_suffixed_names_are_reconciled(ingest_manager, tmp_path):
+    recorder = VideoRecorder(str(tmp_path), ingest_manager)
+    for _ in range(2):
+        recorder.start_recording(1, 'rtsp://camera')
+        time.sleep(0.2)
+        recorder.stop_recording(1)
+
+    os.remove(os.path.join(tmp_path, 'recordings.db'))
+    reopened = VideoRecorder(str(tmp_path), ingest_manager)
+    assert reopened.count_recordings(1) == 2
+
+
+def test_unknown_fsync_policy_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        VideoRecorder(str(tmp_path), fsync='always')
+
+
+@pytest.mark.parametrize('policy', ['none', 'segment', 'interval'])
+def test_fsync_policy(ingest_manager, tmp_path, monkeypatch, policy):
+    synced = []
+    monkeypatch.setattr(VideoRecorder, '_sync_file', staticmethod(synced.append))
+    recorder = VideoRecorder(str(tmp_path), ingest_manager, fsync=policy, fsync_interval=0.05)
+    recorder.start_recording(1, 'rtsp://camera')
+    time.sleep(0.5)
+    recorder.stop_recording(1)
+
+    open_segment = [path for path in synced if os.path.basename(path).startswith('.camera_1_')]
+    if policy == 'none':
+        assert synced == []
+    elif policy == 'segment':
+        # The closed file and then the directory holding its new name
+        assert len(open_segment) == 1 and synced[-1] == str(tmp_path)
+    else:
+        assert len(open_segment) > 3 and str(tmp_path) in synced
+
+
+def test_stalled_disk_does_not_block_capture(ingest_manager, tmp_path, monkeypatch):
+    recorder = VideoRecorder(str(tmp_path), ingest_manager)
+    disk = threading.Event()
+    open_segment = recorder._open_segment
+
+    def stalled_open(*args):
+        disk.wait(10)
+        return open_segment(*args)
+
+    monkeypatch.setattr(recorder, '_open_segment', stalled_open)
+    recorder.active_recordings[1] = True
+    writer = SegmentWriter(recorder, 1, max_frames=3)
+    writer.start()
+    frame = np.zeros((48, 64, 3), dtype=np.uint8)
+    depth = RECORD_QUEUE_DEPTH.labels('record_write', 1)
+
+    # One frame is being written, three wait in the queue
+    for _ in range(4):
+        assert writer.write(time.time(), frame, 10)
+    assert depth.value == 3
+
+    # The recording thread blocks on a full queue; the ingest's own buffer keeps filling meanwhile
+    blocked = threading.Thread(target=writer.write, args=(time.time(), frame, 10))
+    blocked.start()
+    blocked.join(timeout=0.3)
+    assert blocked.is_alive()
+    disk.set()
+    blocked.join(timeout=5)
+    assert not blocked.is_alive()
+
+    writer.close()
+    writer.thread.join(timeout=10)
+    recorder.active_recordings[1] = False
+    assert depth.value == 0
+    assert len([f for f in os.listdir(tmp_path) if f.endswith('.mp4')]) == 1
+
+
+def test_stopped_recording_gives_up_on_a_full_queue(tmp_path, monkeypatch):
+    recorder = VideoRecorder(str(tmp_path))
+    disk = threading.Event()
+    open_segment = recorder._open_segment
+    monkeypatch.setattr(recorder, '_open_segment', lambda *args: disk.wait(10) and open_segment(*args))
+    recorder.active_recordings[2] = True
+    writer = SegmentWriter(recorder, 2, max_frames=1)
+    writer.start()
+    frame = np.zeros((48, 64, 3), dtype=np.uint8)
+    writer.write(time.time(), frame, 10)
+    writer.write(time.time(), frame, 10)
+
+    recorder.active_recordings[2] = False
+    started = time.time()
+    assert not writer.write(time.time(), frame, 10)
+    assert time.time() - started < 2
+    disk.set()
+    writer.close()
+    writer.thread.join(timeout=10)
@@ -0,0 +1,116 @@
+import time
+import pytest
+import retention
+from recordings_catalog import RecordingsCatalog
+from retention import RetentionService
+
+DAY = 86400
+
+
+class Recorder:
+    def __init__(self, storage_dir):
+        self.storage_dir = storage_dir
+        self.catalog = RecordingsCatalog(storage_dir)
+        self.deleted = []
+        self.failing = set()
+
+    def delete_recording(self, filename):
+        if filename in self.failing:
+            return False
+        self.catalog.remove([filename])
+        self.deleted.append(filename)
+        return True
+
+
+class Cameras:
+    def __init__(self, cameras, retention_days=7):
+        self.cameras = cameras
+        self.retention_days = retention_days
+
+    def get_settings(self):
+        return {'retention_days': self.retention_days}
+
+    def list_cameras(self):
+        return self.cameras
+
+
+@pytest.fixture
+def recorder(tmp_path):
+    return Recorder(str(tmp_path))
+
+
+def add(recorder, camera_id, days_ago, name=None):
+    end_time = time.time() - days_ago * DAY
+    filename = name or f'camera_{camera_id}_{days_ago}.mp4'
+    recorder.catalog.add({'camera_id': camera_id, 'filename': filename,
+                          'start_time': end_time - 60, 'end_time': end_time})
+    return filename
+
+
+def service(recorder, cameras, **options):
+    options.setdefault('max_deletes_per_second', 0)
+    retention_service = RetentionService(recorder, cameras, **options)
+    # run_once() is normally called from the service thread, which only deletes while running
+    retention_service.running = True
+    return retention_service
+
+
+@pytest.fixture(autouse=True)
+def plenty_of_space(monkeypatch):
+    monkeypatch.setattr(retention.SystemMonitor, 'get_disk_usage', staticmethod(lambda path: {'percent': 50}))
+
+
+def test_age_eviction_honours_camera_overrides(recorder):
+    cameras = Cameras([{'id': 1}, {'id': 2, 'retention_days': 1}])
+    old = add(recorder, 1, 8)
+    add(recorder, 1, 2)
+    short_lived = add(recorder, 2, 2)
+    add(recorder, 2, 0.5)
+    event = recorder.catalog.start_motion_event(1, time.time() - 9 * DAY)
+    recorder.catalog.end_motion_event(event, time.time() - 9 * DAY + 10, 0.5)
+    recorder.catalog.start_motion_event(1, time.time() - 3 * DAY)
+
+    assert service(recorder, cameras).run_once() == 2
+    assert sorted(recorder.deleted) == sorted([old, short_lived])
+    assert recorder.catalog.count() == 2
+    # Motion events live as long as the longest retention period
+    assert len(recorder.catalog.query_motion_events()) == 1
+
+
+def test_age_eviction_deletes_in_batches_oldest_first(recorder):
+    for days in (12, 10, 14, 9, 11):
+        add(recorder, 1, days)
+    assert service(recorder, Cameras([{'id': 1}]), batch_size=2).run_once() == 5
+    assert recorder.deleted == [f'camera_1_{days}.mp4' for days in (14, 12, 11, 10, 9)]
+
+
+def test_disk_pressure_evicts_oldest_until_space_is_free(recorder, monkeypatch):
+    for days in range(7):
+        add(recorder, 1, days)
+    # Every recording takes 1% of the disk on top of 85%
+    monkeypatch.setattr(retention.SystemMonitor, 'get_disk_usage',
+                        staticmethod(lambda path: {'percent': 85 + recorder.catalog.count()}))
+    # batch_size 10 evicts one segment per free space check
+    assert service(recorder, Cameras([{'id': 1}]), min_free_percent=10, batch_size=10).run_once() == 2
+    assert recorder.deleted == ['camera_1_6.mp4', 'camera_1_5.mp4']
+
+
+def test_disk_pressure_gives_up_when_nothing_can_be_deleted(recorder, monkeypatch):
+    recorder.failing.add(add(recorder, 1, 1))
+    monkeypatch.setattr(retention.SystemMonitor, 'get_disk_usage', staticmethod(lambda path: {'percent': 99}))
+    assert service(recorder, Cameras([{'id': 1}])).run_once() == 0
+
+
+def test_deletes_are_paced(recorder):
+    for days in (10, 11, 12, 13):
+        add(recorder, 1, days)
+    started = time.time()
+    assert service(recorder, Cameras([{'id': 1}]), max_deletes_per_second=20).run_once() == 4
+    assert time.time() - started >= 0.18
+
+
+def test_stopped_service_deletes_nothing(recorder):
+    add(recorder, 1, 30)
+    retention_service = service(recorder, Cameras([{'id': 1}]))
+    retention_service.running = False
+    assert retention_service.run_once() == 0
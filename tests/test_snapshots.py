@@ -0,0 +1,66 @@
+import time
+import cv2
+import numpy as np
+import pytest
+from snapshots import SnapshotService
+from conftest import FakeIngestManager
+
+
+def camera(camera_id):
+    return {'id': camera_id, 'rtsp_url': f'rtsp://camera{camera_id}'}
+
+
+@pytest.fixture
+def cameras():
+    manager = FakeIngestManager(dead=(2, 3, 4, 5))
+    yield manager
+    manager.stop_all()
+
+
+def test_snapshot_is_resized_and_cached(ingest_manager):
+    service = SnapshotService(ingest_manager, None, wait_timeout=2)
+    jpeg, seq, _ = service.get(camera(1), width=32)
+    assert cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_COLOR).shape[1] == 32
+    ingest_manager.ingests[1].stop()
+    assert service.get(camera(1), width=32)[0] == jpeg
+
+
+@pytest.mark.parametrize('width', [0, -5])
+def test_width_below_one_is_rejected(ingest_manager, width):
+    service = SnapshotService(ingest_manager, None, wait_timeout=2)
+    with pytest.raises(ValueError):
+        service.get(camera(1), width=width)
+    with pytest.raises(ValueError):
+        service.get_many([camera(1)], width=width)
+
+
+@pytest.mark.parametrize('quality', [0, -1, 101])
+def test_quality_outside_range_is_rejected(ingest_manager, quality):
+    service = SnapshotService(ingest_manager, None, wait_timeout=2)
+    with pytest.raises(ValueError):
+        service.get(camera(1), quality=quality)
+    with pytest.raises(ValueError):
+        service.get_many([camera(1)], quality=quality)
+
+
+def test_quality_is_applied(ingest_manager):
+    service = SnapshotService(ingest_manager, None, quality=90, wait_timeout=2)
+    assert len(service.get(camera(1), quality=1)[0]) < len(service.get(camera(1))[0])
+
+
+def test_batch_waits_once_for_unreachable_cameras(cameras):
+    service = SnapshotService(cameras, None, wait_timeout=1)
+    started = time.time()
+    results = service.get_many([camera(camera_id) for camera_id in (1, 2, 3, 4, 5)])
+    elapsed = time.time() - started
+    assert results[1] is not None
+    assert [results[camera_id] for camera_id in (2, 3, 4, 5)] == [None] * 4
+    assert elapsed < 1.5
+
+
+@pytest.mark.parametrize('path', ['/api/cameras/1/snapshot?width=-5', '/api/cameras/1/snapshot?width=0',
+                                  '/api/snapshots?width=-5'])
+def test_snapshot_routes_reject_bad_width(app_module, path):
+    response = app_module.app.test_client().get(path)
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'width must be at least 1'}
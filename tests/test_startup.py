@@ -0,0 +1,49 @@
+import time
+from startup import StartupOrchestrator
+from conftest import FakeIngestManager
+
+
+class Cameras:
+    def __init__(self, cameras):
+        self.cameras = {camera['id']: camera for camera in cameras}
+
+    def list_cameras(self):
+        return list(self.cameras.values())
+
+    def get_camera(self, camera_id):
+        return self.cameras.get(camera_id)
+
+    def get_motion_settings(self, camera):
+        return {'enabled': False}
+
+
+class Supervisor:
+    def start_recording(self, camera_id):
+        return True
+
+
+def bring_up(cameras, ingest_manager):
+    orchestrator = StartupOrchestrator(Cameras(cameras), ingest_manager, Supervisor(), None, connect_timeout=0.5)
+    orchestrator.start()
+    orchestrator.thread.join(timeout=5)
+    return orchestrator.get_status()
+
+
+def test_cameras_nothing_reads_are_idle_not_ready():
+    ingest_manager = FakeIngestManager(dead=(3,))
+    try:
+        status = bring_up([
+            {'id': 1, 'rtsp_url': 'rtsp://1', 'recording': True},
+            {'id': 2, 'rtsp_url': 'rtsp://2'},
+            {'id': 3, 'rtsp_url': 'rtsp://3', 'recording': True},
+        ], ingest_manager)
+    finally:
+        ingest_manager.stop_all()
+
+    assert status['ready']
+    cameras = status['cameras']
+    assert cameras[1]['state'] == 'ready' and cameras[1]['connect_seconds'] is not None
+    assert cameras[2] == {'state': 'idle', 'connect_seconds': None, 'recording': False}
+    assert cameras[3]['state'] == 'timeout'
+    assert status['states'] == {'ready': 1, 'idle': 1, 'timeout': 1}
+    assert 2 not in ingest_manager.ingests
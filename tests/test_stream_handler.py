@@ -0,0 +1,74 @@
+import time
+from stream_handler import StreamHandler
+
+
+def read_frames(handler, camera_id, seconds):
+    """Consume the MJPEG stream like a viewer and return how many frames arrived"""
+    frames = 0
+    deadline = time.time() + seconds
+    for _ in handler.generate_mjpeg(camera_id):
+        frames += 1
+        if time.time() > deadline:
+            break
+    return frames
+
+
+def wait_until(condition, timeout=3):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return condition()
+
+
+def test_viewer_receives_frames(ingest_manager):
+    handler = StreamHandler(ingest_manager, idle_timeout=1)
+    handler.start_stream(1, 'rtsp://camera')
+    try:
+        assert read_frames(handler, 1, 0.5) > 5
+        assert handler.get_frame(1) is not None
+    finally:
+        handler.stop_stream(1)
+
+
+def test_restart_is_not_killed_by_previous_encoder(ingest_manager):
+    handler = StreamHandler(ingest_manager, idle_timeout=0.3)
+    handler.start_stream(1, 'rtsp://camera')
+    assert read_frames(handler, 1, 0.2) > 0
+
+    # An edit restarts the stream right away; the old encoder thread must
+    # end on its own broadcaster and leave the new one alone
+    handler.stop_stream(1)
+    handler.start_stream(1, 'rtsp://camera')
+    broadcaster = handler.broadcasters[(1, 'full')]
+    assert wait_until(lambda: (1, 'live-full') in ingest_manager.released)
+
+    # Well past the old thread's idle timer
+    frames = read_frames(handler, 1, 2.0)
+    assert frames > 40
+    assert handler.broadcasters.get((1, 'full')) is broadcaster
+    assert not broadcaster.closed
+    assert ingest_manager.released.count((1, 'live-full')) == 1
+    handler.stop_stream(1)
+
+
+def test_idle_stream_stops_itself(ingest_manager):
+    handler = StreamHandler(ingest_manager, idle_timeout=0.2)
+    handler.start_stream(1, 'rtsp://camera')
+    assert wait_until(lambda: (1, 'full') not in handler.broadcasters)
+    assert wait_until(lambda: (1, 'live-full') in ingest_manager.released)
+    assert not handler.active_streams[(1, 'full')]
+
+
+def test_get_frame_of_stopped_stream_is_none(ingest_manager):
+    handler = StreamHandler(ingest_manager)
+    assert handler.get_frame(1) is None
+    handler.start_stream(1, 'rtsp://camera')
+    assert handler.get_frame(1) is None
+    # A stop that lands between get_frame's lookups leaves no lock behind
+    handler.frames[(1, 'full')] = memoryview(b'jpeg')
+    handler.stream_locks.pop((1, 'full'))
+    assert handler.get_frame(1) is None
+    handler.stop_stream(1)
+    assert handler.get_frame(1) is None
@@ -0,0 +1,58 @@
+import cv2
+import numpy as np
+import pytest
+from thumbnails import ThumbnailService
+
+
+class Catalog:
+    def __init__(self):
+        self.thumbnails = {}
+
+    def get_thumbnails(self, filenames):
+        return {f: self.thumbnails[f] for f in filenames if f in self.thumbnails}
+
+
+class Recorder:
+    def __init__(self, storage_dir):
+        self.storage_dir = storage_dir
+        self.catalog = Catalog()
+
+    def add_segment_listener(self, on_closed=None, on_deleted=None):
+        pass
+
+
+@pytest.fixture
+def service(tmp_path):
+    service = ThumbnailService(Recorder(str(tmp_path)), tile_width=16, timeline_columns=2)
+    for shade, filename in enumerate(['a.mp4', 'b.mp4', 'c.mp4']):
+        service.catalog.thumbnails[filename] = {'tile_width': 16, 'tile_height': 12, 'times': [0]}
+        cv2.imwrite(service.strip_path(filename), np.full((12, 32, 3), 60 * (shade + 1), np.uint8))
+    return service
+
+
+def segments(*filenames):
+    return [{'filename': filename} for filename in filenames]
+
+
+def test_timeline_tiles_segments_in_order(service):
+    etag, data, filenames = service.timeline(segments('a.mp4', 'b.mp4', 'c.mp4', 'none.mp4'))
+    assert filenames == ['a.mp4', 'b.mp4', 'c.mp4']
+    sheet = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    assert sheet.shape[:2] == (24, 32)
+    assert service.timeline(segments('a.mp4', 'b.mp4', 'c.mp4'))[0] == etag
+
+
+def test_unreadable_strip_is_left_out_of_etag_and_order(service):
+    complete = service.timeline(segments('a.mp4', 'c.mp4'))
+    with open(service.strip_path('b.mp4'), 'wb') as f:
+        f.write(b'not a jpeg')
+    etag, data, filenames = service.timeline(segments('a.mp4', 'b.mp4', 'c.mp4'))
+    assert filenames == ['a.mp4', 'c.mp4']
+    # Same tiles as a sheet that never asked for b.mp4, so the same ETag
+    assert etag == complete[0]
+    sheet = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    assert abs(int(sheet[6, 24, 0]) - 180) < 10
+
+
+def test_timeline_without_thumbnails(service):
+    assert service.timeline(segments('none.mp4')) == (None, None, [])
@@ -0,0 +1,182 @@
+import cv2
+import hashlib
+import numpy as np
+import os
+import queue
+import threading
+from collections import OrderedDict
+from logger import logger
+from metrics import metrics
+
+QUEUE_DEPTH = metrics.gauge('nvr_queue_depth', "Items waiting to be processed", ['queue', 'camera'])
+
+class ThumbnailService:
+    """Background generation of keyframe thumbnail strips for closed segments.
+
+    For every closed segment a horizontal strip of small JPEG tiles is written
+    to <storage_dir>/thumbnails/<segment>.jpg and the tile times are stored in
+    the recordings catalog. Only keyframes are decoded: the reader seeks to
+    each keyframe time from the catalog instead of decoding the whole file.
+    Day timelines are composed from the first tile of each strip and cached.
+    """
+
+    def __init__(self, video_recorder, tile_width=160, tile_interval=10, jpeg_quality=70,
+                 timeline_columns=20, timeline_cache_size=32):
+        self.video_recorder = video_recorder
+        self.catalog = video_recorder.catalog
+        self.thumbnail_dir = os.path.join(video_recorder.storage_dir, 'thumbnails')
+        self.tile_width = tile_width
+        self.tile_interval = tile_interval
+        self.jpeg_quality = jpeg_quality
+        self.timeline_columns = timeline_columns
+        self.timeline_cache_size = timeline_cache_size
+        self.timeline_cache = OrderedDict()
+        self.timeline_lock = threading.Lock()
+        self.queue = queue.Queue()
+        self.running = False
+        self.thread = None
+        QUEUE_DEPTH.add_function(lambda: {('thumbnails', ''): self.queue.qsize()})
+        os.makedirs(self.thumbnail_dir, exist_ok=True)
+        video_recorder.add_segment_listener(on_closed=self.enqueue, on_deleted=self._delete_strip)
+
+    def start(self):
+        """Start the worker thread and backfill segments that have no thumbnails"""
+        if self.running:
+            return
+        self.running = True
+        for segment in self.catalog.missing_thumbnails(limit=1000):
+            self.enqueue(segment)
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        logger.info("Started thumbnail service")
+
+    def stop(self):
+        """Stop the worker thread"""
+        self.running = False
+        self.queue.put(None)
+        if self.thread:
+            self.thread.join(timeout=5)
+
+    def enqueue(self, segment):
+        """Schedule thumbnail generation for a closed segment"""
+        self.queue.put(segment)
+
+    def strip_path(self, filename):
+        """Path of the thumbnail strip for a segment"""
+        return os.path.join(self.thumbnail_dir, filename[:-4] + '.jpg')
+
+    def _delete_strip(self, filename):
+        path = self.strip_path(filename)
+        if os.path.exists(path):
+            os.remove(path)
+
+    def _run(self):
+        while self.running:
+            segment = self.queue.get()
+            if segment is None:
+                break
+            try:
+                self.generate(segment)
+            except Exception as e:
+                logger.error(f"Error generating thumbnails for {segment['filename']}: {str(e)}")
+
+    def _tile_times(self, segment):
+        """Pick keyframe times at most one per tile_interval seconds"""
+        times = []
+        for time_offset, _ in segment.get('keyframes') or [[0, 0]]:
+            if not times or time_offset - times[-1] >= self.tile_interval:
+                times.append(time_offset)
+        return times
+
+    def generate(self, segment):
+        """Decode the selected keyframes of a segment and write its thumbnail strip"""
+        filepath = os.path.join(self.video_recorder.storage_dir, segment['filename'])
+        if not os.path.exists(filepath):
+            return
+
+        cap = cv2.VideoCapture(filepath)
+        tiles, times = [], []
+        tile_height = None
+        try:
+            for time_offset in self._tile_times(segment):
+                cap.set(cv2.CAP_PROP_POS_MSEC, time_offset * 1000)
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                if tile_height is None:
+                    height, width = frame.shape[:2]
+                    tile_height = max(int(self.tile_width * height / width) // 2 * 2, 2)
+                tiles.append(cv2.resize(frame, (self.tile_width, tile_height), interpolation=cv2.INTER_AREA))
+                times.append(time_offset)
+        finally:
+            cap.release()
+
+        if not tiles:
+            logger.warning(f"No frames decoded for thumbnails of {segment['filename']}")
+            return
+
+        strip = np.hstack(tiles)
+        ok, jpeg = cv2.imencode('.jpg', strip, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+        if not ok:
+            return
+        path = self.strip_path(segment['filename'])
+        temp_path = path + '.tmp'
+        with open(temp_path, 'wb') as f:
+            f.write(jpeg.tobytes())
+        os.replace(temp_path, path)
+        self.catalog.set_thumbnails(segment['filename'], self.tile_width, tile_height, times)
+
+    def timeline(self, segments):
+        """Return (etag, jpeg bytes, filenames) of a sprite sheet with the first tile of each segment.
+
+        filenames are the segments whose strips made it into the sheet, in
+        tile order; strips that cannot be read are left out. Sheets are
+        memoized by the list of segments they cover, so repeated timeline
+        requests for the same range cost nothing after the first.
+        """
+        thumbnails = self.catalog.get_thumbnails(s['filename'] for s in segments)
+        filenames = [s['filename'] for s in segments if s['filename'] in thumbnails]
+        if not filenames:
+            return None, None, []
+        key = hashlib.sha1('\n'.join(filenames).encode()).hexdigest()
+
+        with self.timeline_lock:
+            if key in self.timeline_cache:
+                self.timeline_cache.move_to_end(key)
+                return self.timeline_cache[key]
+
+        tiles = []
+        loaded = []
+        tile_size = None
+        for filename in filenames:
+            info = thumbnails[filename]
+            strip = cv2.imread(self.strip_path(filename))
+            if strip is None:
+                continue
+            tile = strip[:, :info['tile_width']]
+            if tile_size is None:
+                tile_size = (tile.shape[1], tile.shape[0])
+            elif (tile.shape[1], tile.shape[0]) != tile_size:
+                tile = cv2.resize(tile, tile_size, interpolation=cv2.INTER_AREA)
+            tiles.append(tile)
+            loaded.append(filename)
+        if not tiles:
+            return None, None, []
+
+        # Pad the last row so the sheet is a full grid
+        columns = min(self.timeline_columns, len(tiles))
+        blank = np.zeros_like(tiles[0])
+        tiles += [blank] * (-len(tiles) % columns)
+        rows = [np.hstack(tiles[i:i + columns]) for i in range(0, len(tiles), columns)]
+        ok, jpeg = cv2.imencode('.jpg', np.vstack(rows), [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+        if not ok:
+            return None, None, []
+        # The ETag names the tiles actually in the sheet, not the ones requested
+        etag = hashlib.sha1('\n'.join(loaded).encode()).hexdigest()
+        result = (etag, jpeg.tobytes(), loaded)
+
+        with self.timeline_lock:
+            self.timeline_cache[key] = result
+            while len(self.timeline_cache) > self.timeline_cache_size:
+                self.timeline_cache.popitem(last=False)
+        return result